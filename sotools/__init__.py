@@ -2,13 +2,22 @@
 Library analysis and manipulation helpers
 """
 
+import os
 from re import match
 from os.path import realpath
 from pathlib import Path
-from typing import Set
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 from logging import debug
 
 from sotools.libraryset import Library
+from sotools.profiling import profile  # noqa: F401
 
 
 def is_elf(path: Path) -> bool:
@@ -25,7 +34,79 @@ def is_elf(path: Path) -> bool:
     return magic == "\x7fELF".encode()
 
 
-def library_links(shared_object: Library) -> Set[Path]:
+class LinkIndex:
+    """
+    Entries of directories grouped by the file they lead to, listing and
+    stating the contents of each directory once
+
+    Share an instance between library_links calls to avoid listing the same
+    directory for every library it contains.
+    """
+
+    def __init__(self):
+        self._directories: Dict[str, Dict[Tuple[int, int], List[Path]]] = {}
+
+    def _index(self, directory: str) -> Dict[Tuple[int, int], List[Path]]:
+        if directory not in self._directories:
+            aliases = {}
+
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if '.so' not in entry.name:
+                            continue
+
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+
+                        aliases.setdefault((stat.st_dev, stat.st_ino),
+                                           []).append(Path(entry.path))
+            except OSError as err:
+                debug("LinkIndex: Failed to list %s: %s", directory, str(err))
+
+            self._directories[directory] = aliases
+
+        return self._directories[directory]
+
+    def aliases(self, directory: str, inode: Tuple[int, int]) -> List[Path]:
+        """
+        Entries of directory leading to the file with the given inode
+        """
+        return self._index(directory).get(inode, [])
+
+
+def _prefixed_aliases(directory: str, inode: Tuple[int, int],
+                      prefixes: Tuple[str, ...]) -> List[Path]:
+    """
+    Entries of directory starting with one of the prefixes and leading to
+    the file with the given inode; only those entries are stated, which is
+    cheaper than a LinkIndex for a single library
+    """
+    aliases = []
+
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.name.startswith(prefixes):
+                    continue
+
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+
+                if (stat.st_dev, stat.st_ino) == inode:
+                    aliases.append(Path(entry.path))
+    except OSError as err:
+        debug("library_links: Failed to list %s: %s", directory, str(err))
+
+    return aliases
+
+
+def library_links(shared_object: Library,
+                  index: Optional[LinkIndex] = None) -> Set[Path]:
     """
     This method resolves symbolic links that may exist and point to the
     library passed as an argument in the same directory as that library.
@@ -49,21 +130,33 @@ def library_links(shared_object: Library) -> Set[Path]:
         debug("library_links: Error in format of %s", libname)
         return {Path(shared_object.binary_path)}
 
-    cleared = set()
     prefix = libname.split('.so')[0]
     library_file = realpath(shared_object.binary_path)
 
-    def _glob_links(prefix_):
-        for file in list(Path(library_file).parent.glob(f"{prefix_}.so*")):
-            if realpath(file) == library_file:
-                cleared.add(file)
+    # Candidates are compared to the library by inode, available from the
+    # parse, instead of resolving the links of every one of them
+    inode = shared_object.inode
+    if inode is None:
+        stat = os.stat(library_file)
+        inode = (stat.st_dev, stat.st_ino)
 
-    _glob_links(prefix)
+    prefixes = [f"{prefix}.so"]
 
     # glib files are named as libc-2.33.so, but the links are named libc.so.x
     matches = match(r'(?P<prefix>lib[a-z_]+)-.+', prefix)
     if matches:
-        _glob_links(matches.group('prefix'))
+        prefixes.append(f"{matches.group('prefix')}.so")
+
+    directory = str(Path(library_file).parent)
+    if index is None:
+        aliases = _prefixed_aliases(directory, inode, tuple(prefixes))
+    else:
+        aliases = index.aliases(directory, inode)
+
+    cleared = {
+        path
+        for path in aliases if path.name.startswith(tuple(prefixes))
+    }
 
     # If we encounter a special case of symlink presenting as another library,
     # return the symlink and the shared object being pointed to.
@@ -72,3 +165,17 @@ def library_links(shared_object: Library) -> Set[Path]:
         cleared.add(Path(library_file))
 
     return cleared
+
+
+def library_set_links(libraries: Iterable[Library]) -> Dict[Library, Set[Path]]:
+    """
+    -> dict(Library: set(Path))
+    library_links for a whole set of libraries, listing every directory
+    involved once
+    """
+    index = LinkIndex()
+
+    return {
+        library: library_links(library, index)
+        for library in libraries if library.binary_path
+    }
@@ -0,0 +1,183 @@
+"""
+asyncio counterparts of the resolution functions
+
+The blocking work, filesystem probes and ELF parsing, runs in the default
+executor of the event loop, so that resolving libraries does not block it.
+Lookups and parses of independent libraries run concurrently, up to the
+amount of tasks allowed by a semaphore; share a semaphore between calls to
+bound the load on the filesystem across many closures:
+
+    limit = asyncio.Semaphore(32)
+    sets = await asyncio.gather(*(ldd(path, limit) for path in binaries))
+"""
+
+import asyncio
+from functools import partial
+from pathlib import Path
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from sotools.dl_cache.flags import Flags
+from sotools.ldd import _root
+from sotools.libraryset import Library, LibrarySet, _Resolution
+from sotools.linker import LinkingError
+from sotools.linker import resolve as _resolve
+
+# Concurrent blocking tasks allowed when no semaphore is given
+DEFAULT_CONCURRENCY = 16
+
+
+async def _run(semaphore: Optional[asyncio.Semaphore], function, *args,
+               **kwargs):
+    """
+    Run function in the default executor once the semaphore is acquired
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(DEFAULT_CONCURRENCY)
+
+    async with semaphore:
+        return await asyncio.get_event_loop().run_in_executor(
+            None, partial(function, *args, **kwargs))
+
+
+async def resolve(soname: str,
+                  rpath: Optional[List[str]] = None,
+                  runpath: Optional[List[str]] = None,
+                  arch_flags: Optional[Flags] = None,
+                  absolute: bool = False,
+                  hwcaps: Optional[Sequence[str]] = None,
+                  semaphore: Optional[asyncio.Semaphore] = None):
+    """
+    -> Path or None
+    See sotools.linker.resolve
+    """
+    return await _run(semaphore,
+                      _resolve,
+                      soname,
+                      rpath=rpath,
+                      runpath=runpath,
+                      arch_flags=arch_flags,
+                      absolute=absolute,
+                      hwcaps=hwcaps)
+
+
+async def from_path(path: Union[str, Path],
+                    semaphore: Optional[asyncio.Semaphore] = None) -> Library:
+    """
+    -> Library
+    See sotools.libraryset.Library.from_path
+    """
+    return await _run(semaphore, Library.from_path, path)
+
+
+async def resolve_set(libraries: LibrarySet,
+                      semaphore: Optional[asyncio.Semaphore] = None,
+                      lookup=None) -> LibrarySet:
+    """
+    -> LibrarySet, superset of libraries
+    See sotools.libraryset.LibrarySet.resolve
+
+    The resolution steps are the ones of LibrarySet.resolve, but all the
+    dependencies missing at a given step are looked up concurrently, then
+    the libraries found are parsed concurrently. lookup is the blocking
+    function looking sonames up (see LibrarySet._resolution).
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(DEFAULT_CONCURRENCY)
+
+    superset = LibrarySet(libraries)
+    state = await _run(semaphore, _Resolution, libraries, superset, lookup)
+
+    while state.running:
+        paths = await asyncio.gather(*(_run(semaphore, state.search, soname)
+                                       for soname in state.step()))
+
+        found = await asyncio.gather(*(from_path(path, semaphore)
+                                       for path in paths if path))
+
+        for library in found:
+            state.add(library)
+
+        state.end_step()
+
+    return superset
+
+
+async def resolve_architectures(
+        libraries: LibrarySet,
+        semaphore: Optional[asyncio.Semaphore] = None
+) -> Dict[Optional[int], LibrarySet]:
+    """
+    -> dict(Flags or None, LibrarySet)
+    See sotools.libraryset.LibrarySet.resolve_architectures
+
+    The architectures are resolved concurrently.
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(DEFAULT_CONCURRENCY)
+
+    groups = await _run(semaphore, libraries._architecture_lookups)
+    closures = await asyncio.gather(*(resolve_set(members, semaphore, lookup)
+                                      for _, members, lookup in groups))
+
+    return {
+        arch_flags: closure
+        for (arch_flags, _, _), closure in zip(groups, closures)
+    }
+
+
+async def create_from(
+        library_list: Iterable[Union[str, Path]],
+        semaphore: Optional[asyncio.Semaphore] = None) -> LibrarySet:
+    """
+    -> LibrarySet
+    See sotools.libraryset.LibrarySet.create_from
+
+    The elements are processed concurrently: sonames are looked up without
+    the RPATHs of the other elements of the list.
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(DEFAULT_CONCURRENCY)
+
+    async def _process(element):
+        if isinstance(element, Path):
+            path = element.as_posix()
+        elif isinstance(element, str):
+            if '/' in element:
+                path = Path(element).as_posix()
+            else:
+                path = await resolve(element, semaphore=semaphore)
+        else:
+            raise Exception(
+                f"Wrong type for LibrarySet.create_from: {type(element)}")
+
+        if not path:
+            raise LinkingError(element)
+
+        return await from_path(path, semaphore)
+
+    libraries = await asyncio.gather(*map(_process, library_list))
+    return await resolve_set(LibrarySet(libraries), semaphore)
+
+
+async def ldd(binary: Union[str, Path],
+              semaphore: Optional[asyncio.Semaphore] = None) -> LibrarySet:
+    """
+    -> LibrarySet
+    See sotools.ldd.ldd
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(DEFAULT_CONCURRENCY)
+
+    root = await _run(semaphore, _root, binary)
+
+    closure = await resolve_set(LibrarySet([root]), semaphore)
+    closure.discard(root)
+
+    return closure
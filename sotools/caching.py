@@ -0,0 +1,129 @@
+"""
+Thread-safe caching primitives
+
+The caches of the resolver are shared by all the threads of the process.
+SingleFlight makes concurrent requests for the same key wait for a single
+computation instead of all performing it, and memoize builds on it to replace
+functools.lru_cache, which lets every thread missing the cache compute the
+value.
+
+Cached values are shared between threads: they must not be modified, and are
+returned as immutable types where possible.
+"""
+
+import threading
+from collections import OrderedDict
+from functools import partial, wraps
+from typing import (
+    Callable,
+    Dict,
+    Hashable,
+    Optional,
+)
+
+
+class _Call:
+    """
+    Computation in progress, awaited by the other callers
+    """
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent computations by key: the first caller for a key
+    runs the function, the callers arriving before it completes wait and get
+    the same result, or exception
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, function: Callable, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+
+def memoize(function: Optional[Callable] = None,
+            maxsize: Optional[int] = None) -> Callable:
+    """
+    Cache the results of function by arguments, computing each once even when
+    threads call it concurrently. Exceptions are not cached. The cache is
+    emptied with the cache_clear attribute of the wrapper, as with
+    functools.lru_cache.
+
+    With maxsize, the least recently used results are dropped once maxsize
+    are cached; use as @memoize(maxsize=N).
+    """
+    if function is None:
+        return partial(memoize, maxsize=maxsize)
+
+    results: Dict[Hashable, object] = OrderedDict()
+    lock = threading.Lock()
+    flight = SingleFlight()
+
+    def _compute(key, args, kwargs):
+        # The previous leader may have completed between the lookup of the
+        # caller and its call to SingleFlight.do
+        if key in results:
+            return results[key]
+
+        value = function(*args, **kwargs)
+
+        with lock:
+            results[key] = value
+            if maxsize is not None and len(results) > maxsize:
+                results.popitem(last=False)
+
+        return value
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+
+        try:
+            value = results[key]
+        except KeyError:
+            return flight.do(key, _compute, key, args, kwargs)
+
+        if maxsize is not None:
+            with lock:
+                if key in results:
+                    results.move_to_end(key)
+
+        return value
+
+    def cache_clear():
+        with lock:
+            results.clear()
+
+    wrapper.cache_clear = cache_clear
+    return wrapper
@@ -0,0 +1,410 @@
+"""
+SQLite index of the libraries found across many directory trees
+
+The database records every dynamic ELF object found under the ingested roots
+(software prefixes, sysroots, container images) with its fingerprint, soname,
+symbol versions and DT_NEEDED entries, along with the entries of linker
+caches, so that questions spanning all of them are answered by indexed
+queries instead of rescanning and resolving:
+
+    with LibraryDatabase('libraries.db') as database:
+        database.ingest(['/opt/prefix-a', '/opt/prefix-b'], jobs=8)
+        database.libraries('libstdc++.so.*')
+        database.conflicts('libstdc++.so.*')
+
+Ingestion is incremental: files whose size and modification time did not
+change since they were last ingested are not parsed again, and the files that
+disappeared from an ingested root are removed. Parsing runs in a thread pool
+while the rows are written in large transactions.
+
+Dependencies are resolved at ingestion, with the RPATH and RUNPATH of the
+requesting object and the linker configuration of the host; edges record the
+canonical path of the object found.
+"""
+
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+from pathlib import Path
+
+from sotools.dl_cache import DynamicLinkerCache, _GLOB_CHARACTERS
+from sotools.elf import ElfObject, scan
+from sotools.libraryset import Library
+from sotools.linker import DirectoryIndex, resolve
+from sotools.util import bounded_map
+
+# Files parsed between two commits during ingestion
+BATCH_SIZE = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    root TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    interpreter TEXT
+);
+CREATE INDEX IF NOT EXISTS files_root ON files (root);
+
+CREATE TABLE IF NOT EXISTS libraries (
+    file_id INTEGER PRIMARY KEY REFERENCES files (id) ON DELETE CASCADE,
+    soname TEXT NOT NULL,
+    flags INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS libraries_soname ON libraries (soname);
+
+CREATE TABLE IF NOT EXISTS defined_versions (
+    file_id INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE,
+    version TEXT NOT NULL,
+    PRIMARY KEY (file_id, version)
+);
+CREATE INDEX IF NOT EXISTS defined_versions_version
+    ON defined_versions (version);
+
+CREATE TABLE IF NOT EXISTS required_versions (
+    file_id INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE,
+    soname TEXT NOT NULL,
+    version TEXT NOT NULL,
+    PRIMARY KEY (file_id, soname, version)
+);
+CREATE INDEX IF NOT EXISTS required_versions_soname
+    ON required_versions (soname);
+
+CREATE TABLE IF NOT EXISTS edges (
+    file_id INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    soname TEXT NOT NULL,
+    target TEXT,
+    PRIMARY KEY (file_id, position)
+);
+CREATE INDEX IF NOT EXISTS edges_soname ON edges (soname);
+CREATE INDEX IF NOT EXISTS edges_target ON edges (target);
+
+CREATE TABLE IF NOT EXISTS cache_entries (
+    cache TEXT NOT NULL,
+    soname TEXT NOT NULL,
+    path TEXT NOT NULL,
+    flags INTEGER NOT NULL,
+    hwcaps TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_entries_soname ON cache_entries (soname);
+CREATE INDEX IF NOT EXISTS cache_entries_cache ON cache_entries (cache);
+"""
+
+
+class IndexedLibrary(NamedTuple):
+    soname: str
+    path: str
+    root: str
+
+
+class CacheRow(NamedTuple):
+    cache: str
+    soname: str
+    path: str
+    flags: int
+    hwcaps: str
+
+
+class _Parsed(NamedTuple):
+    """
+    Rows of a file, without its id
+    """
+    file: Tuple
+    library: Tuple
+    defined: List[Tuple]
+    required: List[Tuple]
+    edges: List[Tuple]
+
+
+def _glob(pattern: str) -> str:
+    """
+    GLOB expression matching the sonames starting with pattern, or matching
+    it if it contains glob characters, as DynamicLinkerCache.query does
+    """
+    return pattern if _GLOB_CHARACTERS.search(pattern) else f"{pattern}*"
+
+
+class LibraryDatabase:
+    """
+    Connection to an index database, created if it does not exist
+    """
+
+    def __init__(self, path: Union[str, Path] = ':memory:'):
+        self.path = str(path)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _parse(self, elf: ElfObject, root: str, resolutions: Dict,
+               index: DirectoryIndex) -> _Parsed:
+        library = Library.from_elf(elf)
+        flags = library.arch_flags
+        edges = []
+
+        for position, soname in enumerate(library.needed):
+            key = (soname, tuple(library.rpath), tuple(library.runpath), flags)
+
+            if key not in resolutions:
+                target = resolve(soname,
+                                 rpath=library.rpath,
+                                 runpath=library.runpath,
+                                 arch_flags=flags,
+                                 index=index)
+                resolutions[key] = os.path.realpath(target) if target else None
+
+            edges.append((position, soname, resolutions[key]))
+
+        return _Parsed(
+            file=(elf.path, root, elf.stat.st_size, elf.stat.st_mtime_ns,
+                  elf.interpreter),
+            library=(library.soname, flags),
+            defined=[(version, ) for version in sorted(library.defined_versions)],
+            required=[(soname, version)
+                      for soname, versions in sorted(
+                          library.required_versions.items())
+                      for version in sorted(versions)],
+            edges=edges,
+        )
+
+    def _write(self, batch: List[_Parsed]):
+        """
+        Insert the rows of a batch of files in a single transaction
+        """
+        with self.connection:
+            # Ids assigned by SQLite hold against concurrent writers
+            ids = [
+                self.connection.execute(
+                    "INSERT INTO files (path, root, size, mtime_ns, "
+                    "interpreter) VALUES (?, ?, ?, ?, ?)",
+                    parsed.file).lastrowid for parsed in batch
+            ]
+
+            self.connection.executemany(
+                "INSERT INTO libraries VALUES (?, ?, ?)",
+                ((id_, *parsed.library) for id_, parsed in zip(ids, batch)))
+            self.connection.executemany(
+                "INSERT INTO defined_versions VALUES (?, ?)",
+                ((id_, *row) for id_, parsed in zip(ids, batch)
+                 for row in parsed.defined))
+            self.connection.executemany(
+                "INSERT INTO required_versions VALUES (?, ?, ?)",
+                ((id_, *row) for id_, parsed in zip(ids, batch)
+                 for row in parsed.required))
+            self.connection.executemany(
+                "INSERT INTO edges VALUES (?, ?, ?, ?)",
+                ((id_, *row) for id_, parsed in zip(ids, batch)
+                 for row in parsed.edges))
+
+    def ingest(self,
+               roots: Iterable[Union[str, Path]],
+               jobs: Optional[int] = None) -> int:
+        """
+        -> int
+        Index the dynamic ELF objects found under the given roots, and return
+        the amount of files parsed
+
+        Files already indexed, from any root, are parsed again only if their
+        fingerprint changed; indexed files no longer present under a root are
+        removed.
+        jobs is the amount of threads scanning and parsing files, None for
+        the ThreadPoolExecutor default; at most BATCH_SIZE files are parsed
+        ahead of the rows written, outside of the parse cache of Library.
+        """
+        parsed_files = 0
+        index = DirectoryIndex()
+        resolutions: Dict = {}
+
+        for root in map(os.path.realpath, roots):
+            # Files under the root, including the ones indexed from other,
+            # overlapping roots: a range of the path index
+            prefix = root.rstrip('/') + '/'
+            known = {
+                path: (id_, size, mtime_ns)
+                for path, id_, size, mtime_ns in self.connection.execute(
+                    "SELECT path, id, size, mtime_ns FROM files "
+                    "WHERE path = ? OR (path >= ? AND path < ?)",
+                    (root, prefix, prefix[:-1] + '0'))
+            }
+
+            seen = set()
+            changed = []
+
+            def _candidates() -> Iterator[ElfObject]:
+                # Objects are read once, with everything _parse needs
+                for elf in scan([root], jobs=jobs, versions=True):
+                    if not elf.has_dynamic:
+                        continue
+
+                    seen.add(elf.path)
+                    record = known.get(elf.path)
+
+                    if record is not None:
+                        if record[1:] == (elf.stat.st_size,
+                                          elf.stat.st_mtime_ns):
+                            continue
+                        changed.append((record[0], ))
+
+                    yield elf
+
+            batch = []
+
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                for parsed in bounded_map(
+                        executor,
+                        lambda elf: self._parse(elf, root, resolutions, index),
+                        _candidates(), BATCH_SIZE):
+                    batch.append(parsed)
+
+                    if len(batch) >= BATCH_SIZE:
+                        self._remove(changed)
+                        self._write(batch)
+                        parsed_files += len(batch)
+                        changed, batch = [], []
+
+            vanished = [(record[0], ) for path, record in known.items()
+                        if path not in seen]
+            self._remove(changed + vanished)
+            self._write(batch)
+            parsed_files += len(batch)
+
+        return parsed_files
+
+    def _remove(self, ids: List[Tuple[int]]):
+        with self.connection:
+            self.connection.executemany("DELETE FROM files WHERE id = ?", ids)
+
+    def ingest_cache(self, cache_file: str = "/etc/ld.so.cache") -> int:
+        """
+        -> int
+        Replace the recorded entries of the given linker cache with its
+        current contents, and return their amount
+        """
+        entries = DynamicLinkerCache.load(cache_file).entries
+
+        with self.connection:
+            self.connection.execute("DELETE FROM cache_entries WHERE cache = ?",
+                                    (cache_file, ))
+            self.connection.executemany(
+                "INSERT INTO cache_entries VALUES (?, ?, ?, ?, ?)",
+                ((cache_file, entry.key, entry.value, entry.flags,
+                  entry.hwcaps) for entry in entries))
+
+        return len(entries)
+
+    def libraries(self, pattern: str = '*') -> List[IndexedLibrary]:
+        """
+        -> list(IndexedLibrary)
+        Libraries whose soname starts with pattern, or matches it if it is a
+        glob pattern, sorted by soname and path
+        """
+        return [
+            IndexedLibrary(*row) for row in self.connection.execute(
+                "SELECT soname, path, root FROM libraries "
+                "JOIN files ON files.id = libraries.file_id "
+                "WHERE soname GLOB ? ORDER BY soname, path", (_glob(pattern), ))
+        ]
+
+    def requesters(self, soname: str) -> List[str]:
+        """
+        -> list(str)
+        Paths of the objects with a DT_NEEDED entry for soname
+        """
+        return [
+            path for path, in self.connection.execute(
+                "SELECT DISTINCT path FROM edges "
+                "JOIN files ON files.id = edges.file_id "
+                "WHERE edges.soname = ? ORDER BY path", (soname, ))
+        ]
+
+    def definers(self, version: str) -> List[IndexedLibrary]:
+        """
+        -> list(IndexedLibrary)
+        Libraries defining the given symbol version
+        """
+        return [
+            IndexedLibrary(*row) for row in self.connection.execute(
+                "SELECT soname, path, root FROM defined_versions "
+                "JOIN libraries USING (file_id) "
+                "JOIN files ON files.id = file_id "
+                "WHERE version = ? ORDER BY soname, path", (version, ))
+        ]
+
+    def unresolved(self) -> List[Tuple[str, str]]:
+        """
+        -> list((path, soname))
+        Dependencies that were not found when their requester was ingested
+        """
+        return list(
+            self.connection.execute(
+                "SELECT path, soname FROM edges "
+                "JOIN files ON files.id = edges.file_id "
+                "WHERE target IS NULL ORDER BY path, position"))
+
+    def cache_entries(self, pattern: str = '*') -> List[CacheRow]:
+        """
+        -> list(CacheRow)
+        Entries of the ingested caches whose soname starts with pattern, or
+        matches it if it is a glob pattern
+        """
+        return [
+            CacheRow(*row) for row in self.connection.execute(
+                "SELECT cache, soname, path, flags, hwcaps FROM cache_entries "
+                "WHERE soname GLOB ? ORDER BY soname, cache, path",
+                (_glob(pattern), ))
+        ]
+
+    def conflicts(self, pattern: str) -> Dict[str, List[str]]:
+        """
+        -> dict(str: list(str))
+        Executables whose dependency closure contains more than one object
+        with a soname starting with or matching pattern, e.g. two builds of
+        'libstdc++.so.6', mapped to the paths of these objects
+        """
+        rows = self.connection.execute(
+            """
+            WITH RECURSIVE closure (root, file) AS (
+                SELECT id, id FROM files WHERE interpreter IS NOT NULL
+                UNION
+                SELECT closure.root, target.id FROM closure
+                JOIN edges ON edges.file_id = closure.file
+                JOIN files AS target ON target.path = edges.target
+            )
+            SELECT executable.path, library.path FROM closure
+            JOIN libraries ON libraries.file_id = closure.file
+            JOIN files AS executable ON executable.id = closure.root
+            JOIN files AS library ON library.id = closure.file
+            WHERE libraries.soname GLOB ? AND closure.file != closure.root
+            ORDER BY executable.path, library.path
+            """, (_glob(pattern), ))
+
+        matches: Dict[str, List[str]] = {}
+        for executable, library in rows:
+            matches.setdefault(executable, []).append(library)
+
+        return {
+            executable: libraries
+            for executable, libraries in matches.items()
+            if len(libraries) > 1
+        }
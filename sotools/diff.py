@@ -0,0 +1,147 @@
+"""
+Comparison of library sets
+
+diff compares two resolved sets, typically the closures of a binary on the
+host and in a container, or in two releases of a software stack, using the
+soname indexes of both sets: every library is visited once.
+"""
+
+import operator
+from functools import reduce
+from typing import (
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from sotools.libraryset import VERSIONS, Library, LibrarySet
+
+
+class PathChange(NamedTuple):
+    soname: str
+    old: Optional[str]
+    new: Optional[str]
+
+
+class VersionChange(NamedTuple):
+    soname: str
+    added: Set[str]
+    removed: Set[str]
+
+
+class Requirement(NamedTuple):
+    requester: str
+    soname: str
+    versions: Set[str]
+
+
+class LibrarySetDiff(NamedTuple):
+    added: List[str]
+    removed: List[str]
+    path_changed: List[PathChange]
+    versions_changed: List[VersionChange]
+    unsatisfied: List[Requirement]
+
+    def __bool__(self):
+        return any(map(len, self))
+
+    def format(self) -> List[str]:
+        """
+        -> list(str)
+        One line per difference: '+' for added libraries, '-' for removed
+        ones, '~' for changes and '!' for new unsatisfied requirements
+        """
+        lines = [f"+ {soname}" for soname in self.added]
+        lines += [f"- {soname}" for soname in self.removed]
+        lines += [
+            f"~ {change.soname}: {change.old} => {change.new}"
+            for change in self.path_changed
+        ]
+
+        for change in self.versions_changed:
+            versions = [f"+{name}" for name in sorted(change.added)]
+            versions += [f"-{name}" for name in sorted(change.removed)]
+            lines.append(f"~ {change.soname}: {' '.join(versions)}")
+
+        lines += [
+            f"! {requirement.requester} requires {requirement.soname} "
+            f"{' '.join(sorted(requirement.versions))}"
+            for requirement in self.unsatisfied
+        ]
+
+        return lines
+
+
+def _defined(matches: List[Library]) -> int:
+    """
+    -> int
+    Bitset of the versions defined by any of the libraries of a soname
+    """
+    return reduce(operator.or_, (match.defined_mask for match in matches), 0)
+
+
+def _paths(matches: List[Library]) -> Optional[str]:
+    """
+    -> str or None
+    Sorted paths of the libraries of a soname, comma-separated
+    """
+    paths = sorted(filter(None, (match.binary_path for match in matches)))
+    return ', '.join(paths) if paths else None
+
+
+def _unsatisfied(libraries: LibrarySet) -> Dict[Tuple[str, str], int]:
+    """
+    -> dict((requester, soname): bitset of the versions not defined)
+    """
+    by_soname = libraries.index.by_soname
+    missing = {}
+
+    for library in libraries:
+        for soname, required in library.required_masks.items():
+            defined = _defined(by_soname.get(soname, []))
+            if required & ~defined:
+                missing[(library.soname, soname)] = required & ~defined
+
+    return missing
+
+
+def diff(old: LibrarySet, new: LibrarySet) -> LibrarySetDiff:
+    """
+    -> LibrarySetDiff
+    Compare two library sets, matching their libraries by soname
+    """
+    old_index = old.index.by_soname
+    new_index = new.index.by_soname
+
+    added = sorted(new_index.keys() - old_index.keys())
+    removed = sorted(old_index.keys() - new_index.keys())
+
+    path_changed = []
+    versions_changed = []
+
+    for soname in sorted(old_index.keys() & new_index.keys()):
+        before, after = old_index[soname], new_index[soname]
+
+        old_paths, new_paths = _paths(before), _paths(after)
+        if old_paths != new_paths:
+            path_changed.append(PathChange(soname, old_paths, new_paths))
+
+        old_mask, new_mask = _defined(before), _defined(after)
+        if old_mask != new_mask:
+            versions_changed.append(
+                VersionChange(soname, VERSIONS.decode(new_mask & ~old_mask),
+                              VERSIONS.decode(old_mask & ~new_mask)))
+
+    previously = _unsatisfied(old)
+    unsatisfied = []
+
+    for key, missing in sorted(_unsatisfied(new).items()):
+        missing &= ~previously.get(key, 0)
+        if missing:
+            unsatisfied.append(Requirement(*key, VERSIONS.decode(missing)))
+
+    return LibrarySetDiff(added, removed, path_changed, versions_changed,
+                          unsatisfied)
@@ -1,36 +1,58 @@
+import re
 import logging
-from typing import List, Dict, Optional
-from dataclasses import dataclass, field
-from functools import lru_cache
+from bisect import bisect_left
+from fnmatch import fnmatchcase
+from typing import List, Dict, Mapping, Optional, Sequence, Tuple
+from dataclasses import dataclass
+from time import perf_counter
+from types import MappingProxyType
+from sotools.caching import memoize
+from sotools.hwcaps import supported_hwcaps, priorities
+from sotools.profiling import PROFILER, CACHE_PARSED
 from sotools.dl_cache.flags import Flags
-from sotools.dl_cache.dl_cache import (_CacheHeader, _FileEntryNew)
-from sotools.dl_cache.structure import (BinaryStruct,
-                                        deserialize_null_terminated_string)
+from sotools.dl_cache.dl_cache import _CacheHeader
+from sotools.dl_cache.structure import BinaryStruct, string_at
 from sotools.dl_cache.extensions.hwcaps import (HWCAPSection,
-                                                dl_cache_hwcap_extension)
+                                                hwcap_extension_value)
 from sotools.dl_cache.extensions.generator import GeneratorSection
 from sotools.dl_cache.extensions import (cache_extension_sections,
                                          CacheExtensionTag)
 
 
-def get_generator(data: bytes) -> Optional[str]:
+# Indexes attached from shared memory, by cache file. Populated by
+# sotools.dl_cache.shared.SharedCacheIndex.install
+_SHARED_INDEXES: Dict[str, object] = {}
+
+_GLOB_CHARACTERS = re.compile(r'[*?[]')
+
+# Amount of parsed caches and of indexes kept in memory: one per cache file,
+# and per flags and hwcaps for the indexes
+PARSED_CACHES = 8
+CACHE_INDEXES = 32
+
+
+def _matching(keys: Sequence[str], pattern: str) -> List[int]:
     """
-    Return the generator string from cache data, if the cache is recent enough
-    to posess extensions
+    Indexes of the sorted keys starting with pattern or, if pattern contains
+    glob characters, matching it (see fnmatch). The range of keys starting
+    with the literal prefix of the pattern is located by bisection; only the
+    keys in that range are matched against a glob.
     """
-    header = _CacheHeader.deserialize(data)
-    data = data[header.offset:]
+    glob = _GLOB_CHARACTERS.search(pattern)
+    prefix = pattern[:glob.start()] if glob else pattern
 
-    if not header.extension_offset:
-        logging.debug("Failed to retrieve generator: no extensions in cache")
-        return None
+    # No soname contains the last code point: every key starting with the
+    # prefix sorts before the prefix followed by it
+    start = bisect_left(keys, prefix)
+    end = bisect_left(keys, prefix + chr(0x10ffff), start)
 
-    extensions = cache_extension_sections(data[header.extension_offset:])
+    if not glob:
+        return list(range(start, end))
 
-    for section in extensions:
-        if section.tag == CacheExtensionTag.TAG_GENERATOR:
-            return GeneratorSection(section).string_value(data)
-    return None
+    return [
+        index for index in range(start, end)
+        if fnmatchcase(keys[index], pattern)
+    ]
 
 
 @dataclass(frozen=True)
@@ -41,92 +63,282 @@ class ResolvedEntry:
     hwcaps: str = ""
 
 
-def _cache_libraries(data: bytes) -> List[ResolvedEntry]:
+class DynamicLinkerCache:
     """
-    Return a list of ResolvedEntry objects with all references resolved
+    Parsed dynamic linker cache
+
+    The header, entry table bounds and extension directory are read once when
+    the object is created; the entries and extension contents are decoded from
+    the same buffer on first access, then kept.
     """
-    header = _CacheHeader.deserialize(data)
-    data = data[header.offset:]
-    extensions = []
 
-    if header.extension_offset:
-        extensions = cache_extension_sections(data[header.extension_offset:])
+    def __init__(self, data: bytes, file: Optional[str] = None):
+        self.file = file
+        self.header = _CacheHeader.deserialize(data)
+        self.data = data[self.header.offset:]
 
-    def resolve_hwcap_values():
-        for extension in extensions:
-            if extension.tag == CacheExtensionTag.TAG_GLIBC_HWCAPS:
-                yield HWCAPSection(extension).string_value(data)
+        header_size = BinaryStruct.sizeof(self.header.__class__)
+        entry_type = self.header.__class__.entry_type
+        table_size = self.header.nlibs * BinaryStruct.sizeof(entry_type)
 
-    hwcap_string_values = list(resolve_hwcap_values())
+        if len(self.data) < header_size + table_size:
+            raise Exception(
+                f"Truncated cache: {self.header.nlibs} entries announced")
 
-    def _entries(data: bytes) -> list:
+        self._table = self.data[header_size:header_size + table_size]
+
+        self.extensions = {}
+        if getattr(self.header, 'extension_offset', 0):
+            for section in cache_extension_sections(
+                    self.data[self.header.extension_offset:]):
+                self.extensions.setdefault(section.tag, []).append(section)
+
+        self._entries = None
+        self._generator = None
+        self._hwcaps = None
+        self._sorted = None
+
+    @classmethod
+    def load(cls, cache_file: str = "/etc/ld.so.cache"):
         """
-        Generate a list of FileEntryXXX from the type defined in the header
+        -> DynamicLinkerCache
+        Read the given cache file and parse it. Raises OSError if the file
+        cannot be read, Exception if its contents are not a cache.
         """
-        header_size = BinaryStruct.sizeof(header.__class__)
-        entry_type = header.__class__.entry_type
-        entry_size = BinaryStruct.sizeof(entry_type)
+        with open(cache_file, 'rb') as file:
+            return cls(file.read(), file=cache_file)
 
-        for index in range(header.nlibs):
-            offset = header_size + index * entry_size
-            entry = entry_type.deserialize(data[offset:offset + entry_size])
-            yield entry
+    def extension(self, tag: int) -> List[bytes]:
+        """
+        Return the raw contents of the extension sections with the given tag
+        """
+        return [
+            self.data[section.offset:section.offset + section.size]
+            for section in self.extensions.get(tag, [])
+        ]
 
-    def _lookup(entry):
+    @property
+    def generator(self) -> Optional[str]:
         """
-        Translate string references to strings
+        The generator string, if the cache is recent enough to posess
+        extensions
         """
-        lookup = deserialize_null_terminated_string
-        hwcap_entry_string = ""
+        if self._generator is None:
+            for section in self.extensions.get(CacheExtensionTag.TAG_GENERATOR,
+                                               []):
+                self._generator = GeneratorSection(section).string_value(
+                    self.data)
+                break
 
-        if isinstance(entry,
-                      _FileEntryNew) and dl_cache_hwcap_extension(entry):
-            index = entry.hwcap & ((1 << 32) - 1)
-            if index < len(hwcap_string_values):
-                hwcap_entry_string = hwcap_string_values[index]
+        return self._generator
 
-        fields = dict(key=lookup(data[entry.key:]),
-                      value=lookup(data[entry.value:]),
-                      flags=entry.flags,
-                      hwcaps=hwcap_entry_string)
+    @property
+    def hwcaps(self) -> List[str]:
+        """
+        The glibc-hwcaps subdirectory names referenced by the entries
+        """
+        if self._hwcaps is None:
+            self._hwcaps = [
+                value for section in self.extensions.get(
+                    CacheExtensionTag.TAG_GLIBC_HWCAPS, [])
+                for value in HWCAPSection(section).string_values(self.data)
+            ]
 
-        return ResolvedEntry(**fields)
+        return self._hwcaps
 
-    return list(map(_lookup, _entries(data)))
+    @property
+    def entries(self) -> List[ResolvedEntry]:
+        """
+        The list of ResolvedEntry objects with all references resolved
+        """
+        if self._entries is None:
+            self._entries = list(self._resolve_entries())
 
+        return self._entries
 
-@dataclass(frozen=True)
-class DynamicLinkerCache:
-    file: str
-    generator: Optional[str] = None
-    entries: List[ResolvedEntry] = field(default_factory=list)
+    def query(self, pattern: str) -> List[ResolvedEntry]:
+        """
+        Return the entries whose soname starts with pattern, or matches it if
+        it is a glob pattern: 'libcuda' or 'libmpi.so.*'. Entries are sorted
+        by soname, entries with the same soname keep their order in the cache.
+
+        The entries are sorted once, on the first query.
+        """
+        if self._sorted is None:
+            # Entries and keys are published together, for concurrent queries
+            entries = sorted(self.entries, key=lambda entry: entry.key)
+            self._sorted = (entries, [entry.key for entry in entries])
+
+        entries, keys = self._sorted
+        return [entries[index] for index in _matching(keys, pattern)]
+
+    def _resolve_entries(self):
+        entry_type = self.header.__class__.entry_type
+        names = entry_type.fields()
+        flags_index, key_index, value_index = map(
+            names.index, ('flags', 'key', 'value'))
+        hwcap_index = names.index('hwcap') if 'hwcap' in names else None
+
+        hwcap_string_values = self.hwcaps
+        strings = {}
+
+        def lookup(offset: int) -> str:
+            if offset not in strings:
+                strings[offset] = string_at(self.data, offset)
+            return strings[offset]
+
+        for fields in entry_type.unpack_array(self._table, self.header.nlibs):
+            hwcap_entry_string = ""
+
+            if hwcap_index is not None and hwcap_extension_value(
+                    fields[hwcap_index]):
+                index = fields[hwcap_index] & ((1 << 32) - 1)
+                if index < len(hwcap_string_values):
+                    hwcap_entry_string = hwcap_string_values[index]
+
+            yield ResolvedEntry(key=lookup(fields[key_index]),
+                                value=lookup(fields[value_index]),
+                                flags=fields[flags_index],
+                                hwcaps=hwcap_entry_string)
+
+
+def get_generator(data: bytes) -> Optional[str]:
+    """
+    Return the generator string from cache data, if the cache is recent enough
+    to posess extensions
+    """
+    generator = DynamicLinkerCache(data).generator
+
+    if generator is None:
+        logging.debug("Failed to retrieve generator: no extensions in cache")
+
+    return generator
+
+
+def _cache_libraries(data: bytes) -> List[ResolvedEntry]:
+    """
+    Return a list of ResolvedEntry objects with all references resolved
+    """
+    return DynamicLinkerCache(data).entries
 
 
-@lru_cache()
+@memoize(maxsize=PARSED_CACHES)
 def _parse_cache(
         cache_file: str = "/etc/ld.so.cache") -> Optional[DynamicLinkerCache]:
+    start = perf_counter() if PROFILER.enabled else None
+
     try:
-        with open(cache_file, 'rb') as cache_file:
-            cache_data = cache_file.read()
+        cache = DynamicLinkerCache.load(cache_file)
+        if start is not None:
+            PROFILER.count(CACHE_PARSED)
+            PROFILER.time('cache parsing', perf_counter() - start)
+        return cache
     except OSError as err:
         logging.error("Failed to open rtld cache: %s", str(err))
-        return None
-
-    try:
-        entries = _cache_libraries(cache_data)
     except Exception as err:
         logging.error("rtdl cache parsing failed: %s", str(err))
-        return None
 
-    generator = get_generator(cache_data)
+    return None
+
+
+@memoize(maxsize=CACHE_INDEXES)
+def _cache_index(cache_file: str, arch_flags: int,
+                 hwcaps: Tuple[str, ...]) -> Mapping[str, str]:
+    """
+    Build a dictionary mapping every soname in the cache to the entry the
+    dynamic linker would pick for it, given the flags and the supported
+    glibc-hwcaps subdirectories, in decreasing order of priority. The index
+    is shared between threads and returned as a read-only mapping.
+
+    Mimics search_cache in glibc:/elf/dl-cache.c: entries from a supported
+    glibc-hwcaps subdirectory are preferred according to the subdirectory
+    priority, then the first legacy entry is used. Entries tied to an
+    unsupported subdirectory are ignored.
+    """
+    cache = _parse_cache(cache_file)
+
+    if cache is None:
+        return MappingProxyType({})
+
+    start = perf_counter() if PROFILER.enabled else None
+    ranks = priorities(hwcaps)
+    best = {}
+
+    for entry in cache.entries:
+        if entry.flags != arch_flags:
+            continue
 
-    fields = dict(file=cache_file, entries=entries, generator=generator)
+        priority = 0
+        if entry.hwcaps:
+            priority = ranks.get(entry.hwcaps, 0)
+            if not priority:
+                continue
 
-    return DynamicLinkerCache(**fields)
+        current = best.get(entry.key)
+        if current is None or priority > current[0]:
+            best[entry.key] = (priority, entry.value)
+
+    if start is not None:
+        PROFILER.time('cache indexing', perf_counter() - start)
+
+    index = {key: value for key, (_, value) in best.items()}
+    return MappingProxyType(index)
+
+
+@memoize(maxsize=CACHE_INDEXES)
+def _cache_keys(cache_file: str, arch_flags: int,
+                hwcaps: Tuple[str, ...]) -> Tuple[str, ...]:
+    """
+    Sorted sonames of the index built by _cache_index
+    """
+    return tuple(sorted(_cache_index(cache_file, arch_flags, hwcaps)))
+
+
+@memoize
+def _default_flags() -> Optional[int]:
+    """
+    Flags expected for the running interpreter. Flags.expected_flags may
+    spawn a process, so it is only called once.
+    """
+    return Flags.expected_flags()
+
+
+def clear_caches():
+    """
+    Forget the caches parsed and indexed so far. They are otherwise kept
+    until evicted by more recently used ones: call this function for changes
+    made to a cache file since it was first read to be seen.
+    """
+    _parse_cache.cache_clear()
+    _cache_index.cache_clear()
+    _cache_keys.cache_clear()
+
+
+def _parameters(arch_flags: Optional[int],
+                hwcaps: Optional[Sequence[str]]) -> Tuple[int, Tuple[str, ...]]:
+    """
+    Fill in the defaults of the index parameters
+    """
+    if arch_flags is None:
+        arch_flags = _default_flags()
+
+    if hwcaps is None:
+        hwcaps = supported_hwcaps()
+
+    return arch_flags, tuple(hwcaps)
+
+
+def _index(cache_file: str, arch_flags: Optional[int],
+           hwcaps: Optional[Sequence[str]]) -> Mapping[str, str]:
+    """
+    Fill in the defaults and access the index for the given parameters
+    """
+    return _cache_index(cache_file, *_parameters(arch_flags, hwcaps))
 
 
 def cache_libraries(cache_file: str = "/etc/ld.so.cache",
-                    arch_flags: Optional[int] = None) -> Dict[str, str]:
+                    arch_flags: Optional[int] = None,
+                    hwcaps: Optional[Sequence[str]] = None) -> Dict[str, str]:
     """
     Returns a dictionary with a curated list of the given cache file contents
     (/etc/ld.so.cache by default)
@@ -135,6 +347,8 @@ def cache_libraries(cache_file: str = "/etc/ld.so.cache",
     flags: flag value to look for. A null value will return binaries matching
         the interpreter, a non-null value will be used to filter out mismatching
         entries. See Flags.expected_flags to create flag values
+    hwcaps: glibc-hwcaps subdirectories to consider, most preferred first. A
+        null value will use the subdirectories supported by the current CPU
 
     Can be used to assume what libraries are installed on the system and where
     The keys are libraries' sonames; the values are the paths at which the
@@ -147,27 +361,17 @@ def cache_libraries(cache_file: str = "/etc/ld.so.cache",
 
     See _cache_libraries for finer-grain control over the cache's contents
     """
+    shared = _SHARED_INDEXES.get(cache_file)
+    if shared is not None and shared.serves(hwcaps):
+        return dict(shared.items(arch_flags))
 
-    _arch_flags = arch_flags
-    if _arch_flags is None:
-        _arch_flags = Flags.expected_flags()
-
-    cache = _parse_cache(cache_file)
-
-    libs = cache.entries
-    libs.reverse()
-
-    def _generate_values():
-        for entry in libs:
-            if entry.flags == _arch_flags:
-                yield (entry.key, entry.value)
-
-    return dict(_generate_values())
+    return dict(_index(cache_file, arch_flags, hwcaps))
 
 
 def search_cache(soname: str,
                  cache_file: str = "/etc/ld.so.cache",
-                 arch_flags: Optional[int] = None) -> Optional[str]:
+                 arch_flags: Optional[int] = None,
+                 hwcaps: Optional[Sequence[str]] = None) -> Optional[str]:
     """
     Returns the best match for the given soname in the given cache matching
     the given flags
@@ -177,17 +381,36 @@ def search_cache(soname: str,
     flags:  flag value to look for. A null value will return binaries matching
         the interpreter, a non-null value will be used to filter out mismatching
         entries. See Flags.expected_flags to create flag values
+    hwcaps: glibc-hwcaps subdirectories to consider, most preferred first. A
+        null value will use the subdirectories supported by the current CPU
     """
+    shared = _SHARED_INDEXES.get(cache_file)
+    if shared is not None and shared.serves(hwcaps):
+        return shared.lookup(soname, arch_flags)
 
-    _arch_flags = arch_flags
-    if _arch_flags is None:
-        _arch_flags = Flags.expected_flags()
+    return _index(cache_file, arch_flags, hwcaps).get(soname)
 
-    cache = _parse_cache(cache_file)
 
-    for entry in cache.entries:
-        # TODO hwcaps check, OS ABI check
-        if entry.key == soname and entry.flags == _arch_flags:
-            return entry.value
+def query_cache(pattern: str,
+                cache_file: str = "/etc/ld.so.cache",
+                arch_flags: Optional[int] = None,
+                hwcaps: Optional[Sequence[str]] = None) -> Dict[str, str]:
+    """
+    Returns the sonames of the given cache starting with pattern, or matching
+    it if it is a glob pattern, mapped to their best match as returned by
+    search_cache; e.g. query_cache('libcuda') or query_cache('libmpi.so.*')
 
-    return None
+    The sorted sonames are kept along with the index of the cache, so that
+    queries are bisections instead of scans. See search_cache for the
+    arguments.
+    """
+    shared = _SHARED_INDEXES.get(cache_file)
+    if shared is not None and shared.serves(hwcaps):
+        keys, values = shared.sorted_items(arch_flags)
+        return {keys[i]: values[i] for i in _matching(keys, pattern)}
+
+    parameters = _parameters(arch_flags, hwcaps)
+    index = _cache_index(cache_file, *parameters)
+    keys = _cache_keys(cache_file, *parameters)
+
+    return {keys[i]: index[keys[i]] for i in _matching(keys, pattern)}
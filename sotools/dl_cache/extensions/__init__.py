@@ -8,6 +8,8 @@ class CacheExtensionTag:
     TAG_GENERATOR = 0
     TAG_GLIBC_HWCAPS = 1
     COUNT = 2
+    # Private to sotools, ignored by glibc: see extensions.stamps
+    TAG_SOTOOLS_STAMPS = 0x534f0001
 
 
 class CacheExtensionSection(BinaryStruct):
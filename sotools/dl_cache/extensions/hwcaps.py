@@ -1,7 +1,8 @@
 import struct
 import logging
 from sotools.dl_cache.structure import (DATATYPES,
-                                        deserialize_null_terminated_string)
+                                        deserialize_null_terminated_string,
+                                        string_at)
 from sotools.dl_cache.extensions import CacheExtensionSection
 
 # This bit in the hwcap field of struct file_entry_new indicates that
@@ -25,6 +26,13 @@ def dl_cache_hwcap_extension(entry):
     if hwcap_field is None:
         return False
 
+    return hwcap_extension_value(hwcap_field)
+
+
+def hwcap_extension_value(hwcap_field: int) -> bool:
+    """
+    Check if a raw hwcap field value references the hwcaps extension
+    """
     return ((hwcap_field >> 32) & ~DL_CACHE_HWCAP_ISA_LEVEL_MASK) == (
         DL_CACHE_HWCAP_EXTENSION >> 32)
 
@@ -54,3 +62,21 @@ class HWCAPSection(CacheExtensionSection):
             return ""
 
         return deserialize_null_terminated_string(data[hwcap_pointer:])
+
+    def string_values(self, data):
+        """
+        The section is an array of string table offsets, one per
+        subdirectory name referenced by the cache entries
+        """
+        hwcap_data = data[self.offset:self.offset + self.size]
+        count = len(hwcap_data) // 4
+
+        try:
+            hwcap_pointers = struct.unpack(f"<{count}I",
+                                           hwcap_data[:count * 4])
+        except struct.error as err:
+            logging.error("Failed to retrieve hwcap string values: %s",
+                          str(err))
+            return []
+
+        return [string_at(data, pointer) for pointer in hwcap_pointers]
@@ -0,0 +1,66 @@
+"""
+File stamps of the cache entries
+
+Caches written by sotools record, for the path of every entry, the identity
+and change times of the file it points to. An incremental scan reuses an
+entry only if its file still has the same stamp, which catches files
+replaced with their modification time preserved, as cp -p or tar do: their
+change time cannot be set.
+"""
+
+import os
+import struct
+import logging
+from typing import Dict, Tuple
+
+# st_dev, st_ino, st_size, st_mtime_ns, st_ctime_ns
+Stamp = Tuple[int, int, int, int, int]
+
+# Stamp, then the length of the path following the record
+_RECORD = struct.Struct('<QQQqqH')
+
+
+def stamp(info: os.stat_result) -> Stamp:
+    """
+    -> (int, int, int, int, int)
+    The stamp of a file, from the result of stat
+    """
+    return (info.st_dev, info.st_ino, info.st_size, info.st_mtime_ns,
+            info.st_ctime_ns)
+
+
+def serialize_stamps(stamps: Dict[str, Stamp]) -> bytes:
+    """
+    Return the contents of the stamps section for the given paths
+    """
+    data = bytearray()
+
+    for path, value in sorted(stamps.items()):
+        encoded = path.encode()
+        data.extend(_RECORD.pack(*value, len(encoded)))
+        data.extend(encoded)
+
+    return bytes(data)
+
+
+def parse_stamps(data: bytes) -> Dict[str, Stamp]:
+    """
+    Return the stamps recorded in a section, by path; a truncated section
+    yields the records before the damage
+    """
+    stamps: Dict[str, Stamp] = {}
+    offset = 0
+
+    while offset + _RECORD.size <= len(data):
+        *value, length = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+
+        if offset + length > len(data):
+            logging.debug("Truncated stamps section")
+            break
+
+        path = bytes(data[offset:offset + length]).decode(errors='replace')
+        stamps[path] = tuple(value)
+        offset += length
+
+    return stamps
@@ -1,5 +1,17 @@
 import sys
 import platform
+from sotools.elf import (
+    ELFCLASS64,
+    EM_AARCH64,
+    EM_ARM,
+    EM_IA_64,
+    EM_PPC64,
+    EM_RISCV,
+    EM_S390,
+    EM_SPARC,
+    EM_SPARCV9,
+    EM_X86_64,
+)
 
 
 class Flags:
@@ -53,6 +65,38 @@ class Flags:
         FLAG_RISCV_FLOAT_ABI_DOUBLE: "double-float",
     }
 
+    # Architecture names, as output by uname -m, and the required flags of
+    # their libraries
+    _architectures = {
+        'x86_64': FLAG_X8664_LIB64,
+        'x32': FLAG_X8664_LIBX32,
+        'i386': 0,
+        'i686': 0,
+        'aarch64': FLAG_AARCH64_LIB64,
+        'ppc64le': FLAG_POWERPC_LIB64,
+        'ppc64': FLAG_POWERPC_LIB64,
+        's390x': FLAG_S390_LIB64,
+        'sparc64': FLAG_SPARC_LIB64,
+        'ia64': FLAG_IA64_LIB64,
+        'armhf': FLAG_ARM_LIBHF,
+        'armel': FLAG_ARM_LIBSF,
+        'riscv64': FLAG_RISCV_FLOAT_ABI_DOUBLE,
+    }
+
+    @classmethod
+    def architectures(cls):
+        return sorted(cls._architectures)
+
+    @classmethod
+    def from_name(cls, name: str):
+        """
+        Returns the flag value of the libc6 libraries of the architecture with
+        the given name (see Flags.architectures), or None if unknown
+        """
+        if name not in cls._architectures:
+            return None
+        return cls._architectures[name] | cls.FLAG_ELF_LIBC6
+
     @classmethod
     def description(cls, value: int):
         return ",".join([
@@ -74,6 +118,44 @@ class Flags:
             cls.FLAG_MIPS64_LIBN64_NAN2008,
         }
 
+    @classmethod
+    def from_machine(cls, elf_class: int, machine: int, e_flags: int = 0):
+        """
+        Returns the flag value ldconfig would record in the cache for an ELF
+        object of the given class (see sotools.elf), machine and
+        processor-specific flags
+        Found in glibc:/sysdeps/unix/sysv/linux/<ARCH>/readelflib.c
+        """
+        is_64 = elf_class == ELFCLASS64
+        required = 0
+
+        if machine == EM_X86_64:
+            required = cls.FLAG_X8664_LIB64 if is_64 else cls.FLAG_X8664_LIBX32
+        elif machine == EM_AARCH64 and is_64:
+            required = cls.FLAG_AARCH64_LIB64
+        elif machine == EM_PPC64 and is_64:
+            required = cls.FLAG_POWERPC_LIB64
+        elif machine == EM_S390 and is_64:
+            required = cls.FLAG_S390_LIB64
+        elif machine in {EM_SPARC, EM_SPARCV9} and is_64:
+            required = cls.FLAG_SPARC_LIB64
+        elif machine == EM_IA_64:
+            required = cls.FLAG_IA64_LIB64
+        elif machine == EM_ARM:
+            # EF_ARM_ABI_FLOAT_HARD and EF_ARM_ABI_FLOAT_SOFT
+            if e_flags & 0x400:
+                required = cls.FLAG_ARM_LIBHF
+            elif e_flags & 0x200:
+                required = cls.FLAG_ARM_LIBSF
+        elif machine == EM_RISCV and is_64:
+            # EF_RISCV_FLOAT_ABI_DOUBLE within EF_RISCV_FLOAT_ABI
+            if e_flags & 0x6 == 0x4:
+                required = cls.FLAG_RISCV_FLOAT_ABI_DOUBLE
+            elif e_flags & 0x6 == 0x0:
+                required = cls.FLAG_RISCV_FLOAT_ABI_SOFT
+
+        return required | cls.FLAG_ELF_LIBC6
+
     @classmethod
     def expected_flags(cls, executable: str = sys.executable):
         """
@@ -0,0 +1,373 @@
+"""
+Publication of a resolved cache index in shared memory
+
+A process parses the cache once and publishes, for every flag value, the
+entry the dynamic linker would pick for each soname. Other processes attach
+to the segment read-only and query it in place, without parsing the cache or
+holding a copy of its entries.
+
+The segment holds an open-addressing hash table of fixed-size slots,
+followed by the strings they reference:
+
+    header | slots | strings
+
+Keys are hashed with CRC32, which is stable across processes, unlike the
+builtin hash().
+"""
+
+import os
+import mmap
+import struct
+import zlib
+import logging
+from typing import (
+    Dict,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from sotools.hwcaps import supported_hwcaps
+from sotools.dl_cache import (
+    _SHARED_INDEXES,
+    _cache_index,
+    _default_flags,
+    _parse_cache,
+)
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+MAGIC = "sotools-index-1".encode()
+
+# Directory of the POSIX shared memory segments, on Linux
+SHM_DIRECTORY = "/dev/shm"
+
+# Names of the segments published by this process, or the process it was
+# forked from, with the process id of their resource tracker
+_PUBLISHED: Dict[str, Optional[int]] = {}
+
+# magic, slot count, entry count, strings offset, cache file and hwcaps
+# descriptions as (offset, length) in the string area
+_HEADER = struct.Struct(f'<{len(MAGIC)}sxIIIIIII')
+
+# hash, flags, key offset, key length, value offset, value length
+_SLOT = struct.Struct('<IiIIII')
+
+
+def _hash(key: bytes, flags: int) -> int:
+    return zlib.crc32(key, flags & 0xffffffff)
+
+
+def _serialize(cache_file: str, hwcaps: Tuple[str, ...]) -> bytes:
+    """
+    Build the index of all the flags present in the cache
+    """
+    cache = _parse_cache(cache_file)
+    entries = cache.entries if cache is not None else []
+    flags_values = sorted({entry.flags for entry in entries})
+
+    resolved = [(flags, key.encode(), value.encode())
+                for flags in flags_values for key, value in _cache_index(
+                    cache_file, flags, hwcaps).items()]
+
+    slot_count = 1
+    while slot_count < 2 * len(resolved):
+        slot_count *= 2
+
+    strings = bytearray()
+    offsets: Dict[bytes, int] = {}
+
+    def _string(value: bytes) -> Tuple[int, int]:
+        if value not in offsets:
+            offsets[value] = len(strings)
+            strings.extend(value)
+        return offsets[value], len(value)
+
+    slots = [None] * slot_count
+    for flags, key, value in resolved:
+        position = _hash(key, flags) & (slot_count - 1)
+        while slots[position] is not None:
+            position = (position + 1) & (slot_count - 1)
+        slots[position] = (_hash(key, flags), flags, *_string(key),
+                           *_string(value))
+
+    cache_string = _string(cache_file.encode())
+    hwcaps_string = _string(':'.join(hwcaps).encode())
+
+    strings_offset = _HEADER.size + slot_count * _SLOT.size
+    data = bytearray(
+        _HEADER.pack(MAGIC, slot_count, len(resolved), strings_offset,
+                     *cache_string, *hwcaps_string))
+
+    for slot in slots:
+        data.extend(_SLOT.pack(*(slot or (0, 0, 0, 0, 0, 0))))
+
+    data.extend(strings)
+    return bytes(data)
+
+
+class SharedCacheIndex:
+    """
+    Read-only view of a published cache index
+
+    Use SharedCacheIndex.publish in the parent process, then
+    SharedCacheIndex.attach with the resulting name (or path) in workers.
+    Calling install on an attached index makes sotools.dl_cache.search_cache,
+    and by extension sotools.linker.resolve, use it.
+    """
+
+    def __init__(self,
+                 buffer,
+                 handle=None,
+                 owner: bool = False,
+                 path: Optional[str] = None,
+                 name: Optional[str] = None):
+        self._handle = handle
+        self._owner = owner
+        self._path = path
+        self._name = name or getattr(handle, 'name', None)
+        self._view = memoryview(buffer)
+        # Sonames and paths sorted by soname, by flags
+        self._sorted: Dict[int, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {}
+
+        (magic, self._slot_count, self._count, self._strings, *strings) = \
+            _HEADER.unpack_from(self._view)
+
+        if magic != MAGIC:
+            self._view.release()
+            raise Exception("Data does not match a shared cache index")
+
+        self.cache_file = self._string(strings[0], strings[1])
+        self.hwcaps = tuple(filter(None,
+                                   self._string(strings[2],
+                                                strings[3]).split(':')))
+
+    @classmethod
+    def publish(cls,
+                cache_file: str = "/etc/ld.so.cache",
+                name: Optional[str] = None,
+                path: Optional[str] = None,
+                hwcaps: Optional[Sequence[str]] = None):
+        """
+        -> SharedCacheIndex
+        Parse the cache and publish its index, in a shared memory segment or,
+        if path is given, in a file to be memory-mapped by the readers.
+        The returned object owns the segment; call unlink when done.
+        """
+        if hwcaps is None:
+            hwcaps = supported_hwcaps()
+
+        data = _serialize(cache_file, tuple(hwcaps))
+
+        if path is not None:
+            with open(path, 'wb') as file:
+                file.write(data)
+            index = cls.attach(path=path)
+            index._owner = True
+            return index
+
+        if shared_memory is None:
+            raise NotImplementedError(
+                "Shared memory segments require python 3.8; use path instead")
+
+        segment = shared_memory.SharedMemory(name=name,
+                                             create=True,
+                                             size=len(data))
+        segment.buf[:len(data)] = data
+        _PUBLISHED[segment.name] = _tracker_pid()
+
+        return cls(segment.buf, handle=segment, owner=True)
+
+    @classmethod
+    def attach(cls, name: Optional[str] = None, path: Optional[str] = None):
+        """
+        -> SharedCacheIndex
+        Attach to an index published under the given shared memory name or
+        at the given path
+        """
+        if path is not None:
+            with open(path, 'rb') as file:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            return cls(mapped, handle=mapped, path=path)
+
+        # Segments are files of /dev/shm on Linux: mapping them directly
+        # keeps readers away from the resource tracker
+        location = os.path.join(SHM_DIRECTORY, name.lstrip('/'))
+        if os.path.isdir(SHM_DIRECTORY) and os.path.isfile(location):
+            with open(location, 'rb') as file:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            return cls(mapped, handle=mapped, name=name)
+
+        if shared_memory is None:
+            raise NotImplementedError(
+                "Shared memory segments require python 3.8; use path instead")
+
+        segment = shared_memory.SharedMemory(name=name)
+        _untrack(segment)
+
+        return cls(segment.buf, handle=segment)
+
+    @property
+    def name(self) -> Optional[str]:
+        """
+        Name to pass to attach in other processes
+        """
+        return self._name
+
+    def __len__(self):
+        return self._count
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._strings + offset
+        return str(self._view[start:start + length], 'utf-8')
+
+    def lookup(self, soname: str, arch_flags: Optional[int] = None) -> Optional[str]:
+        """
+        Return the path the dynamic linker would pick for soname, or None
+        """
+        if arch_flags is None:
+            arch_flags = _default_flags()
+
+        key = soname.encode()
+        digest = _hash(key, arch_flags)
+        mask = self._slot_count - 1
+        position = digest & mask
+
+        while True:
+            (slot_hash, flags, key_offset, key_length, value_offset,
+             value_length) = _SLOT.unpack_from(
+                 self._view, _HEADER.size + position * _SLOT.size)
+
+            if not key_length:
+                return None
+
+            start = self._strings + key_offset
+            if (slot_hash == digest and flags == arch_flags
+                    and self._view[start:start + key_length] == key):
+                return self._string(value_offset, value_length)
+
+            position = (position + 1) & mask
+
+    def items(self, arch_flags: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+        """
+        Generate the (soname, path) pairs published for the given flags
+        """
+        if arch_flags is None:
+            arch_flags = _default_flags()
+
+        for position in range(self._slot_count):
+            (_, flags, key_offset, key_length, value_offset,
+             value_length) = _SLOT.unpack_from(
+                 self._view, _HEADER.size + position * _SLOT.size)
+
+            if key_length and flags == arch_flags:
+                yield (self._string(key_offset, key_length),
+                       self._string(value_offset, value_length))
+
+    def sorted_items(
+            self,
+            arch_flags: Optional[int] = None
+    ) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        """
+        -> (sonames, paths)
+        The items published for the given flags, sorted by soname; sorted
+        once per flag value, as the index does not change
+        """
+        if arch_flags is None:
+            arch_flags = _default_flags()
+
+        if arch_flags not in self._sorted:
+            items = sorted(self.items(arch_flags))
+            self._sorted[arch_flags] = (tuple(key for key, _ in items),
+                                        tuple(value for _, value in items))
+
+        return self._sorted[arch_flags]
+
+    def serves(self, hwcaps: Optional[Sequence[str]]) -> bool:
+        """
+        Check the index was built for the given hwcaps subdirectories
+        """
+        if hwcaps is None:
+            hwcaps = supported_hwcaps()
+
+        return tuple(hwcaps) == self.hwcaps
+
+    def install(self):
+        """
+        Use this index for lookups in the cache it was built from
+        """
+        _SHARED_INDEXES[self.cache_file] = self
+        return self
+
+    def close(self):
+        """
+        Detach from the index. The segment remains available to others.
+        """
+        if _SHARED_INDEXES.get(self.cache_file) is self:
+            del _SHARED_INDEXES[self.cache_file]
+
+        self._view.release()
+        if self._handle is not None:
+            self._handle.close()
+
+    def unlink(self):
+        """
+        Detach from and destroy the published index; only the publisher
+        should call this
+        """
+        handle = self._handle
+        self.close()
+
+        if not self._owner:
+            return
+
+        if self._path is not None:
+            os.unlink(self._path)
+        elif hasattr(handle, 'unlink'):
+            _PUBLISHED.pop(handle.name, None)
+            handle.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if self._owner:
+            self.unlink()
+        else:
+            self.close()
+
+
+def _tracker_pid() -> Optional[int]:
+    """
+    Process id of the resource tracker of this process, if it runs
+    """
+    try:
+        from multiprocessing import resource_tracker
+        return getattr(resource_tracker._resource_tracker, '_pid', None)
+    except ImportError:
+        return None
+
+
+def _untrack(segment):
+    """
+    Readers must not destroy the segment when they exit: prevent the
+    resource tracker from unlinking it (fixed upstream in python 3.13)
+
+    The tracker of the publisher, shared by its forked children, is left
+    alone: it unlinks the segment if the publisher dies.
+    """
+    if segment.name in _PUBLISHED and _PUBLISHED[
+            segment.name] == _tracker_pid():
+        return
+
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(getattr(segment, '_name', segment.name),
+                                    'shared_memory')
+    except Exception as err:
+        logging.debug("Failed to unregister shared memory segment: %s",
+                      str(err))
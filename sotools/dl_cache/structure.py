@@ -44,6 +44,59 @@ class BinaryStruct:
 
         return struct_size
 
+    def format(cls) -> str:
+        """
+        Return the struct format string matching the class' __structure__,
+        used to unpack arrays of structures in one call
+        """
+        structure = getattr(cls, '__structure__', None)
+
+        if structure is None:
+            raise NotImplementedError(
+                "Attempting to access format of class with no __structure__"
+                f" field ({cls.__name__})")
+
+        def _fields():
+            for (attribute, type_) in structure:
+                if attribute is None:
+                    if isinstance(type_, int):
+                        yield f"{type_}x"
+                    continue
+
+                _, format_, _ = DATATYPES.get(type_)
+                yield format_
+
+        padding = BinaryStruct.sizeof(cls) - struct.calcsize(
+            '<' + ''.join(_fields()))
+        return '<' + ''.join(_fields()) + (f"{padding}x" if padding > 0 else "")
+
+    @classmethod
+    def unpack_array(cls, data: bytes, count: int):
+        """
+        Deserialize an array of count structures from data in a single pass
+        and yield tuples of the named fields' values
+        """
+        layout = struct.Struct(BinaryStruct.format(cls))
+        size = layout.size * count
+
+        if len(data) < size:
+            raise Exception(
+                f"Error deserializing {count} {cls.__name__} objects: buffer"
+                f" too short ({len(data)} < {size})")
+
+        return layout.iter_unpack(data[:size])
+
+    @classmethod
+    def fields(cls):
+        """
+        Return the names of the attributes defined in __structure__, in
+        order
+        """
+        return [
+            attribute for (attribute, _) in cls.__structure__
+            if attribute is not None
+        ]
+
     def __init__(self):
         for (attribute, type_) in self.__class__.__structure__:
             if attribute is None:
@@ -87,6 +140,16 @@ class BinaryStruct:
 
         return entry
 
+    def serialize(self) -> bytes:
+        """
+        Pack the attributes defined in __structure__ into bytes, padding
+        included
+        """
+        return struct.pack(
+            BinaryStruct.format(self.__class__),
+            *(getattr(self, attribute)
+              for attribute in self.__class__.fields()))
+
     def __repr__(self):
 
         def _format_attributes():
@@ -105,3 +168,17 @@ def deserialize_null_terminated_string(data: bytes):
         return ""
 
     return data[:terminator].decode(errors='replace')
+
+
+def string_at(data: bytes, offset: int) -> str:
+    """
+    Decode the null terminated string starting at offset in data, without
+    copying the rest of the buffer
+    """
+    terminator = data.find(0x0, offset)
+
+    if terminator == -1:
+        logging.debug("Failed to find null byte in buffer")
+        return ""
+
+    return data[offset:terminator].decode(errors='replace')
@@ -0,0 +1,607 @@
+"""
+Generation of dynamic linker caches in the new glibc format, with the
+generator and glibc-hwcaps extensions
+
+Mimics the cache generation of ldconfig(8) without creating links; the
+directories to scan can be taken from a configuration file and a sysroot.
+"""
+
+import os
+import stat
+import glob
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import cmp_to_key
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from sotools.elf import ET_DYN, ElfFormatError, read_elf
+from sotools.hwcaps import HWCAPS_DIRECTORY
+from sotools.profiling import PROFILER, SCANDIR
+from sotools.dl_cache import DynamicLinkerCache, ResolvedEntry
+from sotools.dl_cache.flags import Flags
+from sotools.dl_cache.dl_cache import _CacheHeaderNew, _FileEntryNew
+from sotools.dl_cache.structure import BinaryStruct
+from sotools.dl_cache.extensions import (
+    CACHE_EXTENSION_MAGIC,
+    CacheExtension,
+    CacheExtensionSection,
+    CacheExtensionTag,
+)
+from sotools.dl_cache.extensions.hwcaps import DL_CACHE_HWCAP_EXTENSION
+from sotools.dl_cache.extensions.stamps import (
+    Stamp,
+    parse_stamps,
+    serialize_stamps,
+    stamp,
+)
+
+GENERATOR = "ldconfig.py (python-sotools)"
+
+# Value of the header flags for a little-endian cache, as written by
+# BinaryStruct.serialize
+CACHE_FILE_NEW_FLAGS_ENDIAN_LITTLE = 2
+
+
+def libcmp(lhs: str, rhs: str) -> int:
+    """
+    Compare two library names, with embedded numbers compared numerically
+    Mimics _dl_cache_libcmp in glibc:/elf/dl-cache.c
+    """
+    left, right = 0, 0
+
+    while left < len(lhs):
+        if lhs[left].isdigit():
+            if right < len(rhs) and rhs[right].isdigit():
+                start = left
+                while left < len(lhs) and lhs[left].isdigit():
+                    left += 1
+                val1 = int(lhs[start:left])
+
+                start = right
+                while right < len(rhs) and rhs[right].isdigit():
+                    right += 1
+                val2 = int(rhs[start:right])
+
+                if val1 != val2:
+                    return val1 - val2
+            else:
+                return 1
+        elif right < len(rhs) and rhs[right].isdigit():
+            return -1
+        elif right >= len(rhs) or lhs[left] != rhs[right]:
+            return ord(lhs[left]) - (ord(rhs[right])
+                                     if right < len(rhs) else 0)
+        else:
+            left += 1
+            right += 1
+
+    return 0 - (ord(rhs[right]) if right < len(rhs) else 0)
+
+
+def _entry_compare(lhs: ResolvedEntry, rhs: ResolvedEntry) -> int:
+    """
+    Order of the entries in the cache: decreasing sonames, then decreasing
+    flags, then hwcaps entries before regular ones, sorted by subdirectory
+    Mimics compare in glibc:/elf/cache.c
+    """
+    res = libcmp(rhs.key, lhs.key)
+
+    if res == 0:
+        if lhs.flags != rhs.flags:
+            return 1 if lhs.flags < rhs.flags else -1
+        if lhs.hwcaps and not rhs.hwcaps:
+            return -1
+        if rhs.hwcaps and not lhs.hwcaps:
+            return 1
+        if lhs.hwcaps != rhs.hwcaps:
+            return -1 if lhs.hwcaps < rhs.hwcaps else 1
+
+    return res
+
+
+def configured_directories(conf_file: str = "/etc/ld.so.conf",
+                           root: str = "/") -> List[str]:
+    """
+    Return the directories listed in a ld.so.conf file, following include
+    directives. Paths are returned as seen from inside the root.
+    """
+    directories = []
+
+    def _parse(path: str):
+        try:
+            with open(os.path.join(root, path.lstrip('/')), 'r') as conf:
+                lines = conf.readlines()
+        except OSError as err:
+            logging.debug("Failed to read %s: %s", path, str(err))
+            return
+
+        for line in lines:
+            line = line.split('#', 1)[0].strip()
+
+            if not line or line.startswith('hwcap '):
+                continue
+
+            if line.startswith('include '):
+                for pattern in line.split()[1:]:
+                    if not pattern.startswith('/'):
+                        pattern = os.path.join(os.path.dirname(path), pattern)
+                    matches = glob.glob(
+                        os.path.join(root, pattern.lstrip('/')))
+                    for match in sorted(matches):
+                        _parse('/' + os.path.relpath(match, root))
+                continue
+
+            # Old ldconfig versions allowed a library type after the path
+            for directory in line.replace(',', ' ').split():
+                directory = directory.split('=', 1)[0].rstrip('/') or '/'
+                if directory not in directories:
+                    directories.append(directory)
+
+    _parse(conf_file)
+    return directories
+
+
+def _is_library_name(name: str) -> bool:
+    """
+    Mimics _dl_is_dso in glibc:/elf/ldconfig.c
+    """
+    return (name.startswith('lib') or name.startswith('ld-')) and '.so' in name
+
+
+class _Candidate(NamedTuple):
+    directory: str
+    hwcaps: str
+    names: List[str]
+    path: str
+    stamp: Stamp
+    links: List[str]
+
+
+class _Parsed(NamedTuple):
+    soname: str
+    flags: int
+
+
+# Amount of symbolic links followed before giving up, as MAXSYMLINKS
+_MAXSYMLINKS = 40
+
+
+def _chroot_canon(root: str, path: str) -> Optional[str]:
+    """
+    Resolve the symbolic links of path as seen from inside root: absolute
+    link targets are taken relative to root, not to the host's /
+    Mimics chroot_canon in glibc:/elf/chroot_canon.c
+
+    Returns the resolved path inside root, or None if it does not exist
+    """
+    resolved: List[str] = []
+    remaining = path.split('/')[::-1]
+    links = 0
+
+    while remaining:
+        component = remaining.pop()
+
+        if component in ('', '.'):
+            continue
+
+        if component == '..':
+            if resolved:
+                resolved.pop()
+            continue
+
+        location = os.path.join(root, *resolved, component)
+
+        try:
+            info = os.lstat(location)
+        except OSError:
+            return None
+
+        if not stat.S_ISLNK(info.st_mode):
+            resolved.append(component)
+            continue
+
+        links += 1
+        if links > _MAXSYMLINKS:
+            return None
+
+        try:
+            target = os.readlink(location)
+        except OSError:
+            return None
+
+        if target.startswith('/'):
+            resolved = []
+        remaining.extend(target.split('/')[::-1])
+
+    return '/' + '/'.join(resolved)
+
+
+def _in_root(root: str, path: str) -> str:
+    return os.path.join(root, path.lstrip('/'))
+
+
+def _scan_directory(directory: str, root: str,
+                    hwcaps: str = "") -> List[_Candidate]:
+    """
+    List the shared objects of a directory, grouping the names that point to
+    the same file
+    """
+    groups: Dict[Tuple[int, int], _Candidate] = {}
+    canonical = _chroot_canon(root, directory)
+
+    if PROFILER.enabled:
+        PROFILER.count(SCANDIR)
+
+    if canonical is None:
+        logging.debug("Failed to resolve %s in %s", directory, root)
+        return []
+
+    location = _in_root(root, canonical)
+
+    try:
+        iterator = os.scandir(location)
+    except OSError as err:
+        logging.debug("Failed to list %s: %s", location, str(err))
+        return []
+
+    with iterator:
+        for entry in iterator:
+            if not _is_library_name(entry.name):
+                continue
+
+            try:
+                link = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+
+            path, target = entry.path, link
+
+            # Follow links inside the root, not on the host
+            if stat.S_ISLNK(link.st_mode):
+                resolved = _chroot_canon(
+                    root, os.path.join(canonical, entry.name))
+                if resolved is None:
+                    continue
+
+                path = _in_root(root, resolved)
+                try:
+                    target = os.lstat(path)
+                except OSError:
+                    continue
+
+            if not stat.S_ISREG(target.st_mode):
+                continue
+
+            key = (target.st_dev, target.st_ino)
+
+            if key not in groups:
+                groups[key] = _Candidate(directory, hwcaps, [], path,
+                                         stamp(target), [])
+
+            groups[key].names.append(entry.name)
+
+            # Development links are registered under their own name
+            if stat.S_ISLNK(link.st_mode) and entry.name.endswith('.so'):
+                groups[key].links.append(entry.name)
+
+    return list(groups.values())
+
+
+def _directory_key(directory: str, root: str) -> Optional[Tuple[int, int]]:
+    """
+    Return the (st_dev, st_ino) of the directory the given path points to
+    inside root, or None if it is not one
+    """
+    canonical = _chroot_canon(root, directory)
+    if canonical is None:
+        return None
+
+    try:
+        info = os.lstat(_in_root(root, canonical))
+    except OSError:
+        return None
+
+    return (info.st_dev, info.st_ino) if stat.S_ISDIR(info.st_mode) else None
+
+
+def _hwcaps_subdirectories(directory: str, root: str) -> List[str]:
+    parent = os.path.join(directory, HWCAPS_DIRECTORY)
+    canonical = _chroot_canon(root, parent)
+    if canonical is None:
+        return []
+
+    try:
+        with os.scandir(_in_root(root, canonical)) as iterator:
+            names = [entry.name for entry in iterator]
+    except OSError:
+        return []
+
+    return sorted(
+        name for name in names
+        if _directory_key(os.path.join(parent, name), root) is not None)
+
+
+def _unique_directories(directories: Iterable[str], root: str) -> List[str]:
+    """
+    Filter out the directories that do not exist or that were already
+    listed under another name, through a symbolic link resolved inside root
+    """
+    seen = set()
+    unique = []
+
+    for directory in directories:
+        key = _directory_key(directory, root)
+
+        if key is not None and key not in seen:
+            seen.add(key)
+            unique.append(directory)
+
+    return unique
+
+
+def _parse(candidate: _Candidate) -> Optional[_Parsed]:
+    try:
+        elf = read_elf(candidate.path)
+    except (OSError, ElfFormatError) as err:
+        logging.debug("Skipping %s: %s", candidate.path, str(err))
+        return None
+
+    if elf.header.type != ET_DYN:
+        return None
+
+    header = elf.header
+    return _Parsed(
+        soname=elf.soname or candidate.names[0],
+        flags=Flags.from_machine(header.elf_class, header.machine,
+                                 header.flags),
+    )
+
+
+def scan_directories(directories: Iterable[str],
+                     root: str = "/",
+                     jobs: Optional[int] = None,
+                     previous: Optional[DynamicLinkerCache] = None
+                     ) -> List[ResolvedEntry]:
+    """
+    Scan the given directories and their glibc-hwcaps subdirectories for
+    shared objects and return the corresponding cache entries
+
+    directories:    paths to scan, as seen from inside the root
+    root:           sysroot containing the directories
+    jobs:           amount of threads used to list directories and read ELF
+                    headers; defaults to the ThreadPoolExecutor default
+    previous:       cache whose entries are reused for files that did not
+                    change since it was written, skipping their parsing;
+                    only caches written by sotools record the file stamps
+                    this requires (see extensions.stamps)
+    """
+    entries, _ = _scan(directories, root, jobs, previous)
+    return entries
+
+
+def _previous_stamps(cache: DynamicLinkerCache) -> Dict[str, Stamp]:
+    stamps: Dict[str, Stamp] = {}
+
+    for data in cache.extension(CacheExtensionTag.TAG_SOTOOLS_STAMPS):
+        stamps.update(parse_stamps(data))
+
+    return stamps
+
+
+def _scan(directories: Iterable[str], root: str, jobs: Optional[int],
+          previous: Optional[DynamicLinkerCache]
+          ) -> Tuple[List[ResolvedEntry], Dict[str, Stamp]]:
+    """
+    -> (list(ResolvedEntry), dict(str: Stamp))
+    scan_directories, also returning the stamps of the entries' files
+    """
+    known, stamps = {}, {}
+    if previous is not None:
+        known = {entry.value: entry for entry in previous.entries}
+        stamps = _previous_stamps(previous)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        targets = []
+        for directory in _unique_directories(directories, root):
+            targets.append((directory, ""))
+            for subdirectory in _hwcaps_subdirectories(directory, root):
+                targets.append((os.path.join(directory, HWCAPS_DIRECTORY,
+                                             subdirectory), subdirectory))
+
+        listings = executor.map(lambda t: _scan_directory(t[0], root, t[1]),
+                                targets)
+        candidates = [c for listing in listings for c in listing]
+
+        def _reuse(candidate: _Candidate) -> Optional[_Parsed]:
+            # Only the entry of the soname link, named after its key, holds
+            # the soname: development links have entries of their own
+            for name in candidate.names:
+                if name in candidate.links:
+                    continue
+                path = os.path.join(candidate.directory, name)
+                entry = known.get(path)
+                if (entry is not None and entry.key == name
+                        and stamps.get(path) == candidate.stamp):
+                    return _Parsed(soname=entry.key, flags=entry.flags)
+            return None
+
+        reused = list(map(_reuse, candidates))
+        to_parse = [c for c, r in zip(candidates, reused) if r is None]
+        parsed = dict(zip(map(id, to_parse), executor.map(_parse, to_parse)))
+
+    # Keep one object per soname and directory, preferring the one the
+    # soname link points to, as ldconfig does
+    selected: Dict[Tuple[str, str, int], Tuple[_Candidate, _Parsed]] = {}
+
+    for candidate, info in zip(candidates, reused):
+        info = info or parsed.get(id(candidate))
+        if info is None:
+            continue
+
+        key = (candidate.directory, info.soname, info.flags)
+        if key not in selected or info.soname in candidate.names:
+            selected[key] = (candidate, info)
+
+    recorded: Dict[str, Stamp] = {}
+
+    def _entries():
+        for candidate, info in selected.values():
+            name = info.soname
+            if name not in candidate.names:
+                logging.debug("No link named %s in %s", name,
+                              candidate.directory)
+                name = max(candidate.names, key=cmp_to_key(libcmp))
+
+            value = os.path.join(candidate.directory, name)
+            recorded[value] = candidate.stamp
+            yield ResolvedEntry(key=info.soname,
+                                value=value,
+                                flags=info.flags,
+                                hwcaps=candidate.hwcaps)
+
+            # Development links (the .so link used by ld(1), a prefix of the
+            # soname) are registered under their own name
+            for link in candidate.links:
+                if link != info.soname and info.soname.startswith(link):
+                    value = os.path.join(candidate.directory, link)
+                    recorded[value] = candidate.stamp
+                    yield ResolvedEntry(key=link,
+                                        value=value,
+                                        flags=info.flags,
+                                        hwcaps=candidate.hwcaps)
+
+    entries = list(_entries())
+    return entries, recorded
+
+
+def serialize_cache(entries: Iterable[ResolvedEntry],
+                    generator: Optional[str] = GENERATOR,
+                    stamps: Optional[Dict[str, Stamp]] = None) -> bytes:
+    """
+    Return the contents of a new format cache holding the given entries,
+    and the stamps of their files if given
+    """
+    entries = sorted(entries, key=cmp_to_key(_entry_compare))
+    hwcaps = sorted({entry.hwcaps for entry in entries if entry.hwcaps})
+    hwcaps_index = {name: index for index, name in enumerate(hwcaps)}
+
+    header = _CacheHeaderNew()
+    header_size = BinaryStruct.sizeof(_CacheHeaderNew)
+    entry_size = BinaryStruct.sizeof(_FileEntryNew)
+    base = header_size + len(entries) * entry_size
+
+    strings = bytearray()
+    offsets: Dict[str, int] = {}
+
+    def _string(value: str) -> int:
+        if value not in offsets:
+            offsets[value] = base + len(strings)
+            strings.extend(value.encode() + b'\0')
+        return offsets[value]
+
+    table = bytearray()
+    for resolved in entries:
+        entry = _FileEntryNew()
+        entry.flags = resolved.flags
+        entry.key = _string(resolved.key)
+        entry.value = _string(resolved.value)
+        if resolved.hwcaps:
+            entry.hwcap = DL_CACHE_HWCAP_EXTENSION | hwcaps_index[
+                resolved.hwcaps]
+        table.extend(entry.serialize())
+
+    hwcaps_offsets = [_string(name) for name in hwcaps]
+
+    # Extension data: the section directory, followed by the hwcaps string
+    # references and the generator string
+    extension_offset = (base + len(strings) + 3) & ~3
+    payloads = []
+    if hwcaps:
+        payloads.append((CacheExtensionTag.TAG_GLIBC_HWCAPS, b''.join(
+            offset.to_bytes(4, 'little') for offset in hwcaps_offsets)))
+    if generator:
+        payloads.append((CacheExtensionTag.TAG_GENERATOR, generator.encode()))
+    if stamps:
+        payloads.append((CacheExtensionTag.TAG_SOTOOLS_STAMPS,
+                         serialize_stamps(stamps)))
+
+    extension = CacheExtension()
+    extension.magic = CACHE_EXTENSION_MAGIC
+    extension.count = len(payloads)
+
+    directory = bytearray(extension.serialize())
+    data_offset = extension_offset + BinaryStruct.sizeof(
+        CacheExtension) + len(payloads) * BinaryStruct.sizeof(
+            CacheExtensionSection)
+    data = bytearray()
+
+    for tag, payload in sorted(payloads):
+        section = CacheExtensionSection()
+        section.tag = tag
+        section.offset = data_offset + len(data)
+        section.size = len(payload)
+        directory.extend(section.serialize())
+        data.extend(payload)
+
+    header.nlibs = len(entries)
+    header.len_strings = len(strings)
+    header.flags = CACHE_FILE_NEW_FLAGS_ENDIAN_LITTLE
+    header.extension_offset = extension_offset if payloads else 0
+
+    serialized = header.serialize()
+    contents = bytearray(_CacheHeaderNew.magic)
+    contents.extend(serialized[len(_CacheHeaderNew.magic):])
+    contents.extend(table)
+    contents.extend(strings)
+
+    if payloads:
+        contents.extend(b'\0' * (extension_offset - len(contents)))
+        contents.extend(directory)
+        contents.extend(data)
+
+    return bytes(contents)
+
+
+def write_cache(cache_file: str,
+                directories: Iterable[str],
+                root: str = "/",
+                jobs: Optional[int] = None,
+                incremental: bool = False,
+                generator: Optional[str] = GENERATOR) -> List[ResolvedEntry]:
+    """
+    Scan the given directories and write the resulting cache to cache_file,
+    atomically replacing it. Returns the entries written.
+
+    incremental:    reuse the entries of the existing cache_file for the
+                    files that did not change since it was written
+    """
+    previous = None
+
+    if incremental:
+        try:
+            previous = DynamicLinkerCache.load(cache_file)
+        except Exception as err:
+            logging.debug("Not reusing %s: %s", cache_file, str(err))
+
+    entries, stamps = _scan(directories, root, jobs, previous)
+
+    destination = os.path.dirname(os.path.abspath(cache_file))
+    descriptor, temporary = tempfile.mkstemp(dir=destination,
+                                             prefix='.ld.so.cache')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            output.write(serialize_cache(entries, generator, stamps))
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, cache_file)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+    return entries
@@ -0,0 +1,654 @@
+"""
+Minimal ELF reader for the fields involved in dynamic linking
+
+Only the file header, the program headers and the dynamic segment are read,
+which makes it much cheaper than a full parse when only the soname or the
+architecture of an object are required. Symbol versions are found through the
+dynamic segment as well, as the dynamic linker does, so that the section
+headers, usually at the end of the file, are never read.
+
+MappedFile reads files through a memory mapping, loading only the pages of
+the ranges read, which bounds the I/O spent on very large objects.
+"""
+
+import os
+import mmap
+import struct
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from sotools.profiling import PROFILER, SCANDIR
+from sotools.util import bounded_map
+
+ELF_MAGIC = "\x7fELF".encode()
+
+# e_ident[EI_CLASS]
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+
+# e_ident[EI_DATA]
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+
+# e_type
+ET_REL = 1
+ET_EXEC = 2
+ET_DYN = 3
+
+# e_machine, from <elf.h>
+EM_SPARC = 2
+EM_386 = 3
+EM_MIPS = 8
+EM_PPC = 20
+EM_PPC64 = 21
+EM_S390 = 22
+EM_ARM = 40
+EM_SPARCV9 = 43
+EM_IA_64 = 50
+EM_X86_64 = 62
+EM_AARCH64 = 183
+EM_RISCV = 243
+
+# p_type
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_INTERP = 3
+
+# d_tag
+DT_NULL = 0
+DT_NEEDED = 1
+DT_HASH = 4
+DT_STRTAB = 5
+DT_SYMTAB = 6
+DT_STRSZ = 10
+DT_SYMENT = 11
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
+DT_GNU_HASH = 0x6ffffef5
+DT_VERDEF = 0x6ffffffc
+DT_VERDEFNUM = 0x6ffffffd
+DT_VERNEED = 0x6ffffffe
+DT_VERNEEDNUM = 0x6fffffff
+
+# ELF_ST_BIND(st_info)
+STB_LOCAL = 0
+STB_GLOBAL = 1
+STB_WEAK = 2
+STB_GNU_UNIQUE = 10
+
+# st_shndx
+SHN_UNDEF = 0
+
+# Size of the largest file header, enough to classify any ELF file
+HEADER_SIZE = 64
+
+# Files read ahead by the threads of scan
+SCAN_WINDOW = 1024
+
+_IDENT = struct.Struct('4sBBBB8x')
+
+_HEADER_FORMATS = {
+    ELFCLASS32: 'HHIIIIIHHHHHH',
+    ELFCLASS64: 'HHIQQQIHHHHHH',
+}
+
+# Field order differs between classes; both are mapped to
+# (p_type, p_offset, p_vaddr, p_filesz)
+_SEGMENT_FORMATS = {
+    ELFCLASS32: ('IIIIIIII', (0, 1, 2, 4)),
+    ELFCLASS64: ('IIQQQQQQ', (0, 2, 3, 5)),
+}
+
+_DYNAMIC_FORMATS = {
+    ELFCLASS32: 'iI',
+    ELFCLASS64: 'qQ',
+}
+
+# Version structures, identical in both classes:
+# (vd_version, vd_flags, vd_ndx, vd_cnt, vd_hash, vd_aux, vd_next)
+_VERDEF_FORMAT = 'HHHHIII'
+# (vda_name, vda_next)
+_VERDAUX_FORMAT = 'II'
+# (vn_version, vn_cnt, vn_file, vn_aux, vn_next)
+_VERNEED_FORMAT = 'HHIII'
+# (vna_hash, vna_flags, vna_other, vna_name, vna_next)
+_VERNAUX_FORMAT = 'IHHII'
+
+
+class ElfFormatError(Exception):
+    pass
+
+
+class ElfBudgetError(ElfFormatError):
+    pass
+
+
+class MappedFile:
+    """
+    Read-only file object over a memory mapping of a file
+
+    Reads copy the requested ranges out of the mapping, so only the pages
+    backing them are loaded; readahead is disabled where supported. The
+    pages read are recorded, and with a budget, a read bringing the amount
+    of pages touched over budget bytes raises ElfBudgetError.
+    """
+
+    def __init__(self, path: Union[str, Path], budget: Optional[int] = None):
+        self.name = str(path)
+        self.budget = budget
+        self.pages: Set[int] = set()
+        self._position = 0
+
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            # Empty files cannot be mapped
+            self._mapping = mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+        if size and hasattr(mmap, 'MADV_RANDOM'):
+            self._mapping.madvise(mmap.MADV_RANDOM)
+
+    @property
+    def bytes_touched(self) -> int:
+        """
+        Size of the pages read so far
+        """
+        return len(self.pages) * mmap.PAGESIZE
+
+    def _touch(self, start: int, end: int):
+        pages = range(start // mmap.PAGESIZE, (end - 1) // mmap.PAGESIZE + 1)
+
+        if self.budget is not None and (len(self.pages) + len(pages)
+                                        ) * mmap.PAGESIZE > self.budget:
+            touched = len(self.pages.union(pages)) * mmap.PAGESIZE
+            if touched > self.budget:
+                raise ElfBudgetError(
+                    f"Reading {self.name} requires more than {self.budget} "
+                    "bytes")
+
+        self.pages.update(pages)
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._mapping)
+        if size >= 0:
+            end = min(end, self._position + size)
+
+        if end <= self._position:
+            return b''
+
+        self._touch(self._position, end)
+        data = self._mapping[self._position:end]
+        self._position = end
+        return data
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += len(self._mapping)
+
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+
+        self._position = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self):
+        if isinstance(self._mapping, mmap.mmap):
+            self._mapping.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+@dataclass(frozen=True)
+class ElfHeader:
+    elf_class: int
+    endianness: str
+    osabi: int
+    type: int
+    machine: int
+    flags: int
+    phoff: int
+    phentsize: int
+    phnum: int
+
+    @classmethod
+    def parse(cls, data: bytes):
+        """
+        -> ElfHeader
+        Parse the file header from the first bytes of an ELF file
+        """
+        if len(data) < _IDENT.size or data[:4] != ELF_MAGIC:
+            raise ElfFormatError("Not an ELF file")
+
+        _, elf_class, encoding, _, osabi = _IDENT.unpack_from(data)
+
+        if elf_class not in _HEADER_FORMATS or encoding not in {
+                ELFDATA2LSB, ELFDATA2MSB
+        }:
+            raise ElfFormatError(
+                f"Unsupported ELF class or encoding ({elf_class}, {encoding})")
+
+        endianness = '<' if encoding == ELFDATA2LSB else '>'
+        layout = struct.Struct(endianness + _HEADER_FORMATS[elf_class])
+
+        try:
+            (type_, machine, _, _, phoff, _, flags, _, phentsize, phnum, _, _,
+             _) = layout.unpack_from(data, _IDENT.size)
+        except struct.error as err:
+            raise ElfFormatError("Truncated ELF header") from err
+
+        return cls(elf_class=elf_class,
+                   endianness=endianness,
+                   osabi=osabi,
+                   type=type_,
+                   machine=machine,
+                   flags=flags,
+                   phoff=phoff,
+                   phentsize=phentsize,
+                   phnum=phnum)
+
+    @property
+    def is_64bits(self) -> bool:
+        return self.elf_class == ELFCLASS64
+
+
+@dataclass(frozen=True)
+class Segment:
+    type: int
+    offset: int
+    vaddr: int
+    filesz: int
+
+
+@dataclass
+class ElfObject:
+    """
+    Dynamic linking information of an ELF file
+    """
+    path: str
+    header: ElfHeader
+    interpreter: Optional[str] = None
+    soname: Optional[str] = None
+    needed: List[str] = field(default_factory=list)
+    rpath: List[str] = field(default_factory=list)
+    runpath: List[str] = field(default_factory=list)
+    segments: List[Segment] = field(default_factory=list)
+    # Only read when requested from _read_object
+    defined_versions: List[str] = field(default_factory=list)
+    required_versions: Dict[str, List[str]] = field(default_factory=dict)
+    # Status of the file read, set by classify
+    stat: Optional[os.stat_result] = field(default=None,
+                                           compare=False,
+                                           repr=False)
+
+    @property
+    def is_dynamic(self) -> bool:
+        return self.header.type == ET_DYN or self.interpreter is not None
+
+    @property
+    def has_dynamic(self) -> bool:
+        """
+        The object has a dynamic segment, hence takes part in dynamic linking
+        """
+        return any(segment.type == PT_DYNAMIC for segment in self.segments)
+
+
+def _read_at(file: BinaryIO, offset: int, size: int) -> bytes:
+    file.seek(offset)
+    data = file.read(size)
+
+    if len(data) != size:
+        raise ElfFormatError(f"Truncated read at offset {offset}")
+
+    return data
+
+
+def _read_string(file: BinaryIO, offset: int, chunk: int = 256) -> str:
+    """
+    Read a null terminated string at the given file offset
+    """
+    file.seek(offset)
+    data = b''
+
+    while True:
+        block = file.read(chunk)
+        terminator = block.find(0x0)
+
+        if terminator != -1:
+            data += block[:terminator]
+            break
+
+        if not block:
+            break
+
+        data += block
+
+    return data.decode(errors='replace')
+
+
+def program_headers(file: BinaryIO, header: ElfHeader) -> List[Segment]:
+    """
+    Read the segments described by the program headers
+    """
+    format_, indexes = _SEGMENT_FORMATS[header.elf_class]
+    layout = struct.Struct(header.endianness + format_)
+
+    if not header.phnum:
+        return []
+
+    if header.phentsize < layout.size:
+        raise ElfFormatError(
+            f"Invalid program header size ({header.phentsize})")
+
+    data = _read_at(file, header.phoff, header.phnum * header.phentsize)
+
+    def _segments():
+        for index in range(header.phnum):
+            fields = layout.unpack_from(data, index * header.phentsize)
+            yield Segment(*(fields[i] for i in indexes))
+
+    return list(_segments())
+
+
+def _vaddr_offset(segments: List[Segment], vaddr: int) -> Optional[int]:
+    """
+    Translate a virtual address into a file offset using the loaded segments
+    """
+    for segment in segments:
+        if segment.type == PT_LOAD and segment.vaddr <= vaddr < (
+                segment.vaddr + segment.filesz):
+            return vaddr - segment.vaddr + segment.offset
+
+    return None
+
+
+def dynamic_entries(file: BinaryIO, header: ElfHeader,
+                    segment: Segment) -> List[Tuple[int, int]]:
+    """
+    Read the (d_tag, d_val) pairs of the dynamic segment
+    """
+    layout = struct.Struct(
+        f"{header.endianness}{_DYNAMIC_FORMATS[header.elf_class]}")
+    data = _read_at(file, segment.offset, segment.filesz)
+
+    entries = []
+    usable = len(data) - len(data) % layout.size
+    for tag, value in layout.iter_unpack(data[:usable]):
+        if tag == DT_NULL:
+            break
+        entries.append((tag, value))
+
+    return entries
+
+
+def version_definitions(file: BinaryIO, header: ElfHeader, offset: int,
+                        count: int, strtab: int) -> List[str]:
+    """
+    Read the names of the versions defined in the table at offset: the first
+    name of each definition, the first one being the object's own
+    """
+    verdef = struct.Struct(header.endianness + _VERDEF_FORMAT)
+    verdaux = struct.Struct(header.endianness + _VERDAUX_FORMAT)
+    names = []
+
+    for _ in range(count):
+        (_, _, _, cnt, _, aux,
+         next_) = verdef.unpack(_read_at(file, offset, verdef.size))
+
+        if cnt:
+            name, _ = verdaux.unpack(
+                _read_at(file, offset + aux, verdaux.size))
+            names.append(_read_string(file, strtab + name))
+
+        if not next_:
+            break
+        offset += next_
+
+    return names
+
+
+def version_requirements(file: BinaryIO, header: ElfHeader, offset: int,
+                         count: int, strtab: int) -> Dict[str, List[str]]:
+    """
+    Read the versions required from every object in the table at offset
+    """
+    verneed = struct.Struct(header.endianness + _VERNEED_FORMAT)
+    vernaux = struct.Struct(header.endianness + _VERNAUX_FORMAT)
+    required = {}
+
+    for _ in range(count):
+        _, cnt, name, aux, next_ = verneed.unpack(
+            _read_at(file, offset, verneed.size))
+
+        versions = []
+        position = offset + aux
+        for _ in range(cnt):
+            (_, _, _, version,
+             next_aux) = vernaux.unpack(_read_at(file, position, vernaux.size))
+            versions.append(_read_string(file, strtab + version))
+
+            if not next_aux:
+                break
+            position += next_aux
+
+        required[_read_string(file, strtab + name)] = versions
+
+        if not next_:
+            break
+        offset += next_
+
+    return required
+
+
+def _read_object(file: BinaryIO,
+                 path: str,
+                 header: ElfHeader,
+                 dynamic: bool = True,
+                 versions: bool = False) -> ElfObject:
+    elf = ElfObject(path=path, header=header)
+    elf.segments = program_headers(file, header)
+
+    for segment in elf.segments:
+        if segment.type == PT_INTERP:
+            elf.interpreter = _read_string(file, segment.offset)
+
+    if not dynamic or not elf.has_dynamic:
+        return elf
+
+    segment = next(s for s in elf.segments if s.type == PT_DYNAMIC)
+    entries = dynamic_entries(file, header, segment)
+    strtab = [value for tag, value in entries if tag == DT_STRTAB]
+
+    if not strtab:
+        return elf
+
+    base = _vaddr_offset(elf.segments, strtab[0])
+    if base is None:
+        raise ElfFormatError("String table outside of loaded segments")
+
+    for tag, value in entries:
+        if tag == DT_SONAME:
+            elf.soname = _read_string(file, base + value)
+        elif tag == DT_NEEDED:
+            elf.needed.append(_read_string(file, base + value))
+        elif tag == DT_RPATH:
+            elf.rpath = _read_string(file, base + value).split(':')
+        elif tag == DT_RUNPATH:
+            elf.runpath = _read_string(file, base + value).split(':')
+
+    if not versions:
+        return elf
+
+    tags = dict(entries)
+    for table, number, reader in (
+        (DT_VERDEF, DT_VERDEFNUM, version_definitions),
+        (DT_VERNEED, DT_VERNEEDNUM, version_requirements),
+    ):
+        if table not in tags:
+            continue
+
+        offset = _vaddr_offset(elf.segments, tags[table])
+        if offset is None:
+            raise ElfFormatError("Version table outside of loaded segments")
+
+        found = reader(file, header, offset, tags.get(number, 0), base)
+        if table == DT_VERDEF:
+            elf.defined_versions = found
+        else:
+            elf.required_versions = found
+
+    return elf
+
+
+def read_elf(path: Union[str, Path],
+             versions: bool = False,
+             budget: Optional[int] = None) -> ElfObject:
+    """
+    Read the dynamic linking information of the ELF file at path, touching
+    only the file header, program headers, dynamic segment and the strings
+    it references, and with versions, the version tables
+
+    The file is read through a MappedFile; budget bounds the bytes of the
+    pages read. Raises ElfFormatError if the file is not a valid ELF object,
+    ElfBudgetError if reading it exceeds the budget, OSError if it cannot be
+    read.
+    """
+    with MappedFile(path, budget) as file:
+        return read_object(file, versions)
+
+
+def read_object(file: BinaryIO, versions: bool = False) -> ElfObject:
+    """
+    Read the dynamic linking information of the ELF object in an open file,
+    as read_elf does
+    """
+    header = ElfHeader.parse(file.read(HEADER_SIZE))
+    return _read_object(file, file.name, header, versions=versions)
+
+
+def classify(path: Union[str, Path],
+             dynamic: bool = False,
+             versions: bool = False) -> Optional[ElfObject]:
+    """
+    -> ElfObject or None
+    Read the file header and program headers of the file at path, or return
+    None if it is not an ELF file. The class, machine and type are in the
+    header of the result; its segments tell if it has a dynamic segment or
+    an interpreter, and its stat the status of the file read.
+
+    With dynamic, the dynamic segment is read as well, in the same pass, as
+    read_elf would; with versions, the version tables too.
+    """
+    with open(path, 'rb') as file:
+        data = file.read(HEADER_SIZE)
+
+        if data[:len(ELF_MAGIC)] != ELF_MAGIC:
+            return None
+
+        header = ElfHeader.parse(data)
+        elf = _read_object(file, str(path), header, dynamic or versions,
+                           versions)
+        elf.stat = os.fstat(file.fileno())
+        return elf
+
+
+def _walk(root: str, follow_symlinks: bool) -> Iterator[str]:
+    """
+    Generate the paths of the regular files under root, relying on the file
+    types returned by scandir to avoid a stat per entry
+    """
+    stack = [root]
+
+    while stack:
+        directory = stack.pop()
+
+        if PROFILER.enabled:
+            PROFILER.count(SCANDIR)
+
+        try:
+            iterator = os.scandir(directory)
+        except OSError as err:
+            logging.debug("Failed to list %s: %s", directory, str(err))
+            continue
+
+        with iterator:
+            subdirectories = []
+            for entry in iterator:
+                try:
+                    if entry.is_dir(follow_symlinks=follow_symlinks):
+                        subdirectories.append(entry.path)
+                    elif entry.is_file(follow_symlinks=follow_symlinks):
+                        yield entry.path
+                except OSError:
+                    continue
+
+        stack.extend(reversed(sorted(subdirectories)))
+
+
+def scan(roots: Iterable[Union[str, Path]],
+         jobs: Optional[int] = 1,
+         dynamic: bool = False,
+         follow_symlinks: bool = False,
+         versions: bool = False) -> Iterator[ElfObject]:
+    """
+    Find the ELF objects in the given files and directory trees
+
+    roots:              files and directories to scan
+    jobs:               amount of threads reading the files, useful on
+                        network filesystems; None for the ThreadPoolExecutor
+                        default
+    dynamic:            also read the dynamic segment of the objects, while
+                        the file is open
+    follow_symlinks:    report files reached through symbolic links, and
+                        descend into linked directories; beware of cycles
+    versions:           also read the version tables, as Library.from_elf
+                        expects
+
+    Files are opened once, and only their first bytes are read unless
+    dynamic is set. Unreadable or malformed files are skipped. With threads,
+    at most SCAN_WINDOW files are read ahead of the objects consumed.
+    """
+
+    def _paths():
+        for root in map(str, roots):
+            if os.path.isdir(root):
+                yield from _walk(root, follow_symlinks)
+            else:
+                yield root
+
+    def _classify(path: str) -> Optional[ElfObject]:
+        try:
+            return classify(path, dynamic, versions)
+        except (OSError, ElfFormatError) as err:
+            logging.debug("Skipping %s: %s", path, str(err))
+            return None
+
+    if jobs == 1:
+        yield from filter(None, map(_classify, _paths()))
+        return
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        yield from filter(
+            None, bounded_map(executor, _classify, _paths(), SCAN_WINDOW))
@@ -0,0 +1,228 @@
+"""
+Dependency graph of a set of libraries
+
+Nodes are sonames, mapped to the path of the object when it was resolved;
+edges follow the DT_NEEDED entries of the requesting object, in the order
+they appear in its dynamic section. The graph is built from the data parsed
+during resolution, without reading any file.
+
+All the queries run in O(V+E).
+"""
+
+import json
+from collections import deque
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+)
+
+
+class Edge(NamedTuple):
+    requester: str
+    soname: str
+
+
+class DependencyGraph:
+    """
+    Directed graph of the dependencies between objects
+    """
+
+    @classmethod
+    def from_libraries(cls, libraries: Iterable):
+        """
+        -> DependencyGraph
+        Build the graph of the given Library objects; dependencies not found
+        among them are added as nodes without a path
+        """
+        graph = cls()
+        libraries = sorted(libraries, key=lambda lib: lib.soname)
+
+        for library in libraries:
+            graph.add_node(library.soname, library.binary_path)
+
+        for library in libraries:
+            # Libraries built by hand may only list their dependencies
+            needed = library.needed or sorted(library.dyn_dependencies)
+            for soname in needed:
+                graph.add_edge(library.soname, soname)
+
+        return graph
+
+    def __init__(self):
+        self.nodes: Dict[str, Optional[str]] = {}
+        self.adjacency: Dict[str, List[str]] = {}
+
+    def add_node(self, soname: str, path: Optional[str] = None):
+        if self.nodes.get(soname) is None:
+            self.nodes[soname] = path
+        self.adjacency.setdefault(soname, [])
+
+    def add_edge(self, requester: str, soname: str):
+        self.add_node(requester)
+        self.add_node(soname)
+
+        if soname not in self.adjacency[requester]:
+            self.adjacency[requester].append(soname)
+
+    @property
+    def edges(self) -> List[Edge]:
+        return [
+            Edge(requester, soname)
+            for requester, needed in self.adjacency.items()
+            for soname in needed
+        ]
+
+    @property
+    def missing(self) -> List[str]:
+        """
+        Sonames that were not resolved
+        """
+        return [soname for soname, path in self.nodes.items() if path is None]
+
+    @property
+    def roots(self) -> List[str]:
+        """
+        Nodes no other node depends upon, in insertion order
+        """
+        required = {edge.soname for edge in self.edges}
+        return [soname for soname in self.nodes if soname not in required]
+
+    def requesters(self, soname: str) -> List[str]:
+        """
+        Nodes with a DT_NEEDED entry for soname
+        """
+        return [edge.requester for edge in self.edges if edge.soname == soname]
+
+    def load_order(self, roots: Optional[Sequence[str]] = None) -> List[str]:
+        """
+        Breadth-first order in which the dynamic linker loads the objects,
+        starting from the given roots (or all the roots of the graph). Nodes
+        unreachable from the roots, which only happens with dependency
+        cycles, are appended in insertion order.
+        """
+        if roots is None:
+            roots = self.roots or list(self.nodes)
+
+        order = [soname for soname in roots if soname in self.nodes]
+        seen = set(order)
+        queue = deque(order)
+
+        while queue:
+            for soname in self.adjacency[queue.popleft()]:
+                if soname not in seen:
+                    seen.add(soname)
+                    order.append(soname)
+                    queue.append(soname)
+
+        order.extend(soname for soname in self.nodes if soname not in seen)
+        return order
+
+    def strongly_connected_components(self) -> List[List[str]]:
+        """
+        Strongly connected components, dependencies first (Tarjan's
+        algorithm, without recursion)
+        """
+        index: Dict[str, int] = {}
+        lowlink: Dict[str, int] = {}
+        stack: List[str] = []
+        on_stack = set()
+        components = []
+
+        for start in self.nodes:
+            if start in index:
+                continue
+
+            work = [(start, 0)]
+            while work:
+                node, position = work.pop()
+
+                if position == 0:
+                    index[node] = lowlink[node] = len(index)
+                    stack.append(node)
+                    on_stack.add(node)
+
+                neighbours = self.adjacency[node]
+                while position < len(neighbours):
+                    child = neighbours[position]
+                    position += 1
+
+                    if child not in index:
+                        work.append((node, position))
+                        work.append((child, 0))
+                        break
+
+                    if child in on_stack:
+                        lowlink[node] = min(lowlink[node], index[child])
+                else:
+                    if lowlink[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        components.append(component)
+
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+        return components
+
+    def cycles(self) -> List[List[str]]:
+        """
+        Groups of objects depending on each other
+        """
+        return [
+            component for component in self.strongly_connected_components()
+            if len(component) > 1
+            or component[0] in self.adjacency[component[0]]
+        ]
+
+    def topological_order(self) -> List[str]:
+        """
+        Order in which every object comes after its dependencies, as used
+        when running initializers. Members of a cycle are kept together.
+        """
+        return [
+            soname for component in self.strongly_connected_components()
+            for soname in component
+        ]
+
+    def as_dict(self) -> dict:
+        return dict(
+            nodes=[
+                dict(soname=soname, path=path)
+                for soname, path in self.nodes.items()
+            ],
+            edges=[edge._asdict() for edge in self.edges],
+        )
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def to_dot(self, name: str = "dependencies") -> str:
+        """
+        Graphviz representation of the graph; unresolved objects are dashed
+        """
+        lines = [f"digraph \"{name}\" {{"]
+
+        for soname, path in self.nodes.items():
+            if path is None:
+                lines.append(f"\t\"{soname}\" [style=dashed];")
+            else:
+                lines.append(f"\t\"{soname}\" [tooltip=\"{path}\"];")
+
+        for edge in self.edges:
+            lines.append(f"\t\"{edge.requester}\" -> \"{edge.soname}\";")
+
+        lines.append("}")
+        return "\n".join(lines)
+
+    def __len__(self):
+        return len(self.nodes)
@@ -0,0 +1,149 @@
+"""
+Detection of the glibc-hwcaps subdirectories supported by the running CPU
+Rules in ld.so(8), section "Hardware capabilities"
+"""
+
+import struct
+import platform
+import logging
+from typing import (
+    Dict,
+    FrozenSet,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from sotools.caching import memoize
+
+HWCAPS_DIRECTORY = 'glibc-hwcaps'
+
+# Auxiliary vector entry types, from <elf.h>
+AT_NULL = 0
+AT_HWCAP = 16
+AT_HWCAP2 = 26
+
+# ISA levels as defined by the x86-64 psABI, most capable first. Every level
+# requires the features of the levels listed after it.
+# Sourced from glibc:/sysdeps/x86/get-isa-level.h, with feature names as they
+# appear in /proc/cpuinfo
+_X86_64_LEVELS = [
+    ('x86-64-v4', {'avx512f', 'avx512bw', 'avx512cd', 'avx512dq', 'avx512vl'}),
+    ('x86-64-v3', {
+        'avx', 'avx2', 'bmi1', 'bmi2', 'f16c', 'fma', 'abm', 'movbe', 'xsave'
+    }),
+    ('x86-64-v2', {
+        'cx16', 'lahf_lm', 'popcnt', 'pni', 'sse4_1', 'sse4_2', 'ssse3'
+    }),
+]
+
+# AT_HWCAP2 bits, from glibc:/sysdeps/powerpc/bits/hwcap.h
+PPC_FEATURE2_ARCH_3_00 = 0x00800000
+PPC_FEATURE2_HAS_IEEE128 = 0x00400000
+PPC_FEATURE2_ARCH_3_1 = 0x00040000
+PPC_FEATURE2_MMA = 0x00020000
+
+_POWER_LEVELS = [
+    ('power10', PPC_FEATURE2_ARCH_3_1 | PPC_FEATURE2_MMA),
+    ('power9', PPC_FEATURE2_ARCH_3_00 | PPC_FEATURE2_HAS_IEEE128),
+]
+
+
+def _cpu_flags(cpuinfo: str = '/proc/cpuinfo') -> FrozenSet[str]:
+    """
+    Return the feature flags of the first processor listed in cpuinfo
+    """
+    try:
+        with open(cpuinfo, 'r') as info:
+            for line in info:
+                if line.startswith('flags'):
+                    return frozenset(line.split(':', 1)[1].split())
+    except OSError as err:
+        logging.debug("Failed to read CPU flags: %s", str(err))
+
+    return frozenset()
+
+
+def _auxv(auxv: str = '/proc/self/auxv') -> Dict[int, int]:
+    """
+    Return the auxiliary vector of the current process as a dictionary
+    """
+    word = 'Q' if platform.architecture()[0] == '64bit' else 'I'
+    entry = struct.Struct(f'={word}{word}')
+
+    try:
+        with open(auxv, 'rb') as file:
+            data = file.read()
+    except OSError as err:
+        logging.debug("Failed to read auxiliary vector: %s", str(err))
+        return {}
+
+    vector = {}
+    for offset in range(0, len(data) - entry.size + 1, entry.size):
+        type_, value = entry.unpack_from(data, offset)
+        if type_ == AT_NULL:
+            break
+        vector[type_] = value
+
+    return vector
+
+
+def x86_64_levels(flags: FrozenSet[str]) -> Tuple[str, ...]:
+    """
+    Return the x86-64 ISA levels supported given a set of CPU flags, most
+    capable first
+    """
+    supported = []
+    missing = False
+
+    # Walk the levels from the lowest, as a level is only valid if all the
+    # levels below are
+    for name, required in reversed(_X86_64_LEVELS):
+        missing = missing or not required.issubset(flags)
+        if not missing:
+            supported.insert(0, name)
+
+    return tuple(supported)
+
+
+def power_levels(hwcap2: int) -> Tuple[str, ...]:
+    """
+    Return the POWER ISA levels supported given the AT_HWCAP2 value, most
+    capable first
+    """
+    supported = []
+    missing = False
+
+    for name, required in reversed(_POWER_LEVELS):
+        missing = missing or (hwcap2 & required) != required
+        if not missing:
+            supported.insert(0, name)
+
+    return tuple(supported)
+
+
+@memoize
+def supported_hwcaps(machine: Optional[str] = None) -> Tuple[str, ...]:
+    """
+    Return the names of the glibc-hwcaps subdirectories supported by the
+    current CPU, in decreasing order of priority
+
+    The CPU is only probed once; the result is cached for the whole session.
+    """
+    machine = machine or platform.machine()
+
+    if machine == 'x86_64':
+        return x86_64_levels(_cpu_flags())
+
+    if machine == 'ppc64le':
+        return power_levels(_auxv().get(AT_HWCAP2, 0))
+
+    return ()
+
+
+def priorities(hwcaps: Sequence[str]) -> Dict[str, int]:
+    """
+    Return a mapping of subdirectory names to their priority. Higher values
+    are preferred; unsupported subdirectories are absent from the mapping.
+    """
+    return {name: len(hwcaps) - index for index, name in enumerate(hwcaps)}
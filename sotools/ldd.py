@@ -1,24 +1,164 @@
-from copy import deepcopy
+import json
 from pathlib import Path
-from sotools import is_elf
+from typing import (
+    Iterable,
+    Iterator,
+    Optional,
+    TextIO,
+    Tuple,
+    Union,
+)
+from sotools.elf import ElfFormatError, classify
 from sotools.libraryset import Library, LibrarySet
 
+Entry = Tuple[str, Optional[str]]
+
+# Orders in which entries can be generated: as the libraries are found, by
+# soname, or in the order the dynamic linker loads them. Only the first one
+# starts generating before the whole closure is resolved.
+ORDERS = ('resolution', 'sorted', 'load')
+
 
 class NotELFError(Exception):
     pass
 
 
-def ldd(binary: str):
+def _root(binary: Union[str, Path]) -> Library:
     """
-    -> LibrarySet
+    Read binary in a single pass, raising NotELFError if it is not an ELF
+    file
     """
-
     path = Path(binary)
 
-    if not is_elf(path):
+    try:
+        elf = classify(path, versions=True)
+    except OSError:
         raise NotELFError
+    except ElfFormatError:
+        # Reported, with an empty library, as for the dependencies
+        return Library.from_path(path)
+
+    if elf is None:
+        raise NotELFError
+
+    return Library.from_elf(elf)
+
+
+def ldd(binary: str) -> LibrarySet:
+    """
+    -> LibrarySet
+    Returns the dependency closure of binary, without binary itself
+    """
+    root = _root(binary)
+
+    closure = LibrarySet([root]).resolve()
+    closure.discard(root)
+
+    return closure
+
+
+def iter_ldd(binary: str) -> Iterator[Library]:
+    """
+    -> Iterator[Library]
+    Generates the dependencies of binary as they are resolved, dependencies
+    of the binary first
+
+    Raises NotELFError when called, before iterating, if binary is not an
+    ELF file.
+    """
+    return LibrarySet([_root(binary)]).resolve_iter()
+
+
+def _resolution_entries(root: Library) -> Iterator[Entry]:
+    found, needed = {root.soname}, set(root.dyn_dependencies)
+
+    for library in LibrarySet([root]).resolve_iter():
+        yield library.soname, library.binary_path
+        found.add(library.soname)
+        needed.update(library.dyn_dependencies)
+
+    for soname in sorted(needed - found):
+        yield soname, None
+
+
+def _load_entries(root: Library) -> Iterator[Entry]:
+    graph = LibrarySet([root]).resolve().graph()
+
+    for soname in graph.load_order([root.soname]):
+        if soname != root.soname:
+            yield soname, graph.nodes[soname]
+
+
+def ldd_entries(binary: Union[str, Library],
+                order: str = 'resolution') -> Iterator[Entry]:
+    """
+    -> Iterator[(str, str or None)]
+    Generates the soname and path of the dependencies of binary, a path or
+    an already read Library, in one of ORDERS; the path of missing
+    dependencies is None. In resolution order, missing dependencies come
+    last.
+
+    Raises NotELFError when called if binary is not an ELF file.
+    """
+    if order not in ORDERS:
+        raise ValueError(f"Unknown order: {order}")
+
+    root = binary if isinstance(binary, Library) else _root(binary)
+
+    if order == 'resolution':
+        return _resolution_entries(root)
+
+    if order == 'load':
+        return _load_entries(root)
+
+    closure = LibrarySet([root]).resolve()
+    closure.discard(root)
+    return closure.ldd_entries()
+
+
+def text_format(soname: str, path: Optional[str]) -> str:
+    """
+    Format an entry as ldd(1) does
+    """
+    return f"\t{soname} => {path or 'not found'}\n"
+
+
+def json_format(soname: str, path: Optional[str]) -> str:
+    """
+    Format an entry as a JSON object on its own line
+    """
+    return json.dumps(dict(soname=soname, path=path)) + "\n"
+
+
+def null_format(soname: str, path: Optional[str]) -> str:
+    """
+    Format an entry as its NUL-terminated path, for xargs -0 or rsync -0
+    --files-from; missing dependencies have no path and are left out
+    """
+    return f"{path}\0" if path else ""
+
+
+FORMATS = {
+    'text': text_format,
+    'json': json_format,
+    'null': null_format,
+}
+
+
+def write_entries(entries: Iterable[Entry],
+                  stream: TextIO,
+                  format_: str = 'text') -> int:
+    """
+    -> int
+    Write the entries to stream in the given format as they are generated,
+    and return the amount of missing dependencies
+    """
+    formatter = FORMATS[format_]
+    missing = 0
 
-    executable = LibrarySet([Library.from_path(path)])
-    libraries = deepcopy(executable)
+    for soname, path in entries:
+        stream.write(formatter(soname, path))
+        stream.flush()
+        missing += path is None
 
-    return LibrarySet(libraries.resolve() - executable)
+    return missing
@@ -3,97 +3,322 @@ Defines a derived class of set() with shared objects, along with a few methods,
 to facilitate handling large amounts of libraries
 """
 
-import re
+import os
+import copy
 import logging
+import threading
+from functools import partial, wraps
 from pathlib import Path
-from typing import Union
+from time import perf_counter
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from sotools.util import flatten
-
-from sotools.linker import resolve, LinkingError
+from sotools.caching import SingleFlight
+
+from sotools.linker import (
+    DirectoryIndex,
+    LinkingError,
+    object_flags,
+    resolve,
+    resolve_arch,
+)
 from sotools.dl_cache import Flags
-
-from elftools.common.exceptions import ELFError
-from elftools.elf.elffile import ELFFile
-from elftools.elf.dynamic import DynamicSection
-from elftools.elf.gnuversions import (
-    GNUVerDefSection,
-    GNUVerNeedSection,
+from sotools.elf import (
+    ElfBudgetError,
+    ElfFormatError,
+    ElfObject,
+    MappedFile,
+    read_object,
+)
+from sotools.graph import DependencyGraph
+from sotools.symbols import Scope
+from sotools.profiling import (
+    PROFILER,
+    ELF_REUSED,
+    ITERATIONS,
 )
 
 
+class VersionTable:
+    """
+    Interns symbol version names as bit positions, so that sets of versions
+    can be stored and compared as integers
+    """
+
+    def __init__(self):
+        self.bits: Dict[str, int] = {}
+        self.names: List[str] = []
+        self._lock = threading.Lock()
+
+    def mask(self, versions: Iterable[str]) -> int:
+        """
+        -> int
+        Bitset of the given version names, interning the unknown ones
+        """
+        mask = 0
+
+        for name in versions:
+            bit = self.bits.get(name)
+            if bit is None:
+                bit = self._intern(name)
+            mask |= 1 << bit
+
+        return mask
+
+    def _intern(self, name: str) -> int:
+        # Two threads interning names at the same time would otherwise
+        # assign them the same bit
+        with self._lock:
+            bit = self.bits.get(name)
+            if bit is None:
+                self.names.append(name)
+                bit = self.bits[name] = len(self.names) - 1
+            return bit
+
+    def decode(self, mask: int) -> Set[str]:
+        """
+        -> set(str)
+        Version names in the given bitset
+        """
+        names = set()
+
+        while mask:
+            low = mask & -mask
+            names.add(self.names[low.bit_length() - 1])
+            mask ^= low
+
+        return names
+
+
+VERSIONS = VersionTable()
+
+GLIBC_PRIVATE = VERSIONS.mask(['GLIBC_PRIVATE'])
+
+# Parsed libraries, keyed by the device and inode of their file, along with
+# the modification time and size of the file when it was parsed.
+# Library.from_path returns independent copies of them (see _detached).
+_PARSED: Dict[Tuple[int, int], Tuple[Tuple[int, int], 'Library']] = {}
+
+# Threads asking for a file being parsed wait for the result of that parse
+_PARSING = SingleFlight()
+
+# Default bound on the bytes of the pages read to parse a file. Parses only
+# read the headers, dynamic segment, version tables and strings of objects,
+# a few pages even for libraries of several GB.
+READ_BUDGET = 64 * 2**20
+
+
 class Library:
     """
     Relevant ELF header fields used in the dynamic linking of libraries
     """
 
     @classmethod
-    def from_path(cls, path: Union[str, Path]):
-        library = cls()
+    def from_path(cls,
+                  path: Union[str, Path],
+                  budget: Optional[int] = READ_BUDGET):
+        """
+        -> Library
+        Every file is parsed once: paths leading to an already parsed file,
+        through symbolic links or not, reuse the result of the first parse,
+        including from other threads
+
+        Files are read through a memory mapping, touching only the pages of
+        the data involved in dynamic linking; objects requiring more than
+        budget bytes of them are reported as errors, as invalid files are
+        (see elf.MappedFile). Such parses are not kept: the file is parsed
+        again by the next call.
+        """
+        stat = os.stat(path)
+        inode = (stat.st_dev, stat.st_ino)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        parsed_here = []
+
+        def _parse_once():
+            # Another thread may have completed the parse in the meantime
+            cached = _PARSED.get(inode)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+            parsed, complete = cls.__parse(path, budget)
+            parsed.inode = inode
+            # A parse stopped by the budget does not hold for other budgets
+            if complete:
+                _PARSED[inode] = (version, parsed)
+            parsed_here.append(parsed)
+            return parsed
+
+        cached = _PARSED.get(inode)
+        if cached is not None and cached[0] == version:
+            parsed = cached[1]
+        else:
+            parsed = _PARSING.do((inode, budget), _parse_once)
 
-        with open(path, 'rb') as file:
-            try:
-                for section in ELFFile(file).iter_sections():
-                    if isinstance(section, GNUVerDefSection):
-                        library.__parse_ver_def(section)
-                    elif isinstance(section, GNUVerNeedSection):
-                        library.__parse_ver_need(section)
-                    elif isinstance(section, DynamicSection):
-                        library.__parse_dynamic(section)
-                library.binary_path = getattr(file, 'name', file)
-            except (ELFError, AttributeError) as err:
-                logging.error("Error parsing '%s' for ELF data: %s",
-                              getattr(file, 'name', file), err)
+        if PROFILER.enabled and not parsed_here:
+            PROFILER.count(ELF_REUSED)
+
+        library = _detached(parsed)
+        library.fingerprint = (stat.st_size, stat.st_mtime_ns)
+
+        if library.binary_path is not None:
+            library.binary_path = str(path)
 
         if not library.soname:
             library.soname = Path(path).name
 
         return library
 
+    @classmethod
+    def from_elf(cls, elf: ElfObject):
+        """
+        -> Library
+        Build a library from an object read with its version tables, as
+        elf.classify and elf.scan return with versions, without opening the
+        file again. The result is not added to the parse cache; its
+        fingerprint is taken from the status of the file read, if known.
+        """
+        library = cls()
+        library._load(elf)
+
+        if elf.stat is not None:
+            library.inode = (elf.stat.st_dev, elf.stat.st_ino)
+            library.fingerprint = (elf.stat.st_size, elf.stat.st_mtime_ns)
+
+        if not library.soname:
+            library.soname = Path(elf.path).name
+
+        return library
+
+    def _load(self, elf: ElfObject):
+        """
+        Set the attributes of the library from those of elf
+        """
+        self.arch_flags = Flags.from_machine(elf.header.elf_class,
+                                             elf.header.machine,
+                                             elf.header.flags)
+        self.soname = elf.soname or ''
+        self.needed = elf.needed
+        self.dyn_dependencies = set(elf.needed)
+        self.rpath = elf.rpath
+        self.runpath = elf.runpath
+        self.defined_versions = elf.defined_versions
+        self.required_versions = elf.required_versions
+        self.binary_path = elf.path
+
+    @classmethod
+    def clear_cache(cls):
+        """
+        Forget the libraries parsed so far
+        """
+        _PARSED.clear()
+
+    @classmethod
+    def __parse(cls, path: Union[str, Path],
+                budget: Optional[int]) -> Tuple['Library', bool]:
+        """
+        -> (Library, False if the parse was stopped by the budget)
+        """
+        library = cls()
+        complete = True
+        start = perf_counter() if PROFILER.enabled else None
+
+        with MappedFile(path, budget) as file:
+            try:
+                elf = read_object(file, versions=True)
+            except ElfFormatError as err:
+                complete = not isinstance(err, ElfBudgetError)
+                logging.error("Error parsing '%s' for ELF data: %s",
+                              file.name, err)
+            else:
+                library._load(elf)
+
+        if start is not None:
+            PROFILER.parse(str(path), perf_counter() - start,
+                           file.bytes_touched)
+
+        return library, complete
+
     def __init__(self):
         self.soname = ''
         self.dyn_dependencies = set()
+        self.needed = []
         self.required_versions = {}
         self.defined_versions = set()
 
         self.rpath = []
         self.runpath = []
         self.binary_path = None
+        self.inode: Optional[Tuple[int, int]] = None
+        # (size, modification time in ns) of the file when it was read
+        self.fingerprint: Optional[Tuple[int, int]] = None
+        # Cache flags of the object's architecture, read from its header
+        self.arch_flags: Optional[int] = None
 
-    def __parse_dynamic(self, section):
-
-        def __fetch_tags(id_):
-            return list(
-                filter(lambda x: x.entry.d_tag == id_, section.iter_tags()))
-
-        tags = __fetch_tags('DT_SONAME')
-        if len(tags) == 1:
-            self.soname = tags[0].soname
-
-        tags = __fetch_tags('DT_RPATH')
-        if len(tags) == 1:
-            self.rpath = tags[0].rpath.split(':')
+    @property
+    def defined_versions(self) -> Set[str]:
+        return self._defined_versions
 
-        tags = __fetch_tags('DT_RUNPATH')
-        if len(tags) == 1:
-            self.runpath = tags[0].runpath.split(':')
+    @defined_versions.setter
+    def defined_versions(self, versions: Iterable[str]):
+        """
+        The bitset of defined versions is computed on assignment: modifying
+        the set in place does not update it
+        """
+        self._defined_versions = set(versions)
+        self.defined_mask = VERSIONS.mask(self._defined_versions)
 
-        tags = __fetch_tags('DT_NEEDED')
-        self.dyn_dependencies = {tag.needed for tag in tags}
+    @property
+    def required_versions(self) -> Dict[str, Set[str]]:
+        return self._required_versions
 
-    def __parse_ver_def(self, section):
-        self.defined_versions = {
-            next(v_iter).name
-            for _, v_iter in section.iter_versions()
+    @required_versions.setter
+    def required_versions(self, versions: Dict[str, Iterable[str]]):
+        """
+        The bitsets of required versions are computed on assignment:
+        modifying the dictionary in place does not update them
+        """
+        self._required_versions = {
+            soname: set(names)
+            for soname, names in versions.items()
+        }
+        self.required_masks = {
+            soname: VERSIONS.mask(names)
+            for soname, names in self._required_versions.items()
         }
+        self.required_mask = 0
+        for mask in self.required_masks.values():
+            self.required_mask |= mask
 
-    def __parse_ver_need(self, section):
-        needed = {}
+    def __getstate__(self):
+        """
+        Version bitsets refer to the VERSIONS table of the process: they are
+        left out of the pickled state and computed again when loading it
+        """
+        state = dict(self.__dict__)
+        for name in ('defined_mask', 'required_masks', 'required_mask'):
+            state.pop(name, None)
+        return state
 
-        for ver, v_iter in section.iter_versions():
-            needed[ver.name] = {ver.name for ver in v_iter}
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.defined_versions = state.get('_defined_versions', set())
+        self.required_versions = state.get('_required_versions', {})
 
-        self.required_versions = needed
+    def __copy__(self):
+        # Copies stay in the process: the bitsets are valid as they are
+        library = type(self).__new__(type(self))
+        library.__dict__.update(self.__dict__)
+        return library
 
     def __hash__(self):
         """
@@ -103,7 +328,7 @@ class Library:
 
     def __eq__(self, other):
         if isinstance(other, Library):
-            return self.soname == other.soname and self.defined_versions == other.defined_versions
+            return self.soname == other.soname and self.defined_mask == other.defined_mask
         return NotImplemented
 
     def __gt__(self, rhs):
@@ -115,11 +340,159 @@ class Library:
         return f"'{self.soname}' from '{self.binary_path}'"
 
 
+def _detached(library: Library) -> Library:
+    """
+    -> Library
+    Copy of library that can be modified in place without altering it: its
+    containers are copied as well. The bitsets stay valid as they are.
+    """
+    copied = copy.copy(library)
+
+    copied.dyn_dependencies = set(library.dyn_dependencies)
+    copied.needed = list(library.needed)
+    copied.rpath = list(library.rpath)
+    copied.runpath = list(library.runpath)
+    copied._defined_versions = set(library.defined_versions)
+    copied._required_versions = {
+        soname: set(names)
+        for soname, names in library.required_versions.items()
+    }
+    copied.required_masks = dict(library.required_masks)
+
+    return copied
+
+
+def _library_flags(library: Library) -> Optional[int]:
+    # Libraries not parsed from a file, such as the ones of snapshots, have
+    # their architecture read from their path when needed
+    if library.arch_flags is None and library.binary_path:
+        library.arch_flags = object_flags(library.binary_path)
+    return library.arch_flags
+
+
+class _SetIndex(NamedTuple):
+    by_soname: Dict[str, List[Library]]
+    defined: int
+    required: int
+    dependencies: Set[str]
+
+
+class _Resolution:
+    """
+    State of the resolution of the dependencies of a set, advanced one step
+    at a time by LibrarySet._resolution and the asyncio resolver, so that
+    both resolve in the same way
+
+    Every step looks up the sonames missing from the superset with the paths
+    the superset had when the step began, then adds the libraries found: the
+    RPATH and RUNPATH of a library are searched from the next step on, even
+    by a resolver adding libraries during the step. The resolution is over
+    when a step does not change the missing sonames.
+    """
+
+    def __init__(self, libraries, superset, lookup=None):
+        # lookup(soname, rpath=, runpath=) returns the path of a soname, by
+        # default linker.resolve for the architecture of libraries
+        if lookup is None:
+            lookup = partial(resolve, arch_flags=libraries.arch_flags())
+
+        self.superset = superset
+        self.lookup = lookup
+        self.missing = superset.missing_libraries
+        self.running = True
+        self.generated = set()
+        self.rpath: List[str] = []
+        self.runpath: List[str] = []
+
+    def step(self) -> List[str]:
+        """
+        -> list(str)
+        Begin a step, and return the sonames to look up
+        """
+        if PROFILER.enabled:
+            PROFILER.count(ITERATIONS)
+
+        self.rpath = self.superset.rpath
+        self.runpath = self.superset.runpath
+        return sorted(self.missing)
+
+    def search(self, soname: str):
+        """
+        -> Path or None
+        Look soname up with the paths of the superset as the step began
+        """
+        path = self.lookup(soname, rpath=self.rpath, runpath=self.runpath)
+        logging.debug("Got path: %s", path)
+        return path
+
+    def add(self, library) -> bool:
+        """
+        -> bool
+        Add a library found during the step to the superset; True if its
+        soname was not found before
+        """
+        self.superset.add(library)
+
+        # A link named after a soname can lead to an object with a different
+        # one: it is looked up again at every step
+        if library.soname in self.generated:
+            return False
+
+        self.generated.add(library.soname)
+        return True
+
+    def end_step(self):
+        missing = self.superset.missing_libraries
+        self.running = missing != self.missing
+        self.missing = missing
+
+
+def _invalidates(method):
+    """
+    Wrap a set method modifying the set to drop the cached index
+    """
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._index = None
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
 class LibrarySet(set):
     """
     Set-like object to collect Libray objects
+
+    Queries rely on an index of the members, built on first use and dropped
+    when the set is modified. The index does not follow changes made to the
+    members themselves: members must not be modified once in a set, or
+    invalidate must be called after modifying them.
     """
 
+    _index = None
+
+    remove = _invalidates(set.remove)
+    discard = _invalidates(set.discard)
+    pop = _invalidates(set.pop)
+    clear = _invalidates(set.clear)
+    update = _invalidates(set.update)
+    difference_update = _invalidates(set.difference_update)
+    intersection_update = _invalidates(set.intersection_update)
+    symmetric_difference_update = _invalidates(
+        set.symmetric_difference_update)
+    __ior__ = _invalidates(set.__ior__)
+    __iand__ = _invalidates(set.__iand__)
+    __isub__ = _invalidates(set.__isub__)
+    __ixor__ = _invalidates(set.__ixor__)
+
+    def __reduce__(self):
+        # The index holds version bitsets, specific to the process; before
+        # Python 3.11, set.__reduce__ pickles __dict__ without __getstate__
+        state = dict(self.__dict__)
+        state.pop('_index', None)
+        return (type(self), (list(self), ), state)
+
     @classmethod
     def create_from(cls, library_list):
         """
@@ -178,8 +551,39 @@ class LibrarySet(set):
         if len(conflict) == 1:
             self.discard(conflict.pop())
 
+        self._index = None
         super().add(elem)
 
+    def invalidate(self):
+        """
+        Drop the index of the set, for the members modified in place to be
+        indexed again by the next query
+        """
+        self._index = None
+
+    @property
+    def index(self) -> _SetIndex:
+        """
+        -> _SetIndex
+        Members by soname, unions of their version bitsets and of their
+        dependencies
+        """
+        if self._index is None:
+            by_soname = {}
+            defined = required = 0
+            dependencies = set()
+
+            for lib in self:
+                by_soname.setdefault(lib.soname, []).append(lib)
+                defined |= lib.defined_mask
+                required |= lib.required_mask
+                dependencies.update(lib.dyn_dependencies)
+
+            self._index = _SetIndex(by_soname, defined, required,
+                                    dependencies)
+
+        return self._index
+
     @property
     def rpath(self):
         """
@@ -198,13 +602,11 @@ class LibrarySet(set):
 
     @property
     def defined_versions(self):
-        return set(flatten(map(lambda x: x.defined_versions, self)))
+        return VERSIONS.decode(self.index.defined)
 
     @property
     def required_versions(self):
-        return set(
-            flatten(flatten(map(lambda x: x.required_versions.values(),
-                                self))))
+        return VERSIONS.decode(self.index.required)
 
     @property
     def top_level(self):
@@ -222,8 +624,9 @@ class LibrarySet(set):
         Returns a set of all linkers present in the set.
         The linker is identified by its static-ness and definition of private GLIB symbols.
         """
+        glib = self.glib
         return LibrarySet(
-            filter(lambda x: not x.dyn_dependencies and x in self.glib, self))
+            filter(lambda x: not x.dyn_dependencies and x in glib, self))
 
     @property
     def glib(self):
@@ -233,12 +636,10 @@ class LibrarySet(set):
         recognizable by the GLIBC_PRIVATE symbols. Using these with any
         other libc will trigger a symbol error.
         """
-
-        def references_private(lib):
-            return 'GLIBC_PRIVATE' in flatten(lib.required_versions.values(
-            )) or 'GLIBC_PRIVATE' in lib.defined_versions
-
-        return LibrarySet(filter(references_private, self))
+        return LibrarySet(
+            filter(
+                lambda x: (x.defined_mask | x.required_mask) & GLIBC_PRIVATE,
+                self))
 
     @property
     def required_libraries(self):
@@ -247,8 +648,8 @@ class LibrarySet(set):
         Returns a set of all libraries included in self that are depended
         upon from another library in the set
         """
-        sonames = set(flatten(map(lambda x: x.dyn_dependencies, self)))
-        return LibrarySet(filter(lambda x: x.soname in sonames, self))
+        dependencies = self.index.dependencies
+        return LibrarySet(filter(lambda x: x.soname in dependencies, self))
 
     @property
     def sonames(self):
@@ -256,7 +657,7 @@ class LibrarySet(set):
         -> set(str)
         Returns a set with the sonames of all the libraries in self
         """
-        return set(map(lambda x: x.soname, self))
+        return set(self.index.by_soname)
 
     @property
     def missing_libraries(self):
@@ -265,8 +666,7 @@ class LibrarySet(set):
         Returns a set with the sonames of all the dependencies of the set's
         libraries not present in self
         """
-        req_sonames = set(flatten(map(lambda x: x.dyn_dependencies, self)))
-        return req_sonames - self.sonames
+        return self.index.dependencies - self.index.by_soname.keys()
 
     @property
     def outdated_libraries(self):
@@ -276,21 +676,18 @@ class LibrarySet(set):
         the other libraries
         """
         outdated = LibrarySet()
+        by_soname = self.index.by_soname
 
         for library in self:
-            for _soname, required in library.required_versions.items():
-                matches = set()
-
-                for obj in self:
-                    if obj.soname == _soname:
-                        matches.add(obj)
+            for soname, required in library.required_masks.items():
+                matches = by_soname.get(soname, [])
 
                 if len(matches) != 1:
                     continue
 
-                dependency = matches.pop()
+                dependency = matches[0]
 
-                if required > dependency.defined_versions:
+                if required & ~dependency.defined_mask:
                     outdated.add(dependency)
 
         return outdated
@@ -302,17 +699,75 @@ class LibrarySet(set):
         Returns True if all the dependencies are resolved
         """
         return (len(self.missing_libraries) == 0
-                and self.required_versions.issubset(self.defined_versions))
+                and not self.index.required & ~self.index.defined)
+
+    @property
+    def load_order(self):
+        """
+        -> list(Library)
+        Returns the libraries in the order the dynamic linker loads them:
+        breadth-first along the dependencies, starting from the top-level
+        libraries
+        """
+        by_soname = self.index.by_soname
+
+        return [
+            lib for soname in self.graph().load_order()
+            for lib in by_soname.get(soname, [])
+        ]
+
+    def graph(self):
+        """
+        -> DependencyGraph
+        Returns the dependency graph of the set's libraries
+        """
+        return DependencyGraph.from_libraries(self)
+
+    def unresolved_symbols(self):
+        """
+        -> dict(str: set(str))
+        Returns, for each library, the undefined non-weak symbols no library
+        of the set defines, searching the set in load order as the dynamic
+        linker does. Libraries with all their symbols bound are omitted.
+        """
+        libraries = [lib for lib in self.load_order if lib.binary_path]
+        sonames = {lib.binary_path: lib.soname for lib in libraries}
+
+        with Scope.from_paths([lib.binary_path for lib in libraries]) as scope:
+            return {
+                sonames[path]: symbols
+                for path, symbols in scope.unresolved().items()
+            }
 
     def find(self, soname):
         """
         -> Library or None
-        Returns the matching library if found in self, else None
+        Returns the matching library if found in self, else None; a library
+        whose soname starts with the given one matches
+        """
+        matches = self.index.by_soname.get(soname)
+        if matches:
+            return matches[0]
+
+        return next((lib for lib in self if lib.soname.startswith(soname)),
+                    None)
+
+    def arch_flags(self):
+        """
+        -> Flags or None
+        Returns the flags of the dynamic linker cache entries matching the
+        architecture of the set's libraries, or None if it is mixed
         """
-        query = re.escape(soname)
-        matches = set(filter(lambda x: re.match(query, x.soname), self))
+        # Calculate all flags and boil them down in a set, filtering out Nones
+        search_flags = {_library_flags(lib) for lib in self}
+        valid_flags = set(filter(None, search_flags))
+        if len(valid_flags) == 1:
+            return list(valid_flags)[0]
 
-        return matches.pop() if matches else None
+        logging.debug(
+            "Resolving dependencies of a set with mixed architectures (%s) !",
+            ",".join(map(str, valid_flags)))
+        return None
 
     def resolve(self, rpath=None, runpath=None):
         """
@@ -324,53 +779,119 @@ class LibrarySet(set):
         be found by e4s-cl
         """
         superset = LibrarySet(self)
-        arch_flags = None
 
-        # Assert all libraries are from the same architecture and store the
-        # appropriate flag in arch_flag
-        # Calculate all flags and boil them down in a set, filtering out Nones
-        search_flags = {Flags.expected_flags(lib.binary_path) for lib in self}
-        valid_flags = set(filter(None, search_flags))
-        if len(valid_flags) == 1:
-            arch_flags = list(valid_flags)[0]
-        else:
-            logging.debug(
-                "Resolving dependencies of a set with mixed architectures (%s) !",
-                ",".join(valid_flags))
+        for _ in self._resolution(superset):
+            pass
+
+        return superset
+
+    def resolve_iter(self):
+        """
+        -> Iterator[Library]
+        Generates the libraries resolving the dependencies of the set's
+        members, as they are found; self is not modified
+        """
+        return self._resolution(LibrarySet(self))
+
+    def architectures(self):
+        """
+        -> dict(Flags or None, LibrarySet)
+        Groups the set's members by the cache flags of their architecture;
+        members of unknown architecture are grouped under None
+        """
+        groups = {}
+
+        for library in self:
+            groups.setdefault(_library_flags(library),
+                              LibrarySet()).add(library)
 
-        missing = superset.missing_libraries
-        change = True
+        return groups
 
-        while change:
-            for soname in missing:
-                path = resolve(soname,
-                               rpath=superset.rpath,
-                               runpath=superset.runpath,
-                               arch_flags=arch_flags)
-                logging.debug(f"Got path: {path}")
+    def resolve_architectures(self):
+        """
+        -> dict(Flags or None, LibrarySet)
+        Resolve the dependencies of every architecture of the set in one
+        pass: the members of each group of architectures() are resolved
+        against the cache entries and system directories of their
+        architecture, skipping the objects of other ones as the dynamic linker
+        does. The groups share the listings of the searched directories and
+        the parsed libraries.
+        """
+        closures = {}
+
+        for arch_flags, members, lookup in self._architecture_lookups():
+            superset = LibrarySet(members)
+            for _ in members._resolution(superset, lookup):
+                pass
+
+            closures[arch_flags] = superset
+
+        return closures
+
+    def _architecture_lookups(self):
+        """
+        -> list((Flags or None, LibrarySet, lookup or None))
+        The groups of architectures(), with the lookup resolving their
+        dependencies; the lookups share a DirectoryIndex
+        """
+        index = DirectoryIndex()
+        groups = []
+
+        for arch_flags, members in self.architectures().items():
+            lookup = None
+            if arch_flags is not None:
+                lookup = partial(resolve_arch,
+                                 arch_flags=arch_flags,
+                                 index=index)
+            groups.append((arch_flags, members, lookup))
+
+        return groups
+
+    def _resolution(self, superset, lookup=None):
+        """
+        Resolve the dependencies of the members of superset, adding them to
+        it and generating them as they are found. lookup(soname, rpath=,
+        runpath=) returns the path of a soname, by default linker.resolve for
+        the architecture of the set.
+        """
+        state = _Resolution(self, superset, lookup)
+
+        while state.running:
+            for soname in state.step():
+                path = state.search(soname)
 
                 if not path:
                     continue
 
-                superset.add(Library.from_path(path))
+                library = Library.from_path(path)
+                if state.add(library):
+                    yield library
 
-            change = superset.missing_libraries != missing
-            missing = superset.missing_libraries
+            state.end_step()
 
-        return superset
+    def ldd_entries(self):
+        """
+        -> Iterator[(str, str or None)]
+        Generates the soname and path of the set's libraries and of their
+        missing dependencies, sorted by soname; the path of missing
+        libraries is None
+        """
+        by_soname = self.index.by_soname
+
+        for soname in sorted(by_soname.keys() | self.index.dependencies):
+            matches = by_soname.get(soname)
+            yield soname, matches[0].binary_path if matches else None
+
+    def ldd_lines(self):
+        """
+        -> Iterator[str]
+        Generates the lines of ldd_format
+        """
+        for soname, path in self.ldd_entries():
+            yield f"\t{soname} => {path or 'not found'}"
 
     def ldd_format(self):
         """
         -> list(str)
         """
-
-        def line(soname: str):
-            lib = self.find(soname)
-            if lib and lib.binary_path:
-                return "\t%(soname)s => %(binary_path)s" % lib.__dict__
-            return f"\t{soname} => not found"
-
-        lines = list(map(line, set.union(self.sonames,
-                                         self.missing_libraries)))
-        lines.sort()
-        return lines
+        return list(self.ldd_lines())
@@ -4,48 +4,177 @@ Rules in ld.so(8)
 """
 
 import os
+import logging
 from typing import (
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
     List,
+    NamedTuple,
     Optional,
+    Sequence,
     Tuple,
+    Union,
 )
-from functools import lru_cache
 from pathlib import Path
-from sotools.dl_cache import cache_libraries
+from time import perf_counter
+from sotools.caching import memoize
+from sotools.dl_cache import search_cache
 from sotools.dl_cache.flags import Flags
-import logging
+from sotools.elf import ElfFormatError, classify
+from sotools.hwcaps import HWCAPS_DIRECTORY, supported_hwcaps
+from sotools.profiling import (
+    PROFILER,
+    CACHE_HIT,
+    CACHE_MISS,
+    SCANDIR,
+    STAT,
+)
+from sotools.trace import (
+    TRACER,
+    CacheHit,
+    CacheSearch,
+    Found,
+    NotFound,
+    Probe,
+    SearchPath,
+    SearchStart,
+)
 
 DEFAULT_PATHS = ['/lib', '/usr/lib', '/lib64', '/usr/lib64']
 
+# System directories of the architectures sharing a multilib system, by
+# cache flags, searched before DEFAULT_PATHS when looking for objects of a
+# given architecture: the directories of glibc's SYSTEM_DIRS, then the
+# multilib and multiarch ones of common distributions
+ARCH_PATHS = {
+    Flags.FLAG_X8664_LIB64 | Flags.FLAG_ELF_LIBC6: [
+        '/lib64', '/usr/lib64', '/lib/x86_64-linux-gnu',
+        '/usr/lib/x86_64-linux-gnu'
+    ],
+    Flags.FLAG_X8664_LIBX32 | Flags.FLAG_ELF_LIBC6: [
+        '/libx32', '/usr/libx32', '/lib/x86_64-linux-gnux32',
+        '/usr/lib/x86_64-linux-gnux32'
+    ],
+    Flags.FLAG_ELF_LIBC6: [
+        '/lib', '/usr/lib', '/lib32', '/usr/lib32', '/lib/i386-linux-gnu',
+        '/usr/lib/i386-linux-gnu'
+    ],
+    Flags.FLAG_AARCH64_LIB64 | Flags.FLAG_ELF_LIBC6: [
+        '/lib64', '/usr/lib64', '/lib/aarch64-linux-gnu',
+        '/usr/lib/aarch64-linux-gnu'
+    ],
+    Flags.FLAG_POWERPC_LIB64 | Flags.FLAG_ELF_LIBC6: [
+        '/lib64', '/usr/lib64', '/lib/powerpc64le-linux-gnu',
+        '/usr/lib/powerpc64le-linux-gnu'
+    ],
+}
+
 
 class LinkingError(Exception):
     pass
 
 
-@lru_cache()
-def _linker_path() -> Tuple[List[str], List[str]]:
+class Candidate(NamedTuple):
+    """
+    Object matching a soname, and the search step it was found by: 'RPATH',
+    'LD_LIBRARY_PATH', 'RUNPATH', 'CACHE' or 'SYSTEM'
+    """
+    path: Path
+    reason: str
+
+
+@memoize
+def _linker_path() -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
     """
     Return linker search paths, in order
     Sourced from `man ld.so`
     """
-    ld_library_path = list(
+    ld_library_path = tuple(
         filter(
             None,
             os.environ.get('LD_LIBRARY_PATH', "").split(':'),
         ))
 
-    return (ld_library_path, DEFAULT_PATHS)
+    return (ld_library_path, tuple(DEFAULT_PATHS))
 
 
 def _valid(path: Path) -> bool:
     """Check a path is an existing directory"""
+    if PROFILER.enabled:
+        PROFILER.count(STAT)
     return path.is_dir()
 
 
+class DirectoryIndex:
+    """
+    Contents of the searched directories, listed on first use
+
+    Resolving many sonames against the same directories with an index
+    replaces the probes of missing files by set lookups: only the files
+    present in a listing are tested for existence.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Path, Optional[FrozenSet[str]]] = {}
+
+    def entries(self, directory: Path) -> Optional[FrozenSet[str]]:
+        """
+        Names in the directory, or None if it cannot be listed
+        """
+        if directory not in self._entries:
+            if PROFILER.enabled:
+                PROFILER.count(SCANDIR)
+            try:
+                with os.scandir(directory) as iterator:
+                    names = frozenset(entry.name for entry in iterator)
+            except OSError:
+                names = None
+            self._entries[directory] = names
+
+        return self._entries[directory]
+
+    def is_dir(self, directory: Path) -> bool:
+        return self.entries(directory) is not None
+
+    def may_exist(self, path: Path) -> bool:
+        entries = self.entries(path.parent)
+        return entries is not None and path.name in entries
+
+
+def _candidates(
+    soname: str,
+    dir_: Path,
+    hwcaps: Sequence[str],
+    index: Optional[DirectoryIndex] = None,
+) -> Iterator[Path]:
+    """
+    Generate the paths to probe for a soname in a directory, in order: the
+    supported glibc-hwcaps subdirectories by decreasing priority, then the
+    directory itself
+    """
+    if hwcaps:
+        hwcaps_dir = Path(dir_, HWCAPS_DIRECTORY)
+        if index is not None:
+            present = index.is_dir(hwcaps_dir)
+        else:
+            if PROFILER.enabled:
+                PROFILER.count(STAT)
+            present = hwcaps_dir.is_dir()
+        if present:
+            for subdirectory in hwcaps:
+                yield Path(hwcaps_dir, subdirectory, soname)
+
+    yield Path(dir_, soname)
+
+
 def _search_paths(
     soname: str,
     paths: List[Path],
     reason: str = "",
+    hwcaps: Optional[Sequence[str]] = None,
+    index: Optional[DirectoryIndex] = None,
 ) -> Optional[Path]:
     """
     Search a list of paths for a given soname and return the first match
@@ -53,16 +182,27 @@ def _search_paths(
     soname:     The library name to search
     paths:      The list of paths to look into
     reason:     To mimic LD_DEBUG, optional reason of the search
+    hwcaps:     glibc-hwcaps subdirectories to probe, most preferred first;
+                defaults to the ones supported by the current CPU
+    index:      listings of the directories, to skip missing files
     """
-    if paths:
-        path_list_str = os.pathsep.join(map(lambda x: x.as_posix(), paths))
-        logging.debug(f"search path={path_list_str}\t\t({reason or ''})")
+    if hwcaps is None:
+        hwcaps = supported_hwcaps()
+
+    if paths and TRACER.enabled:
+        TRACER.emit(
+            SearchPath(tuple(map(lambda x: x.as_posix(), paths)), reason))
 
-    for dir_ in filter(_valid, paths):
-        potential_lib = Path(dir_, soname)
-        logging.debug(f"trying file={potential_lib.as_posix()}")
-        if potential_lib.exists():
-            return potential_lib
+    for dir_ in filter(index.is_dir if index else _valid, paths):
+        for potential_lib in _candidates(soname, dir_, hwcaps, index):
+            if TRACER.enabled:
+                TRACER.emit(Probe(potential_lib.as_posix()))
+            if index is not None and not index.may_exist(potential_lib):
+                continue
+            if PROFILER.enabled:
+                PROFILER.count(STAT)
+            if potential_lib.exists():
+                return potential_lib
 
     return None
 
@@ -73,6 +213,8 @@ def resolve(
     runpath: Optional[List[str]] = None,
     arch_flags: Optional[Flags] = None,
     absolute: bool = False,
+    hwcaps: Optional[Sequence[str]] = None,
+    index: Optional[DirectoryIndex] = None,
 ) -> Optional[Path]:
     """
     Get a path towards a library from a given soname.
@@ -84,11 +226,16 @@ def resolve(
     arch_flags: flags to look for; useful for 32bit libraries on 64bit systems
                 See sotools.dl_cache.flags.Flags for info
     absolute:   output an absolute path to the final object if a link is found
+    hwcaps:     glibc-hwcaps subdirectories to consider, most preferred first;
+                defaults to the ones supported by the current CPU
+    index:      DirectoryIndex listing the searched directories once, to
+                share between lookups
 
     The method will return a resolved path for the given soname or None if
     no matching entry could be found.
     """
 
+    start = perf_counter() if PROFILER.enabled else None
     found = None
 
     def _found() -> bool:
@@ -97,14 +244,15 @@ def resolve(
 
     rpath = list(map(Path, list(rpath or [])))
     runpath = list(map(Path, list(runpath or [])))
-    cache_entries = cache_libraries(arch_flags=arch_flags)
-    system_path = map(Path, _linker_path()[1])
+    if hwcaps is None:
+        hwcaps = supported_hwcaps()
 
     env_path, system_path = _linker_path()
     env_path = list(map(Path, env_path))
     system_path = list(map(Path, system_path))
 
-    logging.debug(f"find library={soname}; searching")
+    if TRACER.enabled:
+        TRACER.emit(SearchStart(soname))
 
     dynamic_paths = [
         (rpath, 'RPATH'),
@@ -115,26 +263,263 @@ def resolve(
     # First, search the paths that are set by the user at run-time
     for paths, name in dynamic_paths:
         if not _found() and paths:
-            found = _search_paths(soname, paths, name)
+            found = _search_paths(soname, paths, name, hwcaps, index)
 
     # Query the cache for a match
     if not _found():
-        logging.debug("search cache=/etc/ld.so.cache")
-        if soname in cache_entries:
-            found = Path(cache_entries[soname])
+        if TRACER.enabled:
+            TRACER.emit(CacheSearch("/etc/ld.so.cache"))
+        cached = search_cache(soname, arch_flags=arch_flags, hwcaps=hwcaps)
+        if cached:
+            found = Path(cached)
+            if TRACER.enabled:
+                TRACER.emit(CacheHit(soname, cached))
+        if start is not None:
+            PROFILER.count(CACHE_HIT if cached else CACHE_MISS)
 
     default_paths = [(system_path, 'SYSTEM')]
 
     # Finally, search the hardcoded system paths
     for tuple_ in default_paths:
         if not _found():
-            found = _search_paths(soname, *tuple_)
+            found = _search_paths(soname, *tuple_, hwcaps=hwcaps, index=index)
 
     if _found():
-        logging.debug(f"found matching library={found}")
         if absolute:
             found = found.resolve()
-            logging.debug(f"-> link to library={found}")
+        if TRACER.enabled:
+            TRACER.emit(Found(soname, found.as_posix()))
+        if start is not None:
+            PROFILER.lookup(soname, perf_counter() - start)
         return found
 
+    if TRACER.enabled:
+        TRACER.emit(NotFound(soname))
+    if start is not None:
+        PROFILER.lookup(soname, perf_counter() - start)
+
     return None
+
+
+def resolve_all(
+    sonames: Iterable[str],
+    rpath: Optional[List[str]] = None,
+    runpath: Optional[List[str]] = None,
+    arch_flags: Optional[Flags] = None,
+    absolute: bool = False,
+    hwcaps: Optional[Sequence[str]] = None,
+) -> Iterator[Tuple[str, Optional[Path]]]:
+    """
+    Resolve many sonames with the same search parameters, generating
+    (soname, path or None) pairs as they are resolved
+
+    The cache is parsed once and every directory searched is listed once for
+    all the lookups. Files added to the directories while iterating may not
+    be found.
+    """
+    index = DirectoryIndex()
+    if hwcaps is None:
+        hwcaps = supported_hwcaps()
+
+    for soname in sonames:
+        yield soname, resolve(soname,
+                              rpath=rpath,
+                              runpath=runpath,
+                              arch_flags=arch_flags,
+                              absolute=absolute,
+                              hwcaps=hwcaps,
+                              index=index)
+
+
+def resolve_candidates(
+    soname: str,
+    rpath: Optional[List[str]] = None,
+    runpath: Optional[List[str]] = None,
+    arch_flags: Optional[Flags] = None,
+    hwcaps: Optional[Sequence[str]] = None,
+    index: Optional[DirectoryIndex] = None,
+) -> List[Candidate]:
+    """
+    Find every object matching soname along the search order of resolve,
+    instead of stopping at the first one: the first candidate is the object
+    resolve returns, the others are shadowed by it. A path found by several
+    steps is only reported for the first one.
+
+    Existence is checked against the listings of index, which is created if
+    not given: share it to list every directory once across many lookups.
+    """
+    return _find_candidates(soname, rpath, runpath, arch_flags, hwcaps, index,
+                            _linker_path()[1])
+
+
+def _find_candidates(
+    soname: str,
+    rpath: Optional[List[str]],
+    runpath: Optional[List[str]],
+    arch_flags: Optional[Flags],
+    hwcaps: Optional[Sequence[str]],
+    index: Optional[DirectoryIndex],
+    system_path: Sequence[str],
+) -> List[Candidate]:
+    """
+    resolve_candidates, searching system_path after the cache
+    """
+    if hwcaps is None:
+        hwcaps = supported_hwcaps()
+
+    if index is None:
+        index = DirectoryIndex()
+
+    found: Dict[Path, Candidate] = {}
+
+    def _search(paths: Iterable[str], reason: str):
+        for dir_ in filter(index.is_dir, map(Path, paths)):
+            for path in _candidates(soname, dir_, hwcaps, index):
+                if path in found or not index.may_exist(path):
+                    continue
+                if PROFILER.enabled:
+                    PROFILER.count(STAT)
+                if path.is_file():
+                    found[path] = Candidate(path, reason)
+
+    for paths, reason in _search_steps(rpath, runpath, system_path):
+        if paths is not None:
+            _search(paths, reason)
+            continue
+
+        cached = search_cache(soname, arch_flags=arch_flags, hwcaps=hwcaps)
+        if cached and Path(cached) not in found:
+            found[Path(cached)] = Candidate(Path(cached), 'CACHE')
+
+    return list(found.values())
+
+
+def _search_steps(
+    rpath: Optional[List[str]],
+    runpath: Optional[List[str]],
+    system_path: Sequence[str],
+) -> List[Tuple[Optional[Sequence[str]], str]]:
+    """
+    The steps of the search order, as (directories, reason); the cache
+    lookup has no directories
+    """
+    env_path, _ = _linker_path()
+
+    return [
+        (rpath or [], 'RPATH'),
+        (env_path, 'LD_LIBRARY_PATH'),
+        (runpath or [], 'RUNPATH'),
+        (None, 'CACHE'),
+        (system_path, 'SYSTEM'),
+    ]
+
+
+def search_directories(
+    rpath: Optional[List[str]] = None,
+    runpath: Optional[List[str]] = None,
+    arch_flags: Optional[Flags] = None,
+    hwcaps: Optional[Sequence[str]] = None,
+) -> List[Tuple[Optional[str], str]]:
+    """
+    The directories searched for objects, in search order, as (directory,
+    reason) with the reasons of Candidate: the glibc-hwcaps subdirectories
+    of each directory come before it, and the cache lookup appears as
+    (None, 'CACHE'). The system directories are the ones of the
+    architecture, searched by resolve_arch, which include the ones searched
+    by resolve (see system_paths).
+    """
+    if hwcaps is None:
+        hwcaps = supported_hwcaps()
+
+    order: List[Tuple[Optional[str], str]] = []
+
+    for paths, reason in _search_steps(rpath, runpath,
+                                       system_paths(arch_flags)):
+        if paths is None:
+            order.append((None, reason))
+            continue
+
+        for directory in paths:
+            order.extend(
+                (os.path.join(directory, HWCAPS_DIRECTORY, subdirectory),
+                 reason) for subdirectory in hwcaps)
+            order.append((directory, reason))
+
+    return order
+
+
+def system_paths(arch_flags: Optional[Flags] = None) -> List[str]:
+    """
+    System directories to search for objects of the architecture matching
+    the given cache flags: its own directories, then DEFAULT_PATHS
+    """
+    paths = list(ARCH_PATHS.get(arch_flags, []))
+    return paths + [path for path in DEFAULT_PATHS if path not in paths]
+
+
+def object_flags(path: Union[str, Path]) -> Optional[int]:
+    """
+    Cache flags matching the architecture of the ELF object at path, or None
+    if it is not an ELF object
+    """
+    try:
+        elf = classify(path)
+    except (OSError, ElfFormatError):
+        return None
+
+    if elf is None:
+        return None
+
+    return Flags.from_machine(elf.header.elf_class, elf.header.machine,
+                              elf.header.flags)
+
+
+def resolve_arch(
+    soname: str,
+    arch_flags: Flags,
+    rpath: Optional[List[str]] = None,
+    runpath: Optional[List[str]] = None,
+    hwcaps: Optional[Sequence[str]] = None,
+    index: Optional[DirectoryIndex] = None,
+) -> Optional[Path]:
+    """
+    Get a path towards an object of the architecture matching arch_flags
+    for a soname, or None
+
+    As the dynamic linker does, objects of other architectures found along
+    the search order are skipped: on multilib systems, the 32 and 64 bit
+    libraries of a soname are found in different directories of the same
+    search paths. The search order is the one of resolve_candidates, with
+    the system directories of the architecture (see system_paths).
+    """
+    for path, _ in _find_candidates(soname, rpath, runpath, arch_flags,
+                                    hwcaps, index, system_paths(arch_flags)):
+        if object_flags(path) == arch_flags:
+            return path
+
+        logging.debug("Skipping %s: not of architecture %s", path,
+                      Flags.description(arch_flags))
+
+    return None
+
+
+def resolve_arch_candidates(
+    soname: str,
+    arch_flags: Flags,
+    rpath: Optional[List[str]] = None,
+    runpath: Optional[List[str]] = None,
+    hwcaps: Optional[Sequence[str]] = None,
+    index: Optional[DirectoryIndex] = None,
+) -> List[Candidate]:
+    """
+    Find every object of the architecture matching arch_flags for a soname,
+    along the search order of resolve_arch: the first candidate is the
+    object resolve_arch returns, the others are shadowed by it
+    """
+    return [
+        candidate
+        for candidate in _find_candidates(soname, rpath, runpath, arch_flags,
+                                          hwcaps, index,
+                                          system_paths(arch_flags))
+        if object_flags(candidate.path) == arch_flags
+    ]
@@ -0,0 +1,163 @@
+"""
+Instrumentation of the resolution process
+
+Counters and timers are recorded in the Profile objects made active with
+sotools.profile():
+
+    with sotools.profile() as stats:
+        LibrarySet.create_from(['libm.so.6'])
+    print(stats.report())
+
+Instrumented code checks PROFILER.enabled before measuring anything, so the
+cost is a single attribute lookup when no profile is active. Measurements
+can be recorded from several threads.
+"""
+
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from time import perf_counter
+from typing import (
+    Dict,
+    List,
+    Tuple,
+)
+
+# Counter names
+STAT = 'stat calls'
+SCANDIR = 'scandir calls'
+ELF_PARSED = 'ELF files parsed'
+ELF_BYTES = 'ELF bytes paged in'
+ELF_REUSED = 'ELF parses reused'
+CACHE_PARSED = 'caches parsed'
+CACHE_HIT = 'cache hits'
+CACHE_MISS = 'cache misses'
+LOOKUPS = 'soname lookups'
+ITERATIONS = 'resolve iterations'
+
+
+class Profile:
+    """
+    Counters and timings collected while the profile is active
+    """
+
+    def __init__(self):
+        self.counters = Counter()
+        self.timers: Dict[str, float] = Counter()
+        self.parses: List[Tuple[str, float, int]] = []
+        self.lookups: List[Tuple[str, float]] = []
+        self.elapsed = 0.0
+
+    def slowest_parses(self, count: int = 10) -> List[Tuple[str, float, int]]:
+        """
+        -> list((path, seconds, bytes paged in))
+        """
+        return sorted(self.parses, key=lambda x: x[1], reverse=True)[:count]
+
+    def slowest_lookups(self, count: int = 10) -> List[Tuple[str, float]]:
+        """
+        -> list((soname, seconds))
+        """
+        return sorted(self.lookups, key=lambda x: x[1], reverse=True)[:count]
+
+    def as_dict(self) -> dict:
+        return dict(
+            elapsed=self.elapsed,
+            counters=dict(self.counters),
+            timers=dict(self.timers),
+            parses=[
+                dict(path=path, seconds=seconds, bytes=size)
+                for path, seconds, size in self.parses
+            ],
+            lookups=[
+                dict(soname=soname, seconds=seconds)
+                for soname, seconds in self.lookups
+            ],
+        )
+
+    def report(self, count: int = 5) -> str:
+        """
+        Human-readable summary of the profile
+        """
+        lines = [f"elapsed: {self.elapsed * 1000:.3f} ms"]
+
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name}: {value}")
+
+        for name, value in sorted(self.timers.items()):
+            lines.append(f"time in {name}: {value * 1000:.3f} ms")
+
+        if self.parses:
+            lines.append("slowest parses:")
+            for path, seconds, size in self.slowest_parses(count):
+                lines.append(f"\t{seconds * 1000:.3f} ms\t{size} B\t{path}")
+
+        if self.lookups:
+            lines.append("slowest lookups:")
+            for soname, seconds in self.slowest_lookups(count):
+                lines.append(f"\t{seconds * 1000:.3f} ms\t{soname}")
+
+        return "\n".join(lines)
+
+
+class Profiler:
+    """
+    Dispatches measurements to the active profiles
+    """
+
+    def __init__(self):
+        self.active: List[Profile] = []
+        self.enabled = False
+        self._lock = threading.Lock()
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            for profile in self.active:
+                profile.counters[name] += value
+
+    def time(self, name: str, seconds: float):
+        with self._lock:
+            for profile in self.active:
+                profile.timers[name] += seconds
+
+    def parse(self, path: str, seconds: float, size: int):
+        with self._lock:
+            for profile in self.active:
+                profile.counters[ELF_PARSED] += 1
+                profile.counters[ELF_BYTES] += size
+                profile.timers['ELF parsing'] += seconds
+                profile.parses.append((path, seconds, size))
+
+    def lookup(self, soname: str, seconds: float):
+        with self._lock:
+            for profile in self.active:
+                profile.counters[LOOKUPS] += 1
+                profile.timers['lookups'] += seconds
+                profile.lookups.append((soname, seconds))
+
+    @contextmanager
+    def profile(self):
+        current = Profile()
+        with self._lock:
+            self.active.append(current)
+            self.enabled = True
+        start = perf_counter()
+
+        try:
+            yield current
+        finally:
+            current.elapsed = perf_counter() - start
+            with self._lock:
+                self.active.remove(current)
+                self.enabled = bool(self.active)
+
+
+PROFILER = Profiler()
+
+
+def profile():
+    """
+    Context manager collecting statistics about the resolution process in
+    the block; yields a Profile object
+    """
+    return PROFILER.profile()
@@ -1,12 +1,14 @@
 #!/bin/env python3
 
+import os
 import sys
 import logging
 from argparse import ArgumentParser
-from sotools.dl_cache import _cache_libraries, Flags, get_generator
+from sotools.dl_cache import DynamicLinkerCache, Flags
 
 DEFAULT_CACHE = "/etc/ld.so.cache"
-DESCRIPTION = """List the contents of a given dynamic linker cache."""
+DEFAULT_CONFIG = "/etc/ld.so.conf"
+DESCRIPTION = """List the contents of a given dynamic linker cache, or build one from the libraries found in a set of directories."""
 EPILOG = """Please report any mismatch between the dynamic linker config tool and the output of this program to http://github.com/spoutn1k/python-sotools."""
 
 PARSER = ArgumentParser(
@@ -17,9 +19,59 @@ PARSER = ArgumentParser(
 
 PARSER.add_argument(
     "cache",
-    help="Path to an dynamic linker cache to dump.",
+    help=f"Path to a dynamic linker cache to dump, or to write with --build (default: {DEFAULT_CACHE} inside the root)",
     nargs='?',
-    default=DEFAULT_CACHE,
+)
+
+PARSER.add_argument(
+    "-p",
+    "--pattern",
+    help="Only list the entries whose soname starts with PATTERN, or matches it if it contains glob characters (e.g. 'libcuda' or 'libmpi.so.*')",
+)
+
+PARSER.add_argument(
+    "-b",
+    "--build",
+    action="store_true",
+    help="Scan directories and write the cache instead of listing it",
+)
+
+PARSER.add_argument(
+    "-f",
+    dest="config",
+    metavar="CONF",
+    help=f"Configuration file listing the directories to scan when building (default: {DEFAULT_CONFIG})",
+    default=DEFAULT_CONFIG,
+)
+
+PARSER.add_argument(
+    "-d",
+    "--directory",
+    dest="directories",
+    action="append",
+    metavar="DIR",
+    help="Scan this directory instead of the configured ones. Can be repeated.",
+)
+
+PARSER.add_argument(
+    "-r",
+    "--root",
+    default="/",
+    help="Build the cache from the directories of this sysroot",
+)
+
+PARSER.add_argument(
+    "-j",
+    "--jobs",
+    type=int,
+    help="Amount of threads used to scan directories",
+)
+
+PARSER.add_argument(
+    "-i",
+    "--incremental",
+    action="store_true",
+    help="Reuse the existing cache entries of files that did not change",
 )
 
 PARSER.add_argument(
@@ -30,23 +82,49 @@ PARSER.add_argument(
 )
 
 
+def build(args):
+    from sotools.dl_cache.writer import configured_directories, write_cache
+
+    directories = args.directories or configured_directories(
+        args.config, args.root)
+
+    try:
+        entries = write_cache(args.cache,
+                              directories,
+                              root=args.root,
+                              jobs=args.jobs,
+                              incremental=args.incremental)
+    except Exception as err:
+        print(err, file=sys.stderr)
+        sys.exit(1)
+
+    print(f"{len(entries)} libs written to cache `{args.cache}'")
+    sys.exit(0)
+
+
 def main():
     args = PARSER.parse_args()
 
+    # Never write the cache of a sysroot over the host's
+    if args.cache is None:
+        args.cache = os.path.join(args.root, DEFAULT_CACHE.lstrip('/'))
+
     if args.verbose:
         logging.basicConfig(
             level=logging.DEBUG,
             format="%(message)s",
         )
 
+    if args.build:
+        build(args)
+
     try:
-        with open(args.cache, 'rb') as cache_file:
-            cache_data = cache_file.read()
+        cache = DynamicLinkerCache.load(args.cache)
     except Exception as err:
         print(err, file=sys.stderr)
         sys.exit(1)
 
-    libs = _cache_libraries(cache_data)
+    libs = cache.query(args.pattern) if args.pattern else cache.entries
     print(f"{len(libs)} libs found in cache `{args.cache}'")
 
     for library in libs:
@@ -56,8 +134,7 @@ def main():
                    [Flags.description(library.flags), hwcap_entry_string]))
         print(f"\t{library.key} ({description}) => {library.value}")
 
-    generator = get_generator(cache_data)
-    if generator:
-        print(f"Cache generated by: {generator}")
+    if cache.generator:
+        print(f"Cache generated by: {cache.generator}")
 
     sys.exit(0)
@@ -3,7 +3,22 @@
 import sys
 import logging
 from argparse import ArgumentParser
-from sotools.ldd import ldd, NotELFError
+from contextlib import nullcontext
+from sotools.trace import FORMATS as TRACE_FORMATS, TRACER, StreamSink
+from sotools.profiling import profile
+from sotools.ldd import (
+    FORMATS,
+    ORDERS,
+    NotELFError,
+    ldd,
+    ldd_entries,
+    write_entries,
+)
+from sotools.libraryset import Library, LibrarySet
+from sotools.diff import diff
+from sotools.shadowing import shadowed_libraries
+from sotools import snapshot
+from sotools.elf import ElfFormatError, classify
 
 DESCRIPTION = """List dynamic dependencies. This program will output a complete list of all the dynamic dependencies of the dynamic executable passed as an argument. This python version is safe to use on untrusted binaries."""
 EPILOG = """Please report any mismatch between the dynamic linker and the output of this program to http://github.com/spoutn1k/python-sotools."""
@@ -19,6 +34,59 @@ PARSER.add_argument(
     help="Path to an executable to analyze.",
 )
 
+PARSER.add_argument(
+    "--trace-format",
+    choices=sorted(TRACE_FORMATS),
+    default='libs',
+    help="Format of the trace output by --verbose: LD_DEBUG=libs style text or JSON lines",
+)
+
+PARSER.add_argument(
+    "--format",
+    choices=sorted(FORMATS),
+    default='text',
+    help="Output format: ldd style text, JSON lines, or the NUL-terminated paths of the libraries found, for xargs -0",
+)
+
+PARSER.add_argument(
+    "-0",
+    dest="format",
+    action="store_const",
+    const='null',
+    help="Same as --format null",
+)
+
+PARSER.add_argument(
+    "--order",
+    choices=ORDERS,
+    default='resolution',
+    help="Order of the output: as the libraries are found (the default, printed while resolving), sorted by soname, or in load order",
+)
+
+PARSER.add_argument(
+    "--graph",
+    choices=['dot', 'json'],
+    help="Output the dependency graph of the executable in the given format",
+)
+
+PARSER.add_argument(
+    "--diff",
+    metavar="REFERENCE",
+    help="Compare the dependencies of the executable to the ones of REFERENCE, another executable or a snapshot (see sotools.snapshot) of a closure, e.g. taken in another sysroot; the exit status is 1 if they differ",
+)
+
+PARSER.add_argument(
+    "--shadowed",
+    action="store_true",
+    help="List the dependencies found in several places along the search order, and the versions the shadowed copies define beyond or short of the loaded one; the exit status is 1 if a shadowed copy diverges",
+)
+
+PARSER.add_argument(
+    "--stats",
+    action="store_true",
+    help="Print statistics about the resolution process on the error output",
+)
+
 PARSER.add_argument(
     "-v",
     "--verbose",
@@ -27,6 +95,19 @@ PARSER.add_argument(
 )
 
 
+def _closure(path: str) -> LibrarySet:
+    """
+    Dependencies of an executable, or the libraries of a snapshot
+    """
+    try:
+        return ldd(path)
+    except NotELFError:
+        pass
+
+    with open(path) as file:
+        return snapshot.load(file)
+
+
 def main():
     args = PARSER.parse_args()
 
@@ -35,12 +116,54 @@ def main():
             level=logging.DEBUG,
             format="%(message)s",
         )
+        TRACER.add_sink(StreamSink(sys.stderr, args.trace_format))
+
+    if args.diff:
+        try:
+            differences = diff(_closure(args.diff), _closure(args.executable))
+        except (NotELFError, OSError, ValueError,
+                snapshot.SnapshotError) as err:
+            # ValueError covers undecodable and malformed snapshots
+            print(f"ldd.py: {err or 'not a dynamic executable'}",
+                  file=sys.stderr)
+            sys.exit(2)
+
+        if differences:
+            print("\n".join(differences.format()))
+        sys.exit(1 if differences else 0)
 
     try:
-        libs = ldd(args.executable)
-    except NotELFError:
+        executable = classify(args.executable, versions=True)
+    except (OSError, ElfFormatError):
+        executable = None
+
+    if executable is None:
         print("\tnot a dynamic executable")
         sys.exit(1)
 
-    print("\n".join(libs.ldd_format()))
+    root = Library.from_elf(executable)
+
+    if args.graph:
+        graph = LibrarySet([root]).resolve().graph()
+        print(graph.to_dot() if args.graph == 'dot' else graph.to_json())
+        sys.exit(0)
+
+    if args.shadowed:
+        with (profile() if args.stats else nullcontext()) as stats:
+            reports = shadowed_libraries(LibrarySet([root]).resolve())
+
+        for report in reports:
+            print("\n".join(report.format()))
+
+        if stats:
+            print(stats.report(), file=sys.stderr)
+
+        sys.exit(1 if any(report.divergent for report in reports) else 0)
+
+    with (profile() if args.stats else nullcontext()) as stats:
+        write_entries(ldd_entries(root, args.order), sys.stdout, args.format)
+
+    if stats:
+        print(stats.report(), file=sys.stderr)
+
     sys.exit(0)
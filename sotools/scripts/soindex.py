@@ -0,0 +1,146 @@
+#!/bin/env python3
+
+import os
+import sys
+import logging
+from argparse import ArgumentParser
+from sotools.database import LibraryDatabase
+
+DEFAULT_DATABASE = "sotools.db"
+DESCRIPTION = """Maintain and query an SQLite index of the libraries found in many directory trees, such as software prefixes or sysroots. The index records the sonames, symbol versions and dependencies of the libraries and the entries of linker caches; queries are answered from the index without scanning the trees again."""
+EPILOG = """Please report any mismatch between the dynamic linker and the output of this program to http://github.com/spoutn1k/python-sotools."""
+
+PARSER = ArgumentParser(
+    prog='soindex',
+    description=DESCRIPTION,
+    epilog=EPILOG,
+)
+
+PARSER.add_argument(
+    "-d",
+    "--database",
+    default=os.environ.get('SOTOOLS_DATABASE', DEFAULT_DATABASE),
+    help=f"Path to the index database, created if missing (default: $SOTOOLS_DATABASE or {DEFAULT_DATABASE})",
+)
+
+PARSER.add_argument(
+    "-v",
+    "--verbose",
+    action="store_true",
+    help="Toggle verbose output",
+)
+
+COMMANDS = PARSER.add_subparsers(dest="command", required=True)
+
+INGEST = COMMANDS.add_parser(
+    "ingest",
+    help="Index the libraries found under directories, and linker caches",
+)
+INGEST.add_argument(
+    "roots",
+    nargs='*',
+    metavar="ROOT",
+    help="Directories to scan; only the files that changed since the last ingestion are parsed",
+)
+INGEST.add_argument(
+    "-c",
+    "--cache",
+    action="append",
+    default=[],
+    help="Linker cache file to record. Can be repeated.",
+)
+INGEST.add_argument(
+    "-j",
+    "--jobs",
+    type=int,
+    help="Amount of threads used to scan and parse files",
+)
+
+LIBRARIES = COMMANDS.add_parser(
+    "libraries",
+    help="List the indexed libraries whose soname starts with or matches a glob pattern",
+)
+LIBRARIES.add_argument("pattern", nargs='?', default='*')
+
+REQUESTERS = COMMANDS.add_parser(
+    "requesters",
+    help="List the objects depending on a soname",
+)
+REQUESTERS.add_argument("soname")
+
+DEFINERS = COMMANDS.add_parser(
+    "definers",
+    help="List the libraries defining a symbol version",
+)
+DEFINERS.add_argument("version")
+
+CACHE = COMMANDS.add_parser(
+    "cache",
+    help="List the recorded cache entries whose soname starts with or matches a glob pattern",
+)
+CACHE.add_argument("pattern", nargs='?', default='*')
+
+COMMANDS.add_parser(
+    "unresolved",
+    help="List the dependencies that were not found",
+)
+
+CONFLICTS = COMMANDS.add_parser(
+    "conflicts",
+    help="List the executables loading several objects whose soname starts with or matches a glob pattern, e.g. 'libstdc++.so.*'",
+)
+CONFLICTS.add_argument("pattern")
+
+
+def _print(*fields):
+    print("\t".join(map(str, fields)), flush=True)
+
+
+def main():
+    args = PARSER.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(
+            level=logging.DEBUG,
+            format="%(message)s",
+        )
+
+    with LibraryDatabase(args.database) as database:
+        if args.command == 'ingest':
+            parsed = database.ingest(args.roots, jobs=args.jobs)
+            print(f"{parsed} files parsed into `{args.database}'")
+
+            for cache_file in args.cache:
+                try:
+                    count = database.ingest_cache(cache_file)
+                except Exception as err:
+                    print(err, file=sys.stderr)
+                    sys.exit(1)
+                print(f"{count} entries of `{cache_file}' recorded")
+
+        elif args.command == 'libraries':
+            for library in database.libraries(args.pattern):
+                _print(*library)
+
+        elif args.command == 'requesters':
+            for path in database.requesters(args.soname):
+                _print(path)
+
+        elif args.command == 'definers':
+            for library in database.definers(args.version):
+                _print(*library)
+
+        elif args.command == 'cache':
+            for entry in database.cache_entries(args.pattern):
+                _print(entry.soname, entry.path, entry.cache)
+
+        elif args.command == 'unresolved':
+            for path, soname in database.unresolved():
+                _print(path, soname)
+
+        elif args.command == 'conflicts':
+            for executable, libraries in database.conflicts(
+                    args.pattern).items():
+                _print(executable, *libraries)
+
+    sys.exit(0)
@@ -1,11 +1,22 @@
 #!/bin/env python3
 
 import sys
+import json
 import logging
 from argparse import ArgumentParser
-from sotools.linker import resolve
+from contextlib import nullcontext
+from sotools.trace import TRACER, FORMATS, StreamSink
+from sotools.profiling import profile
+from sotools.linker import (
+    DirectoryIndex,
+    resolve_all,
+    resolve_arch,
+    resolve_arch_candidates,
+    resolve_candidates,
+)
+from sotools.dl_cache.flags import Flags
 
-DESCRIPTION = """This program will attempt to resolve an ELF file from a given shared object name. It allows to trace the attempts made by the linker to determine what shared object is resolved by what means."""
+DESCRIPTION = """This program will attempt to resolve an ELF file from a given shared object name. It allows to trace the attempts made by the linker to determine what shared object is resolved by what means. Several names can be given as arguments or on the standard input, one per line, to be resolved in a single run."""
 EPILOG = """Please report any mismatch between the dynamic linker and the output of this program to http://github.com/spoutn1k/python-sotools."""
 
 PARSER = ArgumentParser(
@@ -16,7 +27,52 @@ PARSER = ArgumentParser(
 
 PARSER.add_argument(
     "soname",
-    help="The library name to search for.",
+    nargs='*',
+    help="The library names to search for; read from the standard input if none or '-' is given.",
+)
+
+PARSER.add_argument(
+    "--rpath",
+    default="",
+    help="Colon-separated list of directories to search as a RPATH",
+)
+
+PARSER.add_argument(
+    "--runpath",
+    default="",
+    help="Colon-separated list of directories to search as a RUNPATH",
+)
+
+PARSER.add_argument(
+    "--arch",
+    choices=Flags.architectures(),
+    help="Architecture of the libraries to search for; objects of other architectures are skipped",
+)
+
+PARSER.add_argument(
+    "--format",
+    choices=['tsv', 'json'],
+    help="Output the results as tab-separated 'soname path' lines or JSON lines; the default when searching several libraries is tsv",
+)
+
+PARSER.add_argument(
+    "-a",
+    "--all",
+    action="store_true",
+    help="List every match along the search order, with the step it was found by, instead of the first one: the first match shadows the others",
+)
+
+PARSER.add_argument(
+    "--trace-format",
+    choices=sorted(FORMATS),
+    default='libs',
+    help="Format of the trace output by --verbose: LD_DEBUG=libs style text or JSON lines",
+)
+
+PARSER.add_argument(
+    "--stats",
+    action="store_true",
+    help="Print statistics about the resolution process on the error output",
 )
 
 PARSER.add_argument(
@@ -27,6 +83,69 @@ PARSER.add_argument(
 )
 
 
+def _sonames(arguments):
+    """
+    Generate the sonames from the arguments, reading the standard input in
+    place of '-' or if no argument is given
+    """
+    for argument in arguments or ['-']:
+        if argument != '-':
+            yield argument
+            continue
+
+        for line in sys.stdin:
+            if line.strip():
+                yield line.strip()
+
+
+def _format(format_, soname, path):
+    if format_ == 'json':
+        return json.dumps(
+            dict(soname=soname, path=path.as_posix() if path else None))
+    if format_ == 'tsv':
+        return f"{soname}\t{path.as_posix() if path else ''}"
+    return str(path)
+
+
+def _resolve_arch_all(sonames, arch_flags, **kwargs):
+    """
+    resolve_all, skipping the objects of other architectures
+    """
+    index = DirectoryIndex()
+
+    for soname in sonames:
+        yield soname, resolve_arch(soname, arch_flags, index=index, **kwargs)
+
+
+def _all_candidates(sonames, format_, arch_flags=None, **kwargs) -> bool:
+    """
+    Print every candidate of the sonames; returns True if one has none
+    """
+    index = DirectoryIndex()
+    missing = False
+
+    for soname in sonames:
+        if arch_flags is not None:
+            candidates = resolve_arch_candidates(soname,
+                                                 arch_flags,
+                                                 index=index,
+                                                 **kwargs)
+        else:
+            candidates = resolve_candidates(soname, index=index, **kwargs)
+
+        for path, reason in candidates:
+            if format_ == 'json':
+                line = json.dumps(
+                    dict(soname=soname, path=path.as_posix(), reason=reason))
+            else:
+                line = f"{soname}\t{path.as_posix()}\t{reason}"
+            print(line, flush=True)
+
+        missing = missing or not candidates
+
+    return missing
+
+
 def main():
     args = PARSER.parse_args()
 
@@ -35,9 +154,42 @@ def main():
             level=logging.DEBUG,
             format="%(message)s",
         )
+        TRACER.add_sink(StreamSink(sys.stderr, args.trace_format))
+
+    # A single soname argument keeps the historical output: the path alone
+    format_ = args.format
+    if format_ is None and (len(args.soname) != 1 or args.soname == ['-']):
+        format_ = 'tsv'
+
+    search = dict(
+        rpath=list(filter(None, args.rpath.split(':'))),
+        runpath=list(filter(None, args.runpath.split(':'))),
+        arch_flags=Flags.from_name(args.arch) if args.arch else None,
+    )
+
+    if args.all:
+        with (profile() if args.stats else nullcontext()) as stats:
+            missing = _all_candidates(_sonames(args.soname), format_, **search)
+
+        if stats:
+            print(stats.report(), file=sys.stderr)
+
+        sys.exit(1 if missing else 0)
+
+    if search['arch_flags'] is not None:
+        results = _resolve_arch_all(_sonames(args.soname), **search)
+    else:
+        results = resolve_all(_sonames(args.soname), **search)
+
+    missing = False
+
+    with (profile() if args.stats else nullcontext()) as stats:
+        for soname, path in results:
+            if path or format_:
+                print(_format(format_, soname, path), flush=True)
+            missing = missing or not path
+
+    if stats:
+        print(stats.report(), file=sys.stderr)
 
-    path = resolve(args.soname)
-    if path:
-        print(path)
-        sys.exit(0)
-    sys.exit(1)
+    sys.exit(1 if missing else 0)
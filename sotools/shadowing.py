@@ -0,0 +1,192 @@
+"""
+Detection of shadowed libraries
+
+A soname present in several directories of the search order resolves to the
+first match: the others are shadowed. This is harmless when all the matches
+are the same file, or copies of it, but a shadowed library defining other
+symbol versions than the one loaded signals an ABI divergence, and a broken
+program when the loaded one lacks versions its requesters need.
+
+All the lookups of a check share a DirectoryIndex, so that checking a whole
+closure lists every searched directory once.
+"""
+
+import logging
+from pathlib import Path
+from typing import (
+    Dict,
+    FrozenSet,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from sotools.dl_cache.flags import Flags
+from sotools.libraryset import VERSIONS, Library, LibrarySet
+from sotools.linker import DirectoryIndex, resolve_candidates
+from sotools.snapshot import fingerprint
+
+
+class ShadowCandidate(NamedTuple):
+    path: str
+    reason: str
+    soname: str
+    inode: Optional[Tuple[int, int]]
+    fingerprint: Optional[Tuple[int, int]]
+    defined_versions: FrozenSet[str]
+
+
+class Shadowing(NamedTuple):
+    soname: str
+    candidates: List[ShadowCandidate]
+    # Versions required from soname by the set that the selected candidate
+    # does not define, but a shadowed one does
+    missing_versions: Set[str]
+
+    @property
+    def selected(self) -> ShadowCandidate:
+        """
+        The candidate the dynamic linker loads
+        """
+        return self.candidates[0]
+
+    @property
+    def shadowed(self) -> List[ShadowCandidate]:
+        """
+        Candidates that are other files than the selected one
+        """
+        return [
+            candidate for candidate in self.candidates[1:]
+            if candidate.inode is None or candidate.inode != self.selected.inode
+        ]
+
+    @property
+    def divergent(self) -> bool:
+        """
+        A shadowed candidate defines other versions, or has another soname,
+        than the selected one
+        """
+        selected = self.selected
+        return any(
+            candidate.defined_versions != selected.defined_versions
+            or candidate.soname != selected.soname
+            for candidate in self.shadowed)
+
+    def format(self) -> List[str]:
+        """
+        -> list(str)
+        The soname, followed by one line per candidate in search order with
+        the versions it defines beyond ('+') or short of ('-') the selected
+        one, and a '!' line for the versions missing from the selected one
+        """
+        selected = self.selected
+        status = "divergent" if self.divergent else "identical"
+        lines = [f"{self.soname} ({status})"]
+
+        lines.append(f"\t{selected.reason}\t{selected.path}")
+        for candidate in self.shadowed:
+            added = candidate.defined_versions - selected.defined_versions
+            removed = selected.defined_versions - candidate.defined_versions
+
+            versions = [f"+{name}" for name in sorted(added)]
+            versions += [f"-{name}" for name in sorted(removed)]
+            if candidate.soname != selected.soname:
+                versions.insert(0, f"soname={candidate.soname}")
+            lines.append(
+                "\t".join(["", candidate.reason, candidate.path, *versions]))
+
+        if self.missing_versions:
+            lines.append(
+                f"! {selected.path} lacks {' '.join(sorted(self.missing_versions))}")
+
+        return lines
+
+
+def _candidate(path: Path, reason: str, library: Library) -> ShadowCandidate:
+    return ShadowCandidate(path.as_posix(), reason, library.soname,
+                           library.inode, fingerprint(str(path)),
+                           frozenset(library.defined_versions))
+
+
+def inspect(soname: str,
+            rpath: Optional[List[str]] = None,
+            runpath: Optional[List[str]] = None,
+            arch_flags: Optional[Flags] = None,
+            hwcaps: Optional[Sequence[str]] = None,
+            index: Optional[DirectoryIndex] = None,
+            required: FrozenSet[str] = frozenset()) -> Optional[Shadowing]:
+    """
+    -> Shadowing or None
+    Find the candidates for soname (see linker.resolve_candidates), and
+    describe them if they are more than one file. required are the versions
+    expected from the library, checked against the selected candidate.
+    With arch_flags, objects of other architectures are skipped as the
+    dynamic linker does.
+    """
+    candidates = []
+
+    for path, reason in resolve_candidates(soname,
+                                           rpath=rpath,
+                                           runpath=runpath,
+                                           arch_flags=arch_flags,
+                                           hwcaps=hwcaps,
+                                           index=index):
+        try:
+            library = Library.from_path(path)
+        except OSError as err:
+            logging.error("Failed to read candidate '%s': %s", path, err)
+            continue
+
+        if arch_flags is not None and library.arch_flags != arch_flags:
+            logging.debug("Skipping %s: not of architecture %s", path,
+                          Flags.description(arch_flags))
+            continue
+
+        candidates.append(_candidate(path, reason, library))
+
+    if len({candidate.inode for candidate in candidates}) < 2:
+        return None
+
+    selected = candidates[0]
+    missing = set()
+    for candidate in candidates[1:]:
+        missing |= (required & candidate.defined_versions)
+    missing -= selected.defined_versions
+
+    return Shadowing(soname, candidates, missing)
+
+
+def shadowed_libraries(libraries: LibrarySet,
+                       divergent_only: bool = False) -> List[Shadowing]:
+    """
+    -> list(Shadowing)
+    Check every library and missing dependency of the set for shadowing,
+    searching with the RPATHs and RUNPATHs of the set as resolve does
+    """
+    index = DirectoryIndex()
+    arch_flags = libraries.arch_flags()
+    rpath, runpath = libraries.rpath, libraries.runpath
+
+    required: Dict[str, int] = {}
+    for library in libraries:
+        for soname, mask in library.required_masks.items():
+            required[soname] = required.get(soname, 0) | mask
+
+    reports = []
+
+    for soname in sorted(libraries.sonames | libraries.missing_libraries):
+        report = inspect(soname,
+                         rpath=rpath,
+                         runpath=runpath,
+                         arch_flags=arch_flags,
+                         index=index,
+                         required=frozenset(
+                             VERSIONS.decode(required.get(soname, 0))))
+
+        if report is not None and (report.divergent or not divergent_only):
+            reports.append(report)
+
+    return reports
@@ -0,0 +1,213 @@
+"""
+Serialization of resolved library sets
+
+A snapshot records the parsed data of every library of a set along with the
+fingerprint its file had when it was parsed, so that a set resolved once can
+be loaded again on other machines without parsing any ELF file:
+
+    with open('closure.json', 'w') as file:
+        snapshot.dump(libraries, file)
+
+    with open('closure.json') as file:
+        libraries = snapshot.load(file, validate=True)
+
+Snapshots are JSON documents. Strings are interned in a table and the
+libraries refer to them by index, which keeps the sonames, paths and
+version names shared by many libraries from being repeated.
+"""
+
+import os
+import json
+import logging
+from typing import (
+    Dict,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+)
+
+from sotools.libraryset import Library, LibrarySet, _PARSED, _detached
+
+FORMAT = "sotools-snapshot"
+VERSION = 2
+# Version 1 snapshots lack the architecture of the libraries
+SUPPORTED_VERSIONS = (1, VERSION)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def fingerprint(path: str) -> Optional[Tuple[int, int]]:
+    """
+    -> (size, modification time in ns) of the file at path, or None if it
+    cannot be accessed
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _serialize(libraries: LibrarySet) -> dict:
+    strings: List[str] = []
+    indexes: Dict[str, int] = {}
+
+    def _intern(value: str) -> int:
+        if value not in indexes:
+            indexes[value] = len(strings)
+            strings.append(value)
+        return indexes[value]
+
+    def _list(values) -> List[int]:
+        return [_intern(value) for value in values]
+
+    def _library(library: Library) -> list:
+        path = library.binary_path
+        return [
+            _intern(library.soname),
+            _intern(path) if path else None,
+            list(library.fingerprint) if library.fingerprint else None,
+            _list(library.needed or sorted(library.dyn_dependencies)),
+            _list(sorted(library.defined_versions)),
+            [[_intern(soname), _list(sorted(versions))]
+             for soname, versions in sorted(
+                 library.required_versions.items())],
+            _list(library.rpath),
+            _list(library.runpath),
+            library.arch_flags,
+        ]
+
+    entries = [
+        _library(library)
+        for library in sorted(libraries, key=lambda lib: lib.soname)
+    ]
+
+    return dict(format=FORMAT,
+                version=VERSION,
+                strings=strings,
+                libraries=entries)
+
+
+def dumps(libraries: LibrarySet) -> str:
+    """
+    -> str
+    Serialize the set of libraries
+    """
+    return json.dumps(_serialize(libraries), separators=(',', ':'))
+
+
+def dump(libraries: LibrarySet, file: TextIO):
+    """
+    Serialize the set of libraries to the given text file
+    """
+    file.write(dumps(libraries))
+
+
+def _entry(strings: List[str], entry: list) -> Library:
+    """
+    -> Library
+    Decode an entry of a snapshot; malformed entries raise ValueError,
+    IndexError, KeyError or TypeError
+    """
+    if len(entry) not in (8, 9):
+        raise ValueError(f"entry of {len(entry)} fields")
+
+    (soname, path, recorded, needed, defined, required, rpath,
+     runpath) = entry[:8]
+
+    def _string(index: int) -> str:
+        if not isinstance(index, int) or index < 0:
+            raise ValueError(f"invalid string reference {index!r}")
+        return strings[index]
+
+    library = Library()
+    library.soname = _string(soname)
+    library.binary_path = _string(path) if path is not None else None
+    library.needed = list(map(_string, needed))
+    library.dyn_dependencies = set(library.needed)
+    library.defined_versions = list(map(_string, defined))
+    library.required_versions = {
+        _string(name): list(map(_string, versions))
+        for name, versions in required
+    }
+    library.rpath = list(map(_string, rpath))
+    library.runpath = list(map(_string, runpath))
+    library.fingerprint = tuple(map(int, recorded)) if recorded else None
+
+    if len(entry) == 9 and entry[8] is not None:
+        library.arch_flags = int(entry[8])
+
+    return library
+
+
+def _deserialize(data: dict, validate: bool) -> LibrarySet:
+    if not isinstance(data, dict) or data.get('format') != FORMAT:
+        raise SnapshotError("Data is not a library set snapshot")
+
+    if data.get('version') not in SUPPORTED_VERSIONS:
+        raise SnapshotError(
+            f"Unsupported snapshot version: {data.get('version')}")
+
+    try:
+        strings, entries = data['strings'], list(data['libraries'])
+        decoded = [_entry(strings, entry) for entry in entries]
+    except (KeyError, IndexError, TypeError, ValueError) as err:
+        raise SnapshotError(f"Malformed snapshot: {err}") from err
+
+    libraries = []
+
+    for library in decoded:
+        path = library.binary_path
+
+        if validate and path is not None:
+            try:
+                stat = os.stat(path)
+            except OSError as err:
+                logging.error("Library '%s' of snapshot is missing: %s", path,
+                              err)
+                continue
+
+            if library.fingerprint != (stat.st_size, stat.st_mtime_ns):
+                logging.debug("Library '%s' changed since the snapshot",
+                              path)
+                libraries.append(Library.from_path(path))
+                continue
+
+            # Register the library as parsed, for Library.from_path
+            library.inode = (stat.st_dev, stat.st_ino)
+            _PARSED.setdefault(library.inode,
+                               ((stat.st_mtime_ns, stat.st_size),
+                                _detached(library)))
+
+        libraries.append(library)
+
+    return LibrarySet(libraries)
+
+
+def loads(data: str, validate: bool = False) -> LibrarySet:
+    """
+    -> LibrarySet
+    Load a set of libraries from a snapshot
+
+    With validate, the files of the libraries are checked against their
+    recorded fingerprints: libraries whose file changed are parsed again and
+    the ones whose file is missing are left out.
+    """
+    try:
+        document = json.loads(data)
+    except ValueError as err:
+        raise SnapshotError("Snapshot is not valid JSON") from err
+
+    return _deserialize(document, validate)
+
+
+def load(file: TextIO, validate: bool = False) -> LibrarySet:
+    """
+    -> LibrarySet
+    Load a set of libraries from a snapshot file; see loads
+    """
+    return loads(file.read(), validate)
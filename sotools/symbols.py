@@ -0,0 +1,465 @@
+"""
+Symbol binding check on the dynamic symbol tables
+
+The dynamic linker binds every undefined symbol of an object to the first
+definition found in the global scope, whose objects are searched in load
+order. This module reproduces that search with the hash tables of the
+objects (DT_GNU_HASH, or DT_HASH for older objects): looking a symbol up in
+an object costs a few probes instead of a dictionary of all its symbols.
+
+Symbol versions are not taken into account; version requirements are
+checked by LibrarySet.outdated_libraries.
+"""
+
+import mmap
+import struct
+import logging
+from pathlib import Path
+from typing import (
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+from sotools.elf import (
+    ELFCLASS32,
+    ELFCLASS64,
+    HEADER_SIZE,
+    DT_GNU_HASH,
+    DT_HASH,
+    DT_SONAME,
+    DT_STRTAB,
+    DT_SYMENT,
+    DT_SYMTAB,
+    PT_DYNAMIC,
+    SHN_UNDEF,
+    STB_GLOBAL,
+    STB_GNU_UNIQUE,
+    STB_WEAK,
+    ElfFormatError,
+    ElfHeader,
+    _vaddr_offset,
+    dynamic_entries,
+    program_headers,
+)
+
+# Symbol entry layouts, with the indexes of (st_name, st_info, st_shndx)
+_SYMBOL_FORMATS = {
+    ELFCLASS32: ('IIIBBH', (0, 3, 5)),
+    ELFCLASS64: ('IBBHQQ', (0, 1, 3)),
+}
+
+# Bloom filter word of the GNU hash table
+_BLOOM_FORMATS = {
+    ELFCLASS32: ('I', 32),
+    ELFCLASS64: ('Q', 64),
+}
+
+_DEFINITION_BINDINGS = {STB_GLOBAL, STB_WEAK, STB_GNU_UNIQUE}
+
+
+def gnu_hash(name: bytes) -> int:
+    """
+    Hash function of the DT_GNU_HASH tables
+    """
+    value = 5381
+    for char in name:
+        value = (value * 33 + char) & 0xffffffff
+    return value
+
+
+def sysv_hash(name: bytes) -> int:
+    """
+    Hash function of the DT_HASH tables
+    """
+    value = 0
+    for char in name:
+        value = ((value << 4) + char) & 0xffffffff
+        high = value & 0xf0000000
+        if high:
+            value ^= high >> 24
+        value &= ~high
+    return value
+
+
+class SymbolKey:
+    """
+    Symbol name and its hashes, computed once for all the objects searched
+    """
+
+    __slots__ = ('name', 'gnu', '_sysv')
+
+    def __init__(self, name: bytes):
+        self.name = name
+        self.gnu = gnu_hash(name)
+        self._sysv = None
+
+    @property
+    def sysv(self) -> int:
+        if self._sysv is None:
+            self._sysv = sysv_hash(self.name)
+        return self._sysv
+
+
+class SymbolTable:
+    """
+    Dynamic symbol table of an ELF object, accessed through its hash table
+    """
+
+    @classmethod
+    def load(cls, path: Union[str, Path]):
+        """
+        -> SymbolTable
+        Map the file at path and locate its dynamic symbol and hash tables
+
+        Raises ElfFormatError if the file is not a valid ELF object, OSError
+        if it cannot be read.
+        """
+        with open(path, 'rb') as file:
+            header = ElfHeader.parse(file.read(HEADER_SIZE))
+            segments = program_headers(file, header)
+            dynamic = [s for s in segments if s.type == PT_DYNAMIC]
+
+            if not dynamic:
+                return cls(str(path), header)
+
+            entries = dict(reversed(dynamic_entries(file, header,
+                                                    dynamic[0])))
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        def _offset(tag: int) -> Optional[int]:
+            if tag not in entries:
+                return None
+
+            offset = _vaddr_offset(segments, entries[tag])
+            if offset is None:
+                raise ElfFormatError(
+                    f"Dynamic entry {tag:#x} outside of loaded segments")
+            return offset
+
+        table = cls(str(path),
+                    header,
+                    data=data,
+                    symtab=_offset(DT_SYMTAB),
+                    strtab=_offset(DT_STRTAB),
+                    syment=entries.get(DT_SYMENT))
+
+        if DT_SONAME in entries and table._strtab is not None:
+            table.soname = table._string(entries[DT_SONAME]).decode(
+                errors='replace')
+
+        if table._symtab is None or table._strtab is None:
+            return table
+
+        if DT_GNU_HASH in entries:
+            table._load_gnu_hash(_offset(DT_GNU_HASH))
+        elif DT_HASH in entries:
+            table._load_sysv_hash(_offset(DT_HASH))
+
+        return table
+
+    def __init__(self,
+                 path: str,
+                 header: ElfHeader,
+                 data=None,
+                 symtab: Optional[int] = None,
+                 strtab: Optional[int] = None,
+                 syment: Optional[int] = None):
+        self.path = path
+        self.soname: Optional[str] = None
+        self.count = 0
+
+        self._data = data
+        self._symtab = symtab
+        self._strtab = strtab
+
+        format_, self._fields = _SYMBOL_FORMATS[header.elf_class]
+        self._layout = struct.Struct(header.endianness + format_)
+        self._syment = syment or self._layout.size
+        self._endianness = header.endianness
+        self._elf_class = header.elf_class
+
+        self._gnu: Optional[Tuple] = None
+        self._sysv: Optional[Tuple] = None
+
+    def _words(self, offset: int, count: int, format_: str = 'I') -> Tuple:
+        layout = struct.Struct(f"{self._endianness}{count}{format_}")
+
+        try:
+            return layout.unpack_from(self._data, offset)
+        except struct.error as err:
+            raise ElfFormatError(
+                f"Truncated hash table in {self.path}") from err
+
+    def _load_gnu_hash(self, offset: int):
+        nbuckets, symoffset, bloom_size, shift = self._words(offset, 4)
+        format_, bits = _BLOOM_FORMATS[self._elf_class]
+
+        # Lookups take the hash modulo both sizes
+        if not nbuckets or not bloom_size:
+            raise ElfFormatError(f"Empty GNU hash table in {self.path}")
+        offset += 16
+
+        bloom = self._words(offset, bloom_size, format_)
+        offset += bloom_size * struct.calcsize(format_)
+
+        buckets = self._words(offset, nbuckets)
+        offset += nbuckets * 4
+
+        # The table does not record the symbol count: follow the chain of
+        # the last bucket to its end
+        count = max(buckets, default=0)
+        if count < symoffset:
+            count = symoffset
+        else:
+            while not self._words(offset + (count - symoffset) * 4, 1)[0] & 1:
+                count += 1
+            count += 1
+
+        chains = self._words(offset, count - symoffset)
+
+        self.count = count
+        self._gnu = (symoffset, bloom, bits, shift, buckets, chains)
+
+    def _load_sysv_hash(self, offset: int):
+        nbuckets, nchains = self._words(offset, 2)
+
+        if not nbuckets:
+            raise ElfFormatError(f"Empty hash table in {self.path}")
+
+        buckets = self._words(offset + 8, nbuckets)
+        chains = self._words(offset + 8 + nbuckets * 4, nchains)
+
+        self.count = nchains
+        self._sysv = (buckets, chains)
+
+    def _string(self, offset: int) -> bytes:
+        start = self._strtab + offset
+        return self._data[start:self._data.find(b'\0', start)]
+
+    def _symbol(self, index: int) -> Tuple[int, int, int]:
+        fields = self._layout.unpack_from(self._data,
+                                          self._symtab + index * self._syment)
+        return tuple(fields[i] for i in self._fields)
+
+    def _matches(self, index: int, name: bytes) -> bool:
+        # Tables of truncated files may reference data past their end
+        if self._symtab + (index + 1) * self._syment > len(self._data):
+            return False
+
+        name_offset, info, shndx = self._symbol(index)
+
+        if shndx == SHN_UNDEF or info >> 4 not in _DEFINITION_BINDINGS:
+            return False
+
+        start = self._strtab + name_offset
+        end = start + len(name)
+        return (self._data[start:end] == name
+                and self._data[end:end + 1] == b'\0')
+
+    def undefined(self) -> Iterator[bytes]:
+        """
+        Generate the names of the undefined, non-weak symbols
+        """
+        if not self.count:
+            return
+
+        name_index, info_index, shndx_index = self._fields
+
+        for index in range(1, self.count):
+            fields = self._layout.unpack_from(
+                self._data, self._symtab + index * self._syment)
+
+            if (fields[shndx_index] == SHN_UNDEF and fields[name_index]
+                    and fields[info_index] >> 4 == STB_GLOBAL):
+                yield self._string(fields[name_index])
+
+    def defines(self, key: SymbolKey) -> bool:
+        """
+        Check the object exports a definition of the symbol
+        """
+        if self._gnu is not None:
+            return self._bloom(key.gnu) and self._gnu_lookup(key)
+
+        if self._sysv is not None:
+            return self._sysv_lookup(key)
+
+        return False
+
+    def defined(self, keys: Sequence[SymbolKey]) -> List[SymbolKey]:
+        """
+        Return the keys of the symbols the object defines, among the given
+        ones. The bloom filter of the GNU hash table is applied to the whole
+        batch first, as it rules out most of the symbols an object does not
+        define.
+        """
+        if self._gnu is None:
+            return [key for key in keys if self.defines(key)]
+
+        _, bloom, bits, shift, _, _ = self._gnu
+        size = len(bloom)
+
+        # Test the two bits of the filter in separate passes: the first one
+        # already discards most keys, and a comprehension is much cheaper
+        # than a call per key
+        candidates = [
+            key for key in keys
+            if bloom[key.gnu // bits % size] >> (key.gnu % bits) & 1
+        ]
+        candidates = [
+            key for key in candidates
+            if bloom[key.gnu // bits % size] >> ((key.gnu >> shift) % bits) & 1
+        ]
+
+        return [key for key in candidates if self._gnu_lookup(key)]
+
+    def _bloom(self, value: int) -> bool:
+        _, bloom, bits, shift, _, _ = self._gnu
+        word = bloom[value // bits % len(bloom)]
+        return bool(word >> (value % bits) & word >> ((value >> shift) % bits)
+                    & 1)
+
+    def _gnu_lookup(self, key: SymbolKey) -> bool:
+        symoffset, _, _, _, buckets, chains = self._gnu
+        value = key.gnu
+
+        index = buckets[value % len(buckets)]
+        if index < symoffset:
+            return False
+
+        while index - symoffset < len(chains):
+            chain = chains[index - symoffset]
+
+            if (chain | 1) == (value | 1) and self._matches(index, key.name):
+                return True
+
+            if chain & 1:
+                return False
+
+            index += 1
+
+        return False
+
+    def _sysv_lookup(self, key: SymbolKey) -> bool:
+        buckets, chains = self._sysv
+
+        index = buckets[key.sysv % len(buckets)]
+        while index and index < len(chains):
+            if self._matches(index, key.name):
+                return True
+            index = chains[index]
+
+        return False
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+    def __repr__(self):
+        return f"SymbolTable('{self.path}')"
+
+
+class Scope:
+    """
+    Global lookup scope: symbol tables in load order
+    """
+
+    @classmethod
+    def from_paths(cls, paths: Sequence[Union[str, Path]]):
+        """
+        -> Scope
+        Load the symbol tables of the given files, in load order. Files that
+        cannot be parsed are skipped with an error message.
+        """
+        tables = []
+
+        for path in paths:
+            try:
+                tables.append(SymbolTable.load(path))
+            except (ElfFormatError, OSError, ValueError) as err:
+                logging.error("Error parsing '%s' for symbols: %s", path,
+                              err)
+
+        return cls(tables)
+
+    def __init__(self, tables: List[SymbolTable]):
+        self.tables = tables
+        self._bindings: Dict[bytes, Optional[SymbolTable]] = {}
+
+    def bind(self, name: Union[str, bytes]) -> Optional[SymbolTable]:
+        """
+        Return the table the dynamic linker would bind the symbol to, or None
+        """
+        if isinstance(name, str):
+            name = name.encode()
+
+        if name not in self._bindings:
+            key = SymbolKey(name)
+            self._bindings[name] = next(
+                (table for table in self.tables if table.defines(key)), None)
+
+        return self._bindings[name]
+
+    def bind_all(self, names: Sequence[bytes]):
+        """
+        Bind a batch of symbols: every table is queried once for all the
+        symbols not bound yet, in load order
+        """
+        pending = [
+            SymbolKey(name) for name in set(names) if name not in self._bindings
+        ]
+
+        for table in self.tables:
+            if not pending:
+                break
+
+            found = table.defined(pending)
+            if not found:
+                continue
+
+            for key in found:
+                self._bindings[key.name] = table
+
+            pending = [key for key in pending if key.name not in self._bindings]
+
+        for key in pending:
+            self._bindings[key.name] = None
+
+    def unresolved(self) -> Dict[str, Set[str]]:
+        """
+        -> dict(path: set(str))
+        Undefined, non-weak symbols of each object with no definition in the
+        scope; objects with all their symbols bound are omitted
+        """
+        undefined = {table.path: set(table.undefined()) for table in self.tables}
+        self.bind_all(set().union(*undefined.values()))
+
+        unresolved = {}
+
+        for table in self.tables:
+            missing = {
+                name.decode(errors='replace')
+                for name in undefined[table.path]
+                if self._bindings[name] is None
+            }
+
+            if missing:
+                unresolved[table.path] = missing
+
+        return unresolved
+
+    def close(self):
+        for table in self.tables:
+            table.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
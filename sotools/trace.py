@@ -0,0 +1,173 @@
+"""
+Structured trace of the library resolution process, in the spirit of
+LD_DEBUG=libs
+
+The resolver emits typed events to the sinks registered on TRACER. When no
+sink is registered, emitting code is skipped entirely after checking
+TRACER.enabled, so tracing costs a single attribute lookup per probe.
+
+Sinks are callables receiving the events; StreamSink and LoggingSink format
+them as LD_DEBUG=libs compatible text or JSON lines.
+"""
+
+import os
+import sys
+import json
+import logging
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import (
+    Callable,
+    List,
+    TextIO,
+    Tuple,
+)
+
+
+@dataclass(frozen=True)
+class SearchStart:
+    """A library lookup begins"""
+    soname: str
+
+
+@dataclass(frozen=True)
+class SearchPath:
+    """A list of directories is about to be searched"""
+    paths: Tuple[str, ...]
+    reason: str
+
+
+@dataclass(frozen=True)
+class Probe:
+    """A file is tested for existence"""
+    path: str
+
+
+@dataclass(frozen=True)
+class CacheSearch:
+    """The dynamic linker cache is queried"""
+    cache_file: str
+
+
+@dataclass(frozen=True)
+class CacheHit:
+    """The dynamic linker cache contains the library"""
+    soname: str
+    path: str
+
+
+@dataclass(frozen=True)
+class Found:
+    """The library lookup succeeded"""
+    soname: str
+    path: str
+
+
+@dataclass(frozen=True)
+class NotFound:
+    """The library lookup failed"""
+    soname: str
+
+
+Sink = Callable[[object], None]
+
+
+class Tracer:
+    """
+    Dispatches events to the registered sinks
+    """
+
+    def __init__(self):
+        self.sinks: List[Sink] = []
+        self.enabled = False
+
+    def add_sink(self, sink: Sink) -> Sink:
+        self.sinks.append(sink)
+        self.enabled = True
+        return sink
+
+    def remove_sink(self, sink: Sink):
+        self.sinks.remove(sink)
+        self.enabled = bool(self.sinks)
+
+    def emit(self, event):
+        for sink in self.sinks:
+            sink(event)
+
+    @contextmanager
+    def capture(self):
+        """
+        Collect the events emitted in the block in a list
+        """
+        events = []
+        self.add_sink(events.append)
+        try:
+            yield events
+        finally:
+            self.remove_sink(events.append)
+
+
+TRACER = Tracer()
+
+
+def libs_format(event, pid: int = 0) -> str:
+    """
+    Format an event as the matching LD_DEBUG=libs line
+    """
+    prefix = f"{pid or os.getpid():>10}:\t"
+
+    if isinstance(event, SearchStart):
+        return f"{prefix}find library={event.soname} [0]; searching"
+    if isinstance(event, SearchPath):
+        return f"{prefix} search path={os.pathsep.join(event.paths)}\t\t({event.reason})"
+    if isinstance(event, Probe):
+        return f"{prefix}  trying file={event.path}"
+    if isinstance(event, CacheSearch):
+        return f"{prefix} search cache={event.cache_file}"
+    if isinstance(event, CacheHit):
+        return f"{prefix}  trying file={event.path}"
+    if isinstance(event, Found):
+        return f"{prefix}"
+    if isinstance(event, NotFound):
+        return f"{prefix}{event.soname}: cannot open shared object file"
+
+    return f"{prefix}{event}"
+
+
+def json_format(event) -> str:
+    """
+    Format an event as a JSON object, with its type in the 'event' field
+    """
+    return json.dumps(dict(event=type(event).__name__, **asdict(event)))
+
+
+FORMATS = {
+    'libs': libs_format,
+    'json': json_format,
+}
+
+
+class StreamSink:
+    """
+    Sink writing formatted events to a stream, one per line
+    """
+
+    def __init__(self, stream: TextIO = sys.stderr, format_: str = 'libs'):
+        self.stream = stream
+        self.formatter = FORMATS[format_]
+
+    def __call__(self, event):
+        print(self.formatter(event), file=self.stream)
+
+
+class LoggingSink:
+    """
+    Sink forwarding formatted events to the logging module
+    """
+
+    def __init__(self, level: int = logging.DEBUG, format_: str = 'libs'):
+        self.level = level
+        self.formatter = FORMATS[format_]
+
+    def __call__(self, event):
+        logging.log(self.level, "%s", self.formatter(event))
@@ -1,3 +1,28 @@
+from collections import deque
+from concurrent.futures import Executor
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
 def flatten(nested_list):
     """Flatten a nested list."""
     return [item for sublist in nested_list for item in sublist]
+
+
+def bounded_map(executor: Executor, function: Callable[[T], R],
+                iterable: Iterable[T], window: int) -> Iterator[R]:
+    """
+    Executor.map, submitting at most window calls ahead of the results
+    consumed instead of the whole iterable at once
+    """
+    pending = deque()
+
+    for item in iterable:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, item))
+
+    while pending:
+        yield pending.popleft().result()
@@ -0,0 +1,188 @@
+"""
+Re-validation of resolved library sets
+
+A resolved set goes stale when the files of its libraries are replaced, or
+when libraries appear in or vanish from the directories searched to resolve
+it. validate checks both with a single batch of stat calls, optionally
+threaded, and resolves again only the sonames that may have changed:
+
+    checked = validation.validate(libraries)
+    ...
+    checked = validation.validate(checked.libraries, checked.directories)
+
+Libraries are compared to the fingerprint recorded when their file was read,
+including the ones loaded from a snapshot. Directories have no such record:
+the first check returns their modification times, and the following checks
+given them also catch files added to or removed from the search path.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+)
+
+from sotools.diff import LibrarySetDiff, diff
+from sotools.libraryset import Library, LibrarySet
+from sotools.linker import search_directories as _search_order
+
+DEFAULT_CACHE = "/etc/ld.so.cache"
+
+
+class Validation(NamedTuple):
+    libraries: LibrarySet
+    # Sonames resolved or read again
+    invalidated: List[str]
+    delta: LibrarySetDiff
+    # Modification times in ns of the searched directories and cache file,
+    # None for the missing ones, to give to the next check
+    directories: Dict[str, Optional[int]]
+
+
+def _stat(path: str) -> Optional[os.stat_result]:
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def stat_all(paths: Iterable[str],
+             jobs: Optional[int] = 1) -> Dict[str, Optional[os.stat_result]]:
+    """
+    -> dict(str: os.stat_result or None)
+    stat every path once, with jobs threads; None for the ThreadPoolExecutor
+    default. Paths that cannot be accessed map to None.
+    """
+    paths = list(dict.fromkeys(paths))
+
+    if jobs == 1:
+        return dict(zip(paths, map(_stat, paths)))
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return dict(zip(paths, executor.map(_stat, paths)))
+
+
+def search_directories(libraries: LibrarySet,
+                       cache_file: str = DEFAULT_CACHE,
+                       hwcaps: Optional[Sequence[str]] = None) -> List[str]:
+    """
+    -> list(str)
+    The directories searched to resolve the dependencies of the set, in
+    search order, with their glibc-hwcaps subdirectories (see
+    linker.search_directories); the cache file stands for the directories
+    of its entries
+    """
+    order = [
+        directory or cache_file
+        for directory, _ in _search_order(libraries.rpath, libraries.runpath,
+                                          libraries.arch_flags(), hwcaps)
+    ]
+
+    return list(dict.fromkeys(map(os.path.normpath, order)))
+
+
+def _stale(library: Library, stat: Optional[os.stat_result]) -> bool:
+    if stat is None or library.fingerprint is None:
+        return True
+
+    if library.inode is not None and library.inode != (stat.st_dev,
+                                                       stat.st_ino):
+        return True
+
+    return library.fingerprint != (stat.st_size, stat.st_mtime_ns)
+
+
+def _reachable(libraries: LibrarySet, roots: Set[str]) -> LibrarySet:
+    """
+    -> LibrarySet
+    The libraries of the set needed by the roots, directly or not
+    """
+    by_soname = libraries.index.by_soname
+    reached = set()
+    stack = list(roots)
+
+    while stack:
+        soname = stack.pop()
+        if soname in reached:
+            continue
+
+        reached.add(soname)
+        for library in by_soname.get(soname, []):
+            stack.extend(library.dyn_dependencies)
+
+    return LibrarySet(filter(lambda x: x.soname in reached, libraries))
+
+
+def validate(libraries: LibrarySet,
+             directories: Optional[Dict[str, Optional[int]]] = None,
+             cache_file: str = DEFAULT_CACHE,
+             jobs: Optional[int] = 1) -> Validation:
+    """
+    -> Validation
+    Check the libraries of a resolved set against their files, and the
+    searched directories against the modification times of a previous
+    check, then resolve the invalidated sonames again
+
+    A library is invalidated when its file changed or vanished, or when a
+    directory searched before or where it was found changed: a new file
+    could take precedence. Top-level libraries are read again from their
+    path; libraries no longer needed after the update are left out.
+    """
+    order = search_directories(libraries, cache_file)
+    positions = {path: position for position, path in enumerate(order)}
+    members = [library for library in libraries if library.binary_path]
+
+    stats = stat_all(
+        [*order, *(library.binary_path for library in members)], jobs)
+
+    mtimes = {
+        path: stats[path].st_mtime_ns if stats[path] else None
+        for path in order
+    }
+    changed = {
+        path
+        for path, mtime in mtimes.items()
+        if directories is not None and directories.get(path, mtime) != mtime
+    }
+    first_changed = min(map(positions.get, changed), default=len(order))
+    cache_position = positions[os.path.normpath(cache_file)]
+
+    dependencies = libraries.index.dependencies
+    invalidated = set()
+
+    for library in members:
+        if _stale(library, stats[library.binary_path]):
+            invalidated.add(library.soname)
+        elif library.soname in dependencies:
+            directory = os.path.dirname(os.path.normpath(library.binary_path))
+            position = positions.get(directory, cache_position)
+            if first_changed <= position:
+                invalidated.add(library.soname)
+
+    if changed:
+        invalidated |= libraries.missing_libraries
+
+    if not invalidated:
+        return Validation(libraries, [], diff(libraries, libraries), mtimes)
+
+    roots = libraries.top_level
+    updated = LibrarySet(
+        filter(lambda x: x.soname not in invalidated, libraries))
+
+    for library in roots:
+        if library.soname in invalidated and library.binary_path and stats[
+                library.binary_path] is not None:
+            updated.add(Library.from_path(library.binary_path))
+
+    updated = updated.resolve()
+    if roots:
+        updated = _reachable(updated, roots.sonames)
+
+    return Validation(updated, sorted(invalidated), diff(libraries, updated),
+                      mtimes)
@@ -1,3 +1,30 @@
+import os
+import tempfile
+import unittest
 from pathlib import Path
+from unittest import mock
+
+from sotools.linker import _linker_path
 
 ASSETS = Path(__file__).parent / "assets"
+
+
+class SearchPathTestCase(unittest.TestCase):
+    """
+    Tests searching only the directories they give: LD_LIBRARY_PATH is
+    emptied, and first and second are empty directories to search
+    """
+
+    def setUp(self):
+        environment = mock.patch.dict(os.environ, {'LD_LIBRARY_PATH': ''})
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.addCleanup(_linker_path.cache_clear)
+        _linker_path.cache_clear()
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.first = Path(self.directory.name, 'first')
+        self.second = Path(self.directory.name, 'second')
+        self.first.mkdir()
+        self.second.mkdir()
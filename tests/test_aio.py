@@ -0,0 +1,119 @@
+import asyncio
+import unittest
+from unittest import mock
+from shutil import which
+from sotools import aio
+from sotools.ldd import ldd, NotELFError
+from sotools.libraryset import Library, LibrarySet
+from sotools.linker import resolve
+
+from tests import ASSETS
+
+
+class AsyncTest(unittest.TestCase):
+
+    def test_resolve(self):
+        path = asyncio.run(
+            aio.resolve("libmakebelieve.so.0", rpath=[ASSETS.as_posix()]))
+
+        self.assertEqual(
+            path, resolve("libmakebelieve.so.0", rpath=[ASSETS.as_posix()]))
+
+    @unittest.skipIf(not resolve('libm.so.6'), "No library to test with")
+    def test_create_from(self):
+        libset = asyncio.run(aio.create_from(['libm.so.6']))
+
+        self.assertTrue(libset.complete)
+        self.assertSetEqual(libset.sonames,
+                            LibrarySet.create_from(['libm.so.6']).sonames)
+
+    @unittest.skipIf(not resolve('libm.so.6'), "No library to test with")
+    def test_resolve_architectures(self):
+        libset = LibrarySet.create_from(['libm.so.6'])
+
+        closures = asyncio.run(aio.resolve_architectures(libset))
+        expected = libset.resolve_architectures()
+
+        self.assertSetEqual(set(closures), set(expected))
+        for arch_flags, closure in closures.items():
+            self.assertSetEqual(closure.sonames, expected[arch_flags].sonames)
+
+    def test_resolve_set_duplicates(self):
+        # Two dependencies leading to the same object, whose soname differs
+        # from both, are resolved as LibrarySet.resolve does
+        library = Library()
+        library.soname = 'tool'
+        library.dyn_dependencies = {
+            'libmakebelieve.so.0', 'libmakebelieve.so.0.0'
+        }
+        library.rpath = [ASSETS.as_posix()]
+        libset = LibrarySet([library])
+
+        resolved = asyncio.run(aio.resolve_set(libset))
+        self.assertSetEqual(resolved.sonames, libset.resolve().sonames)
+
+    def test_resolve_set_sibling_rpath(self):
+        # libzhidden.so is only found through the RPATH of libsibling.so,
+        # looked up before it in the same step: both resolvers find it the
+        # step after
+        def _library(soname, dependencies=(), rpath=()):
+            library = Library()
+            library.soname = soname
+            library.dyn_dependencies = set(dependencies)
+            library.rpath = list(rpath)
+            return library
+
+        def _from_path(path):
+            if path == '/first/libsibling.so':
+                return _library('libsibling.so', rpath=['/sibling'])
+            return _library('libzhidden.so')
+
+        def _lookup(calls, soname, rpath=None, runpath=None):
+            calls.append((soname, tuple(rpath)))
+            if soname == 'libsibling.so':
+                return '/first/libsibling.so'
+            if soname == 'libzhidden.so' and '/sibling' in rpath:
+                return '/sibling/libzhidden.so'
+            return None
+
+        libset = LibrarySet(
+            [_library('libroot.so', ['libzhidden.so', 'libsibling.so'])])
+        sync_calls, async_calls = [], []
+
+        with mock.patch.object(Library, 'from_path', side_effect=_from_path):
+            superset = LibrarySet(libset)
+            generated = list(
+                libset._resolution(superset,
+                                   lambda *a, **kw: _lookup(
+                                       sync_calls, *a, **kw)))
+            resolved = asyncio.run(
+                aio.resolve_set(
+                    libset,
+                    semaphore=asyncio.Semaphore(1),
+                    lookup=lambda *a, **kw: _lookup(async_calls, *a, **kw)))
+
+        self.assertListEqual([library.soname for library in generated],
+                             ['libsibling.so', 'libzhidden.so'])
+        self.assertTrue(superset.complete)
+        self.assertSetEqual(resolved.sonames, superset.sonames)
+        self.assertListEqual(async_calls, sync_calls)
+
+    @unittest.skipIf(not which('ls'), "No binary to test with")
+    def test_ldd(self):
+
+        async def _ldd_all(binaries):
+            limit = asyncio.Semaphore(2)
+            return await asyncio.gather(*(aio.ldd(binary, limit)
+                                          for binary in binaries))
+
+        binaries = [which('ls'), which('ls')]
+        expected = ldd(which('ls'))
+        for libraries in asyncio.run(_ldd_all(binaries)):
+            self.assertSetEqual(libraries.sonames, expected.sonames)
+            self.assertNotIn('ls', libraries.sonames)
+            self.assertSetEqual(libraries.missing_libraries,
+                                expected.missing_libraries)
+
+    def test_ldd_not_elf(self):
+        with self.assertRaises(NotELFError):
+            asyncio.run(aio.ldd(ASSETS / "make-believe.c"))
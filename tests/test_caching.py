@@ -0,0 +1,181 @@
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+import sotools
+from sotools.caching import SingleFlight, memoize
+from sotools.dl_cache import (
+    ResolvedEntry,
+    _cache_index,
+    _parse_cache,
+    cache_libraries,
+    clear_caches,
+    search_cache,
+)
+from sotools.dl_cache.flags import Flags
+from sotools.dl_cache.writer import serialize_cache
+from sotools.libraryset import Library, VersionTable
+from sotools.linker import resolve
+from sotools.profiling import CACHE_PARSED, ELF_PARSED, ELF_REUSED
+
+from tests import ASSETS
+
+THREADS = 16
+
+
+class CachingTest(unittest.TestCase):
+
+    def test_single_flight(self):
+        flight = SingleFlight()
+        calls = []
+        barrier = threading.Barrier(THREADS)
+
+        def _slow(value):
+            calls.append(value)
+            sleep(0.05)
+            return value * 2
+
+        def _call(_):
+            barrier.wait()
+            return flight.do('key', _slow, 21)
+
+        with ThreadPoolExecutor(THREADS) as pool:
+            results = list(pool.map(_call, range(THREADS)))
+
+        self.assertEqual(results, [42] * THREADS)
+        self.assertEqual(calls, [21])
+
+        # The key is released once the call completed
+        self.assertEqual(flight.do('key', _slow, 1), 2)
+
+    def test_single_flight_error(self):
+        flight = SingleFlight()
+
+        def _fail():
+            raise KeyError('failed')
+
+        with self.assertRaises(KeyError):
+            flight.do('key', _fail)
+
+        self.assertEqual(flight.do('key', int, '3'), 3)
+
+    def test_memoize(self):
+        calls = []
+
+        @memoize
+        def _double(value, factor=2):
+            calls.append(value)
+            sleep(0.01)
+            return value * factor
+
+        with ThreadPoolExecutor(THREADS) as pool:
+            results = list(pool.map(_double, [1, 2, 3] * THREADS))
+
+        self.assertEqual(results, [2, 4, 6] * THREADS)
+        self.assertEqual(sorted(calls), [1, 2, 3])
+
+        self.assertEqual(_double(2, factor=3), 6)
+        self.assertEqual(len(calls), 4)
+
+        _double.cache_clear()
+        _double(1)
+        self.assertEqual(len(calls), 5)
+
+    def test_memoize_maxsize(self):
+        calls = []
+
+        @memoize(maxsize=2)
+        def _square(value):
+            calls.append(value)
+            return value * value
+
+        self.assertEqual([_square(1), _square(2), _square(1)], [1, 4, 1])
+        self.assertEqual(calls, [1, 2])
+
+        # 2 is the least recently used result
+        _square(3)
+        _square(1)
+        self.assertEqual(calls, [1, 2, 3])
+        _square(2)
+        self.assertEqual(calls, [1, 2, 3, 2])
+
+    def test_clear_caches(self):
+        flags = Flags.FLAG_X8664_LIB64 | Flags.FLAG_ELF_LIBC6
+
+        def _write(path, value):
+            with open(path, 'wb') as file:
+                file.write(
+                    serialize_cache([
+                        ResolvedEntry(key='libcached.so.1',
+                                      value=value,
+                                      flags=flags)
+                    ]))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ld.so.cache')
+            _write(path, '/first/libcached.so.1')
+            self.assertEqual(search_cache('libcached.so.1', path, flags, []),
+                             '/first/libcached.so.1')
+
+            # A rewritten cache is read again once the caches are cleared
+            _write(path, '/second/libcached.so.1')
+            self.assertEqual(search_cache('libcached.so.1', path, flags, []),
+                             '/first/libcached.so.1')
+            clear_caches()
+            self.assertEqual(search_cache('libcached.so.1', path, flags, []),
+                             '/second/libcached.so.1')
+
+    def test_version_table(self):
+        table = VersionTable()
+        names = [f"VERSION_{index}" for index in range(200)]
+        barrier = threading.Barrier(THREADS)
+
+        def _intern(offset):
+            barrier.wait()
+            return [table.mask([name]) for name in names[offset:] + names[:offset]]
+
+        with ThreadPoolExecutor(THREADS) as pool:
+            list(pool.map(_intern, range(THREADS)))
+
+        self.assertEqual(len(table.names), len(names))
+        for name in names:
+            self.assertEqual(table.decode(table.mask([name])), {name})
+
+    def test_parse_once(self):
+        paths = [
+            ASSETS / 'libmakebelieve.so.0',
+            ASSETS / 'libmakebelieve.so.0.0',
+            ASSETS / 'libmakebelieve.so.0.0.1',
+        ] * 50
+        Library.clear_cache()
+
+        with sotools.profile() as stats:
+            with ThreadPoolExecutor(THREADS) as pool:
+                libraries = list(pool.map(Library.from_path, paths))
+
+        self.assertEqual(stats.counters[ELF_PARSED], 1)
+        self.assertEqual(stats.counters[ELF_REUSED], len(paths) - 1)
+        self.assertEqual([lib.binary_path for lib in libraries],
+                         list(map(str, paths)))
+
+    @unittest.skipIf(not resolve('libc.so.6'), "No library to test with")
+    def test_resolve_stress(self):
+        sonames = sorted(cache_libraries())[:200]
+        expected = [resolve(soname) for soname in sonames]
+        _parse_cache.cache_clear()
+        _cache_index.cache_clear()
+        barrier = threading.Barrier(THREADS)
+
+        def _resolve(offset):
+            barrier.wait()
+            return [resolve(soname) for soname in sonames[offset:]]
+
+        with sotools.profile() as stats:
+            with ThreadPoolExecutor(THREADS) as pool:
+                results = list(pool.map(_resolve, range(THREADS)))
+
+        self.assertEqual(stats.counters[CACHE_PARSED], 1)
+        for offset, paths in enumerate(results):
+            self.assertEqual(paths, expected[offset:])
@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from shutil import which
+from unittest import mock
+from sotools.database import LibraryDatabase
+from sotools.libraryset import _PARSED
+
+from tests import ASSETS
+
+MODERN_CACHE = f'{Path(__file__).parent}/assets/modern.so.cache'
+
+
+class DatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.database = LibraryDatabase()
+
+    def tearDown(self):
+        self.database.close()
+
+    def test_ingest(self):
+        with tempfile.TemporaryDirectory() as root:
+            library = Path(root, 'libmakebelieve.so.0.0.1')
+            shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1', library)
+            Path(root, 'make-believe.c').write_text("int main;")
+
+            self.assertEqual(self.database.ingest([root]), 1)
+            libraries = self.database.libraries('libmakebelieve')
+            self.assertEqual(len(libraries), 1)
+            self.assertEqual(libraries[0].path, os.path.realpath(library))
+            self.assertEqual(libraries[0].root, os.path.realpath(root))
+
+            # Unchanged files are not parsed again
+            self.assertEqual(self.database.ingest([root]), 0)
+
+            stat = library.stat()
+            os.utime(library, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            self.assertEqual(self.database.ingest([root]), 1)
+            self.assertEqual(self.database.libraries('libmakebelieve'),
+                             libraries)
+
+            library.unlink()
+            self.assertEqual(self.database.ingest([root]), 0)
+            self.assertEqual(self.database.libraries('libmakebelieve'), [])
+
+    def test_ingest_batches(self):
+        with tempfile.TemporaryDirectory() as root, \
+                tempfile.TemporaryDirectory() as directory:
+            for index in range(5):
+                shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1',
+                            Path(root, f'libcopy{index}.so'))
+
+            parsed = dict(_PARSED)
+            with mock.patch('sotools.database.BATCH_SIZE', 2):
+                self.assertEqual(self.database.ingest([root], jobs=2), 5)
+            # Files are parsed outside of the cache of Library
+            self.assertEqual(dict(_PARSED), parsed)
+
+            # Another connection to the same file continues the ids
+            path = Path(directory, 'libraries.db')
+            with LibraryDatabase(path) as first, \
+                    LibraryDatabase(path) as second:
+                first.ingest([root])
+                shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1',
+                            Path(root, 'libcopy5.so'))
+                self.assertEqual(second.ingest([root]), 1)
+                self.assertEqual(len(first.libraries('libcopy')), 6)
+
+    def test_nested_roots(self):
+        with tempfile.TemporaryDirectory() as root:
+            nested = Path(root, 'nested')
+            nested.mkdir()
+            shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1', nested)
+            shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1',
+                        Path(root, 'libother.so.0'))
+
+            self.assertEqual(self.database.ingest([nested]), 1)
+            self.assertEqual(self.database.ingest([root]), 1)
+            self.assertEqual(self.database.ingest([nested, root]), 0)
+            self.assertEqual(len(self.database.libraries()), 2)
+
+            # Files vanished from a nested root are removed by its parent
+            Path(nested, 'libmakebelieve.so.0.0.1').unlink()
+            self.assertEqual(self.database.ingest([root]), 0)
+            self.assertListEqual(
+                [library.path for library in self.database.libraries()],
+                [os.path.realpath(Path(root, 'libother.so.0'))])
+
+    @unittest.skipIf(not which('ls'), "No binary to test with")
+    def test_dependencies(self):
+        ls_bin = os.path.realpath(which('ls'))
+        self.database.ingest([ls_bin])
+
+        self.assertEqual(self.database.requesters('libc.so.6'), [ls_bin])
+        self.assertEqual(self.database.conflicts('libc.so'), {})
+
+        edges = dict(
+            self.database.connection.execute(
+                "SELECT soname, target FROM edges"))
+        self.assertTrue(edges['libc.so.6'])
+
+    def test_conflicts(self):
+        files = [
+            (1, '/bin/tool', '/', 0, 0, '/lib/ld.so'),
+            (2, '/a/libfoo.so.1', '/a', 0, 0, None),
+            (3, '/b/libfoo.so.1', '/b', 0, 0, None),
+            (4, '/b/libbar.so.1', '/b', 0, 0, None),
+        ]
+        libraries = [
+            (1, 'tool', 0),
+            (2, 'libfoo.so.1', 0),
+            (3, 'libfoo.so.1', 0),
+            (4, 'libbar.so.1', 0),
+        ]
+        edges = [
+            (1, 0, 'libfoo.so.1', '/a/libfoo.so.1'),
+            (1, 1, 'libbar.so.1', '/b/libbar.so.1'),
+            (4, 0, 'libfoo.so.1', '/b/libfoo.so.1'),
+            (4, 1, 'libbar.so.1', '/b/libbar.so.1'),
+        ]
+
+        with self.database.connection as connection:
+            connection.executemany(
+                "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)", files)
+            connection.executemany("INSERT INTO libraries VALUES (?, ?, ?)",
+                                   libraries)
+            connection.executemany("INSERT INTO edges VALUES (?, ?, ?, ?)",
+                                   edges)
+
+        self.assertEqual(self.database.conflicts('libfoo.so.*'),
+                         {'/bin/tool': ['/a/libfoo.so.1', '/b/libfoo.so.1']})
+        self.assertEqual(self.database.conflicts('libbar'), {})
+        self.assertEqual(self.database.requesters('libfoo.so.1'),
+                         ['/b/libbar.so.1', '/bin/tool'])
+
+    def test_cache_entries(self):
+        count = self.database.ingest_cache(MODERN_CACHE)
+        self.assertTrue(count)
+
+        entries = self.database.cache_entries('libm.so')
+        self.assertEqual([entry.soname for entry in entries], ['libm.so.6'])
+        self.assertEqual(entries[0].cache, MODERN_CACHE)
+
+        # Ingesting a cache again replaces its entries
+        self.assertEqual(self.database.ingest_cache(MODERN_CACHE), count)
+        self.assertEqual(len(self.database.cache_entries()), count)
+
+    def test_indexed_lookups(self):
+        plan = " ".join(
+            str(row) for row in self.database.connection.execute(
+                "EXPLAIN QUERY PLAN SELECT soname FROM libraries "
+                "WHERE soname GLOB ?", ('libz*', )))
+
+        self.assertIn('libraries_soname', plan)
@@ -0,0 +1,73 @@
+import unittest
+from sotools.diff import diff, PathChange, Requirement, VersionChange
+from sotools.libraryset import Library, LibrarySet
+
+
+def library(soname, path, defined=(), required=None):
+    lib = Library()
+    lib.soname = soname
+    lib.binary_path = path
+    lib.defined_versions = set(defined)
+    lib.required_versions = required or {}
+    lib.dyn_dependencies = set(lib.required_versions)
+    return lib
+
+
+class DiffTest(unittest.TestCase):
+
+    def test_identical(self):
+        libset = LibrarySet([library('liba.so', '/lib/liba.so')])
+
+        self.assertFalse(diff(libset, libset))
+        self.assertListEqual(diff(libset, libset).format(), [])
+
+    def test_diff(self):
+        old = LibrarySet([
+            library('liba.so', '/lib/liba.so', ['A_1', 'A_2']),
+            library('libb.so', '/lib/libb.so', [], {'liba.so': {'A_2'}}),
+            library('libold.so', '/lib/libold.so'),
+        ])
+        new = LibrarySet([
+            library('liba.so', '/opt/liba.so', ['A_1', 'A_0']),
+            library('libb.so', '/lib/libb.so', [], {'liba.so': {'A_2'}}),
+            library('libnew.so', '/lib/libnew.so'),
+        ])
+
+        result = diff(old, new)
+
+        self.assertTrue(result)
+        self.assertListEqual(result.added, ['libnew.so'])
+        self.assertListEqual(result.removed, ['libold.so'])
+        self.assertListEqual(
+            result.path_changed,
+            [PathChange('liba.so', '/lib/liba.so', '/opt/liba.so')])
+        self.assertListEqual(result.versions_changed,
+                             [VersionChange('liba.so', {'A_0'}, {'A_2'})])
+        self.assertListEqual(result.unsatisfied,
+                             [Requirement('libb.so', 'liba.so', {'A_2'})])
+
+        # Requirements already unsatisfied are not reported
+        self.assertListEqual(diff(new, new).unsatisfied, [])
+        self.assertIn("! libb.so requires liba.so A_2", result.format())
+
+    def test_duplicates(self):
+        first = library('liba.so', '/lib/liba.so', ['A_1'])
+        second = library('liba.so', '/opt/liba.so', ['A_2'])
+        user = library('libb.so', '/lib/libb.so', [], {'liba.so': {'A_2'}})
+
+        old = LibrarySet([first, second, user])
+        new = LibrarySet([second, first, user])
+
+        # Libraries sharing a soname are compared as a whole, whatever
+        # their order, and any of them may satisfy a requirement
+        self.assertFalse(diff(old, new))
+
+        changed = diff(old, LibrarySet([first, user]))
+        self.assertListEqual(
+            changed.path_changed,
+            [PathChange('liba.so', '/lib/liba.so, /opt/liba.so',
+                        '/lib/liba.so')])
+        self.assertListEqual(changed.versions_changed,
+                             [VersionChange('liba.so', set(), {'A_2'})])
+        self.assertListEqual(changed.unsatisfied,
+                             [Requirement('libb.so', 'liba.so', {'A_2'})])
@@ -1,5 +1,9 @@
+import os
+import shutil
+import tempfile
 import unittest
 from pathlib import Path
+from unittest import mock
 from sotools.dl_cache.structure import (
     BinaryStruct,
     deserialize_null_terminated_string,
@@ -24,15 +28,29 @@ from sotools.dl_cache.extensions.hwcaps import (
     dl_cache_hwcap_extension,
 )
 from sotools.dl_cache.flags import Flags
+from sotools.linker import resolve
+from sotools.dl_cache.writer import (
+    GENERATOR,
+    configured_directories,
+    libcmp,
+    scan_directories,
+    serialize_cache,
+    write_cache,
+    _scan,
+)
 from sotools.dl_cache import (
     DynamicLinkerCache,
+    ResolvedEntry,
     _cache_libraries,
     _parse_cache,
     cache_libraries,
     get_generator,
+    query_cache,
     search_cache,
 )
 
+from tests import ASSETS
+
 EMBEDDED_CACHE = f'{Path(__file__).parent}/assets/embedded.so.cache'
 MODERN_CACHE = f'{Path(__file__).parent}/assets/modern.so.cache'
 HWCAPS_CACHE = f'{Path(__file__).parent}/assets/with_hwcaps.so.cache'
@@ -294,3 +312,335 @@ class DLCacheTest(unittest.TestCase):
         self.assertIsInstance(_parse_cache(EMBEDDED_CACHE), DynamicLinkerCache)
         self.assertIsInstance(_parse_cache(MODERN_CACHE), DynamicLinkerCache)
         self.assertIsInstance(_parse_cache(HWCAPS_CACHE), DynamicLinkerCache)
+
+    def test_hwcaps_string_values(self):
+        with open(HWCAPS_CACHE, 'rb') as cache_file:
+            cache_data = cache_file.read()
+
+        header = _CacheHeader.deserialize(cache_data)
+
+        for section in cache_extension_sections(
+                cache_data[header.offset + header.extension_offset:]):
+            if section.tag == CacheExtensionTag.TAG_GLIBC_HWCAPS:
+                self.assertEqual(
+                    HWCAPSection(section).string_values(cache_data),
+                    ['power9'])
+
+    def test_hwcaps_priority(self):
+        flags = Flags.FLAG_POWERPC_LIB64 | Flags.FLAG_ELF_LIBC6
+
+        self.assertEqual(
+            search_cache('libc.so.6', HWCAPS_CACHE, flags, hwcaps=[]),
+            '/lib64/libc.so.6')
+        self.assertEqual(
+            search_cache('libc.so.6', HWCAPS_CACHE, flags,
+                         hwcaps=['power10', 'power9']),
+            '/lib64/glibc-hwcaps/power9/libc-2.28.so')
+
+        entries = cache_libraries(HWCAPS_CACHE, flags, hwcaps=['power9'])
+        self.assertEqual(entries['libm.so.6'],
+                         '/lib64/glibc-hwcaps/power9/libm-2.28.so')
+
+        entries = cache_libraries(HWCAPS_CACHE, flags, hwcaps=[])
+        self.assertEqual(entries['libm.so.6'], '/lib64/libm.so.6')
+
+    def test_load(self):
+        cache = DynamicLinkerCache.load(HWCAPS_CACHE)
+
+        self.assertEqual(cache.file, HWCAPS_CACHE)
+        self.assertTrue(cache.generator)
+        self.assertEqual(cache.hwcaps, ['power9'])
+        self.assertEqual(len(cache.entries), cache.header.nlibs)
+        self.assertEqual(
+            cache.extension(CacheExtensionTag.TAG_GENERATOR)[0].decode(),
+            cache.generator)
+        self.assertEqual(cache.extension(CacheExtensionTag.COUNT), [])
+
+        cache = DynamicLinkerCache.load(EMBEDDED_CACHE)
+        self.assertIsNone(cache.generator)
+        self.assertEqual(cache.hwcaps, [])
+
+        with self.assertRaises(OSError):
+            DynamicLinkerCache.load('/not/a/file')
+
+    def test_query(self):
+        cache = DynamicLinkerCache.load(MODERN_CACHE)
+
+        self.assertListEqual([entry.key for entry in cache.query('libm.so')],
+                             ['libm.so.6'])
+
+        keys = [entry.key for entry in cache.query('libz')]
+        self.assertListEqual(keys, sorted(keys))
+        self.assertIn('libz.so.1', keys)
+        self.assertIn('libzstd.so.1', keys)
+
+        self.assertListEqual(
+            [entry.key for entry in cache.query('libz*.so.?')],
+            ['libz.so.1', 'libzstd.so.1'])
+        self.assertEqual(len(cache.query('*')), len(cache.entries))
+        self.assertEqual(len(cache.query('')), len(cache.entries))
+        self.assertListEqual(cache.query('libnotinthecache'), [])
+
+    def test_query_cache(self):
+        entries = cache_libraries(MODERN_CACHE)
+
+        self.assertDictEqual(
+            query_cache('libz', MODERN_CACHE), {
+                soname: path
+                for soname, path in entries.items()
+                if soname.startswith('libz')
+            })
+        self.assertDictEqual(query_cache('lib*.so.6', MODERN_CACHE), {
+            soname: path
+            for soname, path in entries.items() if soname.endswith('.so.6')
+        })
+        self.assertDictEqual(query_cache('[', MODERN_CACHE), {})
+
+    def test_load_truncated(self):
+        with open(MODERN_CACHE, 'rb') as cache_file:
+            cache_data = cache_file.read()
+
+        with self.assertRaises(Exception):
+            DynamicLinkerCache(cache_data[:100])
+
+    def test_unpack_array(self):
+        with open(MODERN_CACHE, 'rb') as cache_file:
+            cache_data = cache_file.read()
+
+        header = _CacheHeader.deserialize(cache_data)
+        header_size = BinaryStruct.sizeof(header.__class__)
+        entry_size = BinaryStruct.sizeof(_FileEntryNew)
+
+        unpacked = list(
+            _FileEntryNew.unpack_array(cache_data[header_size:], 2))
+        for index, fields in enumerate(unpacked):
+            offset = header_size + index * entry_size
+            entry = _FileEntryNew.deserialize(cache_data[offset:])
+
+            self.assertEqual(
+                fields,
+                tuple(
+                    getattr(entry, name)
+                    for name in _FileEntryNew.fields()))
+
+        self.assertEqual(BinaryStruct.format(_CacheHeaderNew)[0], '<')
+        with self.assertRaises(Exception):
+            list(_FileEntryNew.unpack_array(b'', 1))
+
+    def test_libcmp(self):
+        self.assertGreater(libcmp('libc.so.10', 'libc.so.9'), 0)
+        self.assertLess(libcmp('libc.so', 'libc.so.6'), 0)
+        self.assertEqual(libcmp('libm.so.6', 'libm.so.6'), 0)
+        self.assertLess(libcmp('liba.so', 'libb.so'), 0)
+
+    def test_serialize_roundtrip(self):
+        for path in (MODERN_CACHE, HWCAPS_CACHE):
+            cache = DynamicLinkerCache.load(path)
+            written = DynamicLinkerCache(
+                serialize_cache(cache.entries, cache.generator))
+
+            self.assertEqual(written.entries, cache.entries)
+            self.assertEqual(written.generator, cache.generator)
+            self.assertEqual(written.hwcaps, cache.hwcaps)
+
+    def test_write_cache(self):
+        with tempfile.TemporaryDirectory() as root:
+            libdir = Path(root, 'usr', 'lib64')
+            hwcaps = libdir / 'glibc-hwcaps' / 'x86-64-v3'
+            hwcaps.mkdir(parents=True)
+
+            shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1', libdir)
+            (libdir / 'libmakebelieve.so.0').symlink_to(
+                'libmakebelieve.so.0.0.1')
+            (libdir / 'libmakebelieve.so').symlink_to('libmakebelieve.so.0')
+            shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1',
+                        hwcaps / 'libmakebelieve.so.0')
+
+            conf = Path(root, 'etc', 'ld.so.conf')
+            conf.parent.mkdir()
+            conf.write_text("include ld.so.conf.d/*.conf\n")
+            Path(root, 'etc', 'ld.so.conf.d').mkdir()
+            Path(root, 'etc', 'ld.so.conf.d', 'lib.conf').write_text(
+                "# Comment\n/usr/lib64\n/not/a/dir\n")
+
+            directories = configured_directories('/etc/ld.so.conf', root)
+            self.assertEqual(directories, ['/usr/lib64', '/not/a/dir'])
+
+            output = Path(root, 'ld.so.cache').as_posix()
+            write_cache(output, directories, root=root)
+            cache = DynamicLinkerCache.load(output)
+
+            self.assertEqual(cache.hwcaps, ['x86-64-v3'])
+            self.assertEqual(cache.generator, GENERATOR)
+
+            flags = Flags.FLAG_X8664_LIB64 | Flags.FLAG_ELF_LIBC6
+            self.assertEqual(
+                search_cache('libmakebelieve.so.0', output, flags, []),
+                '/usr/lib64/libmakebelieve.so.0')
+            self.assertEqual(
+                search_cache('libmakebelieve.so.0', output, flags,
+                             ['x86-64-v3']),
+                '/usr/lib64/glibc-hwcaps/x86-64-v3/libmakebelieve.so.0')
+            self.assertEqual(search_cache('libmakebelieve.so', output, flags,
+                                          []), '/usr/lib64/libmakebelieve.so')
+
+            # The stamps of the files let the next run reuse every entry
+            self.assertTrue(
+                cache.extension(CacheExtensionTag.TAG_SOTOOLS_STAMPS))
+            with mock.patch('sotools.dl_cache.writer._parse') as parse:
+                entries = write_cache(output,
+                                      directories,
+                                      root=root,
+                                      incremental=True)
+            parse.assert_not_called()
+            self.assertEqual(sorted(entries, key=lambda entry: entry.value),
+                             sorted(cache.entries,
+                                    key=lambda entry: entry.value))
+
+    def test_scan_sysroot_links(self):
+        with tempfile.TemporaryDirectory() as root:
+            usrlib = Path(root, 'usr', 'lib')
+            usrlib.mkdir(parents=True)
+            lib64 = Path(root, 'lib64')
+            lib64.mkdir()
+            shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1', usrlib)
+
+            # Absolute links are resolved inside the root: this one dangles
+            # on the host, and the second only exists on the host
+            (lib64 / 'libmakebelieve.so.0').symlink_to(
+                '/usr/lib/libmakebelieve.so.0.0.1')
+            (lib64 / 'libhost.so.0').symlink_to(
+                (ASSETS / 'libmakebelieve.so.0.0.1').as_posix())
+
+            # The same directory through an absolute directory link
+            Path(root, 'lib').symlink_to('/usr/lib')
+
+            entries = scan_directories(['/lib64', '/usr/lib', '/lib'],
+                                       root=root)
+            self.assertEqual(
+                sorted(entry.value for entry in entries),
+                ['/lib64/libmakebelieve.so.0',
+                 '/usr/lib/libmakebelieve.so.0.0.1'])
+
+    def test_build_sysroot_default_output(self):
+        from sotools.scripts import ldconfig
+
+        def _write_cache(cache_file, *args, **kwargs):
+            self.assertNotEqual(os.path.abspath(cache_file),
+                                ldconfig.DEFAULT_CACHE)
+            return write_cache(cache_file, *args, **kwargs)
+
+        with tempfile.TemporaryDirectory() as root:
+            Path(root, 'etc').mkdir()
+            Path(root, 'usr', 'lib64').mkdir(parents=True)
+            shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1',
+                        Path(root, 'usr', 'lib64'))
+            argv = ['ldconfig.py', '--build', '-r', root, '-d', '/usr/lib64']
+
+            with mock.patch('sys.argv', argv), \
+                    mock.patch('sotools.dl_cache.writer.write_cache',
+                               side_effect=_write_cache) as write, \
+                    mock.patch('sys.stdout'):
+                with self.assertRaises(SystemExit) as exit_status:
+                    ldconfig.main()
+
+            self.assertEqual(exit_status.exception.code, 0)
+            write.assert_called_once()
+            output = Path(root, 'etc', 'ld.so.cache')
+            self.assertEqual(write.call_args[0][0], output.as_posix())
+            self.assertEqual(
+                [entry.value for entry in DynamicLinkerCache.load(
+                    output.as_posix()).entries],
+                ['/usr/lib64/libmakebelieve.so.0.0.1'])
+
+    def test_scan_incremental(self):
+        with tempfile.TemporaryDirectory() as root:
+            shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1', root)
+            Path(root, 'libmakebelieve.so.0').symlink_to(
+                'libmakebelieve.so.0.0.1')
+
+            entries, stamps = _scan([root], root='/', jobs=2, previous=None)
+            self.assertEqual([entry.key for entry in entries],
+                             ['libmakebelieve.so.0'])
+            self.assertEqual(scan_directories([root], jobs=2), entries)
+
+            # Entries of unchanged files are taken from the previous cache
+            previous = ResolvedEntry(key='libmakebelieve.so.0',
+                                     value=entries[0].value,
+                                     flags=Flags.FLAG_SPARC_LIB64)
+            cache = DynamicLinkerCache(
+                serialize_cache([previous], stamps=stamps))
+
+            reused = scan_directories([root], previous=cache)
+            self.assertEqual(reused[0].flags, Flags.FLAG_SPARC_LIB64)
+
+            # Without stamps, nothing tells the files did not change
+            unstamped = DynamicLinkerCache(serialize_cache([previous]))
+            self.assertEqual(scan_directories([root], previous=unstamped),
+                             entries)
+
+            # A file replaced with its modification time preserved changes
+            # stamp all the same
+            target = Path(root, 'libmakebelieve.so.0.0.1')
+            info = target.stat()
+            replacement = Path(root, 'replacement')
+            shutil.copy(target, replacement)
+            os.utime(replacement, ns=(info.st_atime_ns, info.st_mtime_ns))
+            os.replace(replacement, target)
+
+            rescanned = scan_directories([root], previous=cache)
+            self.assertEqual(rescanned, entries)
+
+    @unittest.skipIf(not resolve('libc.so.6'), "No library to test with")
+    def test_scan_incremental_links(self):
+        with tempfile.TemporaryDirectory() as root:
+            # An object with a soname, unlike the test assets
+            shutil.copy(resolve('libc.so.6'), Path(root, 'libc-2.99.so'))
+            Path(root, 'libc.so.6').symlink_to('libc-2.99.so')
+            Path(root, 'libc.so').symlink_to('libc.so.6')
+
+            scandir = os.scandir
+
+            class _SortedScandir(list):
+                # List the development link before the soname link
+                def __init__(self, path):
+                    with scandir(path) as iterator:
+                        super().__init__(
+                            sorted(iterator, key=lambda entry: entry.name))
+
+                def __enter__(self):
+                    return self
+
+                def __exit__(self, *_):
+                    pass
+
+            with mock.patch('sotools.dl_cache.writer.os.scandir',
+                            _SortedScandir):
+                entries, stamps = _scan([root], '/', 1, None)
+                self.assertEqual(sorted(entry.key for entry in entries),
+                                 ['libc.so', 'libc.so.6'])
+                self.assertEqual(
+                    sorted(stamps),
+                    sorted(entry.value for entry in entries))
+
+                cache = DynamicLinkerCache(
+                    serialize_cache(entries, stamps=stamps))
+                with mock.patch('sotools.dl_cache.writer._parse') as parse:
+                    reused = scan_directories([root], jobs=1, previous=cache)
+                parse.assert_not_called()
+
+            self.assertEqual(sorted(reused, key=lambda entry: entry.key),
+                             sorted(entries, key=lambda entry: entry.key))
+
+    def test_flags_from_machine(self):
+        self.assertEqual(Flags.from_machine(2, 62),
+                         Flags.FLAG_X8664_LIB64 | Flags.FLAG_ELF_LIBC6)
+        self.assertEqual(Flags.from_machine(1, 62),
+                         Flags.FLAG_X8664_LIBX32 | Flags.FLAG_ELF_LIBC6)
+        self.assertEqual(Flags.from_machine(1, 3), Flags.FLAG_ELF_LIBC6)
+
+    def test_flags_from_name(self):
+        self.assertEqual(Flags.from_name('x86_64'), Flags.from_machine(2, 62))
+        self.assertEqual(Flags.from_name('i386'), Flags.FLAG_ELF_LIBC6)
+        self.assertIsNone(Flags.from_name('pdp11'))
+        self.assertIn('aarch64', Flags.architectures())
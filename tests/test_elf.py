@@ -0,0 +1,167 @@
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from sotools.elf import (
+    ELFCLASS64,
+    ET_DYN,
+    ElfBudgetError,
+    ElfFormatError,
+    ElfHeader,
+    MappedFile,
+    classify,
+    read_elf,
+    scan,
+)
+from concurrent.futures import ThreadPoolExecutor
+from sotools.util import bounded_map
+from sotools.libraryset import Library
+from sotools.linker import resolve
+
+from tests import ASSETS
+
+
+class ElfTest(unittest.TestCase):
+
+    def test_header(self):
+        with open(ASSETS / "libmakebelieve.so.0", 'rb') as file:
+            header = ElfHeader.parse(file.read(64))
+
+        self.assertEqual(header.elf_class, ELFCLASS64)
+        self.assertEqual(header.type, ET_DYN)
+        self.assertTrue(header.is_64bits)
+
+    def test_header_bad_format(self):
+        with self.assertRaises(ElfFormatError):
+            ElfHeader.parse("Not an ELF file".encode())
+
+        with self.assertRaises(ElfFormatError):
+            ElfHeader.parse("\x7fELF\x02\x01".encode())
+
+        with self.assertRaises(ElfFormatError):
+            read_elf(ASSETS / "make-believe.c")
+
+    def test_read_elf(self):
+        path = ASSETS / "libmakebelieve.so.0"
+        elf = read_elf(path)
+        library = Library.from_path(path)
+
+        self.assertEqual(elf.soname or path.name, library.soname)
+        self.assertSetEqual(set(elf.needed), library.dyn_dependencies)
+        self.assertTrue(elf.is_dynamic)
+
+    def test_read_versions(self):
+        path = ASSETS / "libmakebelieve.so.0"
+        elf = read_elf(path, versions=True)
+        library = Library.from_path(path)
+
+        self.assertSetEqual(set(elf.defined_versions),
+                            library.defined_versions)
+        self.assertDictEqual(
+            {soname: set(names)
+             for soname, names in elf.required_versions.items()},
+            library.required_versions)
+        self.assertIn('libc.so.6', elf.required_versions)
+
+        self.assertListEqual(read_elf(path).defined_versions, [])
+
+    @unittest.skipIf(not resolve('libc.so.6'), "No library to test with")
+    def test_read_defined_versions(self):
+        elf = read_elf(resolve('libc.so.6'), versions=True)
+
+        # The first definition is the object's own
+        self.assertEqual(elf.defined_versions[0], 'libc.so.6')
+        self.assertIn('GLIBC_PRIVATE', elf.defined_versions)
+
+    def test_mapped_file(self):
+        path = ASSETS / "libmakebelieve.so.0"
+
+        with MappedFile(path) as file:
+            self.assertEqual(file.read(4), b"\x7fELF")
+            self.assertEqual(file.bytes_touched, mmap.PAGESIZE)
+
+            file.seek(-4, 2)
+            self.assertEqual(len(file.read()), 4)
+            self.assertEqual(file.read(), b'')
+            self.assertEqual(file.tell(), path.stat().st_size)
+
+        with MappedFile(path, budget=mmap.PAGESIZE) as file:
+            file.read(16)
+            with self.assertRaises(ElfBudgetError):
+                file.read(mmap.PAGESIZE + 1)
+
+        with tempfile.NamedTemporaryFile() as empty:
+            with MappedFile(empty.name) as file:
+                self.assertEqual(file.read(), b'')
+
+            with self.assertRaises(ElfFormatError):
+                read_elf(empty.name)
+
+    def test_parse_budget(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, "libmakebelieve.so.0")
+            shutil.copy(ASSETS / "libmakebelieve.so.0", path)
+
+            with self.assertLogs(level='ERROR'):
+                library = Library.from_path(path, budget=mmap.PAGESIZE)
+            self.assertIsNone(library.binary_path)
+
+            # The incomplete parse is not reused
+            library = Library.from_path(path)
+            self.assertEqual(library.binary_path, str(path))
+
+    def test_classify(self):
+        elf = classify(ASSETS / "libmakebelieve.so.0")
+
+        self.assertEqual(elf.header.type, ET_DYN)
+        self.assertTrue(elf.has_dynamic)
+        self.assertIsNone(classify(ASSETS / "make-believe.c"))
+
+    def test_scan(self):
+        found = [elf.path for elf in scan([ASSETS])]
+        self.assertListEqual(found,
+                             [str(ASSETS / "libmakebelieve.so.0.0.1")])
+
+        linked = {
+            elf.path
+            for elf in scan([ASSETS], jobs=2, follow_symlinks=True)
+        }
+        self.assertSetEqual(linked, {
+            str(ASSETS / name) for name in [
+                "libmakebelieve.so.0",
+                "libmakebelieve.so.0.0",
+                "libmakebelieve.so.0.0.1",
+            ]
+        })
+
+    def test_scan_dynamic(self):
+        path = ASSETS / "libmakebelieve.so.0.0.1"
+        scanned, = scan([path], dynamic=True)
+
+        self.assertEqual(scanned, read_elf(path))
+
+    def test_scan_versions(self):
+        path = ASSETS / "libmakebelieve.so.0.0.1"
+        scanned, = scan([path], jobs=2, versions=True)
+
+        self.assertEqual(scanned, read_elf(path, versions=True))
+        info = os.stat(path)
+        self.assertEqual((scanned.stat.st_dev, scanned.stat.st_ino),
+                         (info.st_dev, info.st_ino))
+
+    def test_bounded_map(self):
+        consumed = []
+
+        def _items():
+            for item in range(100):
+                consumed.append(item)
+                yield item
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = bounded_map(executor, lambda x: x * 2, _items(), 4)
+            self.assertEqual(next(results), 0)
+            # The window is filled, plus the item that overflowed it
+            self.assertEqual(len(consumed), 5)
+            self.assertEqual(list(results), list(range(2, 200, 2)))
@@ -0,0 +1,77 @@
+import json
+import unittest
+from sotools.graph import DependencyGraph, Edge
+from sotools.libraryset import LibrarySet
+from sotools.linker import resolve
+
+
+def sample():
+    graph = DependencyGraph()
+    graph.add_node('app', '/bin/app')
+    graph.add_node('liba.so', '/lib/liba.so')
+    graph.add_node('libb.so', '/lib/libb.so')
+    graph.add_node('libc.so', '/lib/libc.so')
+
+    graph.add_edge('app', 'libb.so')
+    graph.add_edge('app', 'liba.so')
+    graph.add_edge('liba.so', 'libc.so')
+    graph.add_edge('libb.so', 'libc.so')
+    graph.add_edge('libb.so', 'libmissing.so')
+
+    return graph
+
+
+class DependencyGraphTest(unittest.TestCase):
+
+    def test_edges(self):
+        graph = sample()
+
+        self.assertIn(Edge('app', 'libb.so'), graph.edges)
+        self.assertListEqual(graph.requesters('libc.so'),
+                             ['liba.so', 'libb.so'])
+        self.assertListEqual(graph.missing, ['libmissing.so'])
+        self.assertListEqual(graph.roots, ['app'])
+
+    def test_load_order(self):
+        # Breadth-first, following the DT_NEEDED order
+        self.assertListEqual(
+            sample().load_order(),
+            ['app', 'libb.so', 'liba.so', 'libc.so', 'libmissing.so'])
+
+    def test_topological_order(self):
+        order = sample().topological_order()
+
+        for edge in sample().edges:
+            self.assertLess(order.index(edge.soname),
+                            order.index(edge.requester))
+
+    def test_cycles(self):
+        graph = sample()
+        self.assertListEqual(graph.cycles(), [])
+
+        graph.add_edge('libc.so', 'libb.so')
+        cycles = graph.cycles()
+
+        self.assertEqual(len(cycles), 1)
+        self.assertSetEqual(set(cycles[0]), {'libb.so', 'libc.so'})
+        self.assertEqual(graph.load_order()[-1], 'libmissing.so')
+
+    def test_export(self):
+        graph = sample()
+
+        data = json.loads(graph.to_json())
+        self.assertEqual(len(data['nodes']), 5)
+        self.assertIn(dict(requester='app', soname='liba.so'), data['edges'])
+
+        dot = graph.to_dot()
+        self.assertIn('"app" -> "liba.so";', dot)
+        self.assertIn('"libmissing.so" [style=dashed];', dot)
+
+    @unittest.skipIf(not resolve('libm.so.6'), "No library to test with")
+    def test_libraryset_graph(self):
+        libset = LibrarySet.create_from(['libm.so.6'])
+        graph = libset.graph()
+
+        self.assertSetEqual(set(graph.nodes), libset.sonames)
+        self.assertListEqual(graph.roots, ['libm.so.6'])
+        self.assertListEqual(graph.missing, [])
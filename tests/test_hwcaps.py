@@ -0,0 +1,49 @@
+import unittest
+from sotools.hwcaps import (
+    PPC_FEATURE2_ARCH_3_00,
+    PPC_FEATURE2_ARCH_3_1,
+    PPC_FEATURE2_HAS_IEEE128,
+    PPC_FEATURE2_MMA,
+    power_levels,
+    priorities,
+    supported_hwcaps,
+    x86_64_levels,
+)
+
+V2 = {'cx16', 'lahf_lm', 'popcnt', 'pni', 'sse4_1', 'sse4_2', 'ssse3'}
+V3 = {'avx', 'avx2', 'bmi1', 'bmi2', 'f16c', 'fma', 'abm', 'movbe', 'xsave'}
+V4 = {'avx512f', 'avx512bw', 'avx512cd', 'avx512dq', 'avx512vl'}
+
+
+class HWCapsTest(unittest.TestCase):
+
+    def test_x86_64_levels(self):
+        self.assertEqual(x86_64_levels(frozenset()), ())
+        self.assertEqual(x86_64_levels(frozenset(V2)), ('x86-64-v2', ))
+        self.assertEqual(x86_64_levels(frozenset(V2 | V3)),
+                         ('x86-64-v3', 'x86-64-v2'))
+        self.assertEqual(x86_64_levels(frozenset(V2 | V3 | V4)),
+                         ('x86-64-v4', 'x86-64-v3', 'x86-64-v2'))
+
+        # A level is only supported if all the lower levels are
+        self.assertEqual(x86_64_levels(frozenset(V3 | V4)), ())
+
+    def test_power_levels(self):
+        power9 = PPC_FEATURE2_ARCH_3_00 | PPC_FEATURE2_HAS_IEEE128
+        power10 = PPC_FEATURE2_ARCH_3_1 | PPC_FEATURE2_MMA
+
+        self.assertEqual(power_levels(0), ())
+        self.assertEqual(power_levels(power9), ('power9', ))
+        self.assertEqual(power_levels(power9 | power10),
+                         ('power10', 'power9'))
+        self.assertEqual(power_levels(power10), ())
+
+    def test_priorities(self):
+        ranks = priorities(('x86-64-v3', 'x86-64-v2'))
+
+        self.assertGreater(ranks['x86-64-v3'], ranks['x86-64-v2'])
+        self.assertNotIn('x86-64-v4', ranks)
+
+    def test_supported(self):
+        self.assertIsInstance(supported_hwcaps(), tuple)
+        self.assertEqual(supported_hwcaps('unknown'), ())
@@ -1,6 +1,8 @@
 import unittest
+from sotools.elf import classify
 from sotools.linker import resolve
 from sotools.libraryset import Library
+from tests import ASSETS
 
 class LibraryTest(unittest.TestCase):
     def test_library_bad_object(self):
@@ -25,3 +27,51 @@ class LibraryTest(unittest.TestCase):
 
         self.assertNotEqual(sample, 'libm.so.6')
         self.assertNotEqual('libm.so.6', sample)
+
+    @unittest.skipIf(not resolve('libm.so.6'), "No library to test with")
+    def test_library_from_elf(self):
+        path = resolve('libm.so.6')
+        library = Library.from_elf(classify(path, versions=True))
+        expected = Library.from_path(path)
+
+        self.assertEqual(library, expected)
+        self.assertEqual(library.binary_path, expected.binary_path)
+        self.assertEqual(library.arch_flags, expected.arch_flags)
+        self.assertEqual(library.inode, expected.inode)
+        self.assertEqual(library.fingerprint, expected.fingerprint)
+        self.assertEqual(library.defined_versions, expected.defined_versions)
+        self.assertEqual(library.required_versions,
+                         expected.required_versions)
+
+    def test_library_parsed_once(self):
+        Library.clear_cache()
+
+        link = Library.from_path(ASSETS / "libmakebelieve.so.0")
+        target = Library.from_path(ASSETS / "libmakebelieve.so.0.0.1")
+
+        self.assertEqual(link.inode, target.inode)
+        self.assertSetEqual(link.dyn_dependencies, target.dyn_dependencies)
+        self.assertEqual(link.binary_path,
+                         str(ASSETS / "libmakebelieve.so.0"))
+        self.assertEqual(target.binary_path,
+                         str(ASSETS / "libmakebelieve.so.0.0.1"))
+
+    def test_library_copies_independent(self):
+        first = Library.from_path(ASSETS / "libmakebelieve.so.0")
+        dependencies = set(first.dyn_dependencies)
+        versions = {
+            soname: set(names)
+            for soname, names in first.required_versions.items()
+        }
+
+        first.dyn_dependencies.clear()
+        first.needed.append('libinjected.so')
+        first.rpath.append('/injected')
+        for names in first.required_versions.values():
+            names.add('V_INJECTED')
+
+        second = Library.from_path(ASSETS / "libmakebelieve.so.0")
+        self.assertSetEqual(second.dyn_dependencies, dependencies)
+        self.assertNotIn('libinjected.so', second.needed)
+        self.assertNotIn('/injected', second.rpath)
+        self.assertDictEqual(second.required_versions, versions)
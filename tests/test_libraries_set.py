@@ -1,8 +1,13 @@
 from pathlib import Path
+import pickle
+import subprocess
+import sys
 import unittest
-from sotools.libraryset import LibrarySet, Library
+from sotools.libraryset import LibrarySet, Library, VERSIONS
 from sotools.linker import resolve
 
+from tests import ASSETS
+
 
 class LibrarySetTest(unittest.TestCase):
 
@@ -89,6 +94,20 @@ class LibrarySetTest(unittest.TestCase):
         for line in output:
             self.assertRegex(line, ".*.so.* => not found")
 
+    def test_ldd_entries(self):
+        lib = Library()
+        lib.soname = 'libdummy.so.1'
+        lib.binary_path = '/lib/libdummy.so.1'
+        lib.dyn_dependencies = {'libmissing.so.2', 'libabsent.so.3'}
+        libset = LibrarySet([lib])
+
+        self.assertListEqual(list(libset.ldd_entries()), [
+            ('libabsent.so.3', None),
+            ('libdummy.so.1', '/lib/libdummy.so.1'),
+            ('libmissing.so.2', None),
+        ])
+        self.assertListEqual(libset.ldd_format(), list(libset.ldd_lines()))
+
     @unittest.skipIf(not resolve('libm.so.6'), "No library to test with")
     def test_escape_soname(self):
         libset = LibrarySet.create_from(['libm.so.6'])
@@ -131,3 +150,133 @@ class LibrarySetTest(unittest.TestCase):
         self.assertEqual(len(libset), 1)
         saved_lib = libset.pop()
         self.assertEqual(saved_lib.binary_path, "/tmp/notalib.so")
+
+    def test_versions_bitset(self):
+        masks = VERSIONS.mask(['V_A', 'V_B'])
+
+        self.assertEqual(VERSIONS.mask(['V_A']) | VERSIONS.mask(['V_B']),
+                         masks)
+        self.assertSetEqual(VERSIONS.decode(masks), {'V_A', 'V_B'})
+
+    def test_outdated_bitset(self):
+        provider = Library()
+        provider.soname = 'libprovider.so'
+        provider.defined_versions = {'V_1', 'V_2'}
+
+        user = Library()
+        user.soname = 'libuser.so'
+        user.dyn_dependencies = {'libprovider.so'}
+        user.required_versions = {'libprovider.so': {'V_1'}}
+
+        libset = LibrarySet([provider, user])
+        self.assertTrue(libset.complete)
+        self.assertFalse(libset.outdated_libraries)
+
+        user.required_versions = {'libprovider.so': {'V_1', 'V_3'}}
+        libset.discard(user)
+        libset.add(user)
+
+        self.assertFalse(libset.complete)
+        self.assertSetEqual(libset.outdated_libraries.sonames,
+                            {'libprovider.so'})
+
+    def test_architectures(self):
+        native = Library.from_path(ASSETS / 'libmakebelieve.so.0')
+        self.assertIsNotNone(native.arch_flags)
+
+        foreign = Library()
+        foreign.soname = 'libforeign.so'
+        foreign.arch_flags = native.arch_flags ^ 0x100
+
+        groups = LibrarySet([native, foreign]).architectures()
+        self.assertSetEqual(set(groups), {native.arch_flags, foreign.arch_flags})
+        self.assertSetEqual(groups[native.arch_flags].sonames,
+                            {native.soname})
+
+    @unittest.skipIf(not resolve('libm.so.6'), "No library to test with")
+    def test_resolve_architectures(self):
+        libset = LibrarySet([Library.from_path(resolve('libm.so.6'))])
+
+        closures = libset.resolve_architectures()
+        self.assertListEqual(list(closures), [libset.arch_flags()])
+        self.assertSetEqual(closures[libset.arch_flags()].sonames,
+                            libset.resolve().sonames)
+
+    def test_pickle(self):
+        library = Library.from_path(ASSETS / 'libmakebelieve.so.0')
+        libset = LibrarySet([library])
+        libset.index
+
+        # Load the set in another process, where versions are interned in
+        # another order
+        check = (
+            "import pickle, sys\n"
+            "from sotools.libraryset import VERSIONS, Library\n"
+            "VERSIONS.mask(['V_1', 'V_2', 'V_3'])\n"
+            "libset = pickle.loads(sys.stdin.buffer.read())\n"
+            "library = next(iter(libset))\n"
+            f"assert library == Library.from_path({str(library.binary_path)!r})\n"
+            "assert VERSIONS.decode(library.required_mask) == "
+            "set.union(*library.required_versions.values())\n"
+            "assert libset.complete == False\n")
+        subprocess.run([sys.executable, '-c', check],
+                       input=pickle.dumps(libset),
+                       cwd=Path(__file__).parent.parent,
+                       check=True)
+
+        self.assertNotIn('defined_mask', library.__getstate__())
+
+    def test_pickle_index(self):
+        provider = Library()
+        provider.soname = 'libprovider.so'
+        provider.defined_versions = {'PICKLE_DEFINED'}
+        user = Library()
+        user.soname = 'user'
+        user.dyn_dependencies = {'libprovider.so'}
+        user.required_versions = {'libprovider.so': {'PICKLE_REQUIRED'}}
+
+        libset = LibrarySet([provider, user])
+        libset.index
+        self.assertNotIn('_index', libset.__reduce__()[2])
+
+        # Intern the versions in the opposite order before loading the set
+        check = (
+            "import pickle, sys\n"
+            "from sotools.libraryset import VERSIONS\n"
+            "VERSIONS.mask(['V_1', 'V_2', 'V_3', 'PICKLE_REQUIRED'])\n"
+            "VERSIONS.mask(['PICKLE_DEFINED'])\n"
+            "libset = pickle.loads(sys.stdin.buffer.read())\n"
+            "assert libset.defined_versions == {'PICKLE_DEFINED'}, "
+            "libset.defined_versions\n"
+            "assert libset.required_versions == {'PICKLE_REQUIRED'}, "
+            "libset.required_versions\n"
+            "assert libset.outdated_libraries.sonames == {'libprovider.so'}\n")
+        subprocess.run([sys.executable, '-c', check],
+                       input=pickle.dumps(libset),
+                       cwd=Path(__file__).parent.parent,
+                       check=True)
+
+    def test_index_invalidation(self):
+        library = Library()
+        library.soname = 'libindex.so'
+        library.dyn_dependencies = {'libmissing.so'}
+
+        libset = LibrarySet()
+        self.assertSetEqual(libset.sonames, set())
+
+        libset.add(library)
+        self.assertSetEqual(libset.sonames, {'libindex.so'})
+        self.assertSetEqual(libset.missing_libraries, {'libmissing.so'})
+
+        libset.discard(library)
+        self.assertSetEqual(libset.missing_libraries, set())
+
+        libset |= {library}
+        self.assertSetEqual(libset.sonames, {'libindex.so'})
+
+        # Members modified in place are indexed again once invalidated
+        library.dyn_dependencies.add('libother.so')
+        self.assertSetEqual(libset.missing_libraries, {'libmissing.so'})
+        libset.invalidate()
+        self.assertSetEqual(libset.missing_libraries,
+                            {'libmissing.so', 'libother.so'})
@@ -1,8 +1,20 @@
 import os
+import shutil
+import tempfile
 import unittest
 from pathlib import Path
+from unittest import mock
+import sotools.linker
+from sotools.dl_cache import Flags
 from sotools.linker import (
+    DirectoryIndex,
+    object_flags,
     resolve,
+    resolve_all,
+    resolve_arch,
+    resolve_arch_candidates,
+    resolve_candidates,
+    system_paths,
     _search_paths,
     _linker_path,
 )
@@ -59,3 +71,128 @@ class LinkerTest(unittest.TestCase):
                            runpath=[ASSETS.as_posix()],
                            absolute=True)
         self.assertEqual(absolute, ASSETS / "libmakebelieve.so.0.0.1")
+
+    def test_search_hwcaps(self):
+        with tempfile.TemporaryDirectory() as root:
+            subdirectory = Path(root, 'glibc-hwcaps', 'x86-64-v3')
+            subdirectory.mkdir(parents=True)
+            shutil.copy(ASSETS / "libmakebelieve.so.0", root)
+            shutil.copy(ASSETS / "libmakebelieve.so.0", subdirectory)
+
+            found = _search_paths("libmakebelieve.so.0", [Path(root)],
+                                  hwcaps=['x86-64-v4', 'x86-64-v3'])
+            self.assertEqual(found, subdirectory / "libmakebelieve.so.0")
+
+            found = _search_paths("libmakebelieve.so.0", [Path(root)],
+                                  hwcaps=[])
+            self.assertEqual(found, Path(root, "libmakebelieve.so.0"))
+
+    def test_resolve_all(self):
+        sonames = ["libmakebelieve.so.0", "libc.so.6", "libnotfound.so.1"]
+        results = list(resolve_all(sonames, rpath=[ASSETS.as_posix()]))
+
+        self.assertListEqual([soname for soname, _ in results], sonames)
+        for soname, path in results:
+            self.assertEqual(path, resolve(soname, rpath=[ASSETS.as_posix()]))
+
+    def test_resolve_candidates(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shutil.copy(ASSETS / "libmakebelieve.so.0.0.1",
+                        Path(directory, "libmakebelieve.so.0"))
+            Path(directory, "libnotfound.so.1").mkdir()
+
+            candidates = resolve_candidates(
+                "libmakebelieve.so.0",
+                rpath=[ASSETS.as_posix(), directory],
+                runpath=[ASSETS.as_posix()])
+
+            self.assertListEqual(
+                [(path, reason) for path, reason in candidates], [
+                    (ASSETS / "libmakebelieve.so.0", 'RPATH'),
+                    (Path(directory, "libmakebelieve.so.0"), 'RPATH'),
+                ])
+            self.assertEqual(
+                candidates[0].path,
+                resolve("libmakebelieve.so.0",
+                        rpath=[ASSETS.as_posix(), directory]))
+
+            self.assertListEqual(
+                resolve_candidates("libnotfound.so.1", rpath=[directory]), [])
+
+    def test_resolve_arch(self):
+        native = object_flags(ASSETS / "libmakebelieve.so.0")
+        self.assertIsNotNone(native)
+
+        with tempfile.TemporaryDirectory() as directory:
+            foreign = Path(directory, "libmakebelieve.so.0")
+            data = bytearray((ASSETS / "libmakebelieve.so.0").read_bytes())
+            # Rewrite e_machine: EM_AARCH64
+            data[18:20] = (183).to_bytes(2, 'little')
+            foreign.write_bytes(bytes(data))
+            foreign_flags = object_flags(foreign)
+            self.assertNotEqual(foreign_flags, native)
+
+            rpath = [directory, ASSETS.as_posix()]
+            self.assertEqual(
+                resolve_arch("libmakebelieve.so.0", native, rpath=rpath),
+                ASSETS / "libmakebelieve.so.0")
+            self.assertEqual(
+                resolve_arch("libmakebelieve.so.0", foreign_flags,
+                             rpath=rpath), foreign)
+
+            # Candidates of other architectures are left out
+            self.assertListEqual([
+                candidate.path for candidate in resolve_arch_candidates(
+                    "libmakebelieve.so.0", foreign_flags, rpath=rpath)
+            ], [foreign])
+            self.assertNotIn(
+                foreign,
+                [
+                    candidate.path for candidate in resolve_arch_candidates(
+                        "libmakebelieve.so.0", native, rpath=rpath)
+                ],
+            )
+
+        self.assertIsNone(object_flags(ASSETS / "make-believe.c"))
+        self.assertEqual(system_paths()[:2], ['/lib', '/usr/lib'])
+        self.assertIn('/usr/lib32', system_paths(Flags.FLAG_ELF_LIBC6))
+
+    def test_arch_candidates_order(self):
+        native = object_flags(ASSETS / "libmakebelieve.so.0")
+
+        with tempfile.TemporaryDirectory() as default, \
+                tempfile.TemporaryDirectory() as arch:
+            for directory in (default, arch):
+                shutil.copy(ASSETS / "libmakebelieve.so.0.0.1",
+                            Path(directory, "libmakebelieve.so.0"))
+
+            with mock.patch.object(sotools.linker, 'DEFAULT_PATHS',
+                                   [default]), \
+                    mock.patch.dict(sotools.linker.ARCH_PATHS,
+                                    {native: [arch]}):
+                _linker_path.cache_clear()
+                try:
+                    candidates = resolve_candidates("libmakebelieve.so.0",
+                                                    arch_flags=native)
+                    found = resolve("libmakebelieve.so.0", arch_flags=native)
+                    chosen = resolve_arch("libmakebelieve.so.0", native)
+                finally:
+                    _linker_path.cache_clear()
+
+        # The first candidate is what resolve returns; only resolve_arch
+        # searches the directories of the architecture first
+        self.assertEqual(candidates[0].path, found)
+        self.assertEqual(found, Path(default, "libmakebelieve.so.0"))
+        self.assertEqual(chosen, Path(arch, "libmakebelieve.so.0"))
+
+    def test_directory_index(self):
+        index = DirectoryIndex()
+
+        self.assertTrue(index.is_dir(ASSETS))
+        self.assertFalse(index.is_dir(ASSETS / "libmakebelieve.so.0"))
+        self.assertTrue(index.may_exist(ASSETS / "libmakebelieve.so.0"))
+        self.assertFalse(index.may_exist(ASSETS / "libnotfound.so.1"))
+
+        found = _search_paths("libmakebelieve.so.0", [Path("/usr/lib"), ASSETS],
+                              index=index)
+        self.assertEqual(found, Path(ASSETS, "libmakebelieve.so.0"))
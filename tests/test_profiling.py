@@ -0,0 +1,52 @@
+import unittest
+import sotools
+from sotools.linker import resolve
+from sotools.libraryset import Library
+from sotools.profiling import (
+    PROFILER,
+    ELF_BYTES,
+    ELF_PARSED,
+    ELF_REUSED,
+    LOOKUPS,
+    STAT,
+)
+
+from tests import ASSETS
+
+
+class ProfilingTest(unittest.TestCase):
+
+    def test_disabled(self):
+        self.assertFalse(PROFILER.enabled)
+
+        with sotools.profile():
+            self.assertTrue(PROFILER.enabled)
+
+        self.assertFalse(PROFILER.enabled)
+
+    def test_resolve(self):
+        with sotools.profile() as stats:
+            resolve("libmakebelieve.so.0", rpath=[ASSETS.as_posix()])
+
+        self.assertEqual(stats.counters[LOOKUPS], 1)
+        self.assertGreater(stats.counters[STAT], 0)
+        self.assertEqual(stats.lookups[0][0], "libmakebelieve.so.0")
+        self.assertGreater(stats.elapsed, 0)
+
+    def test_parse(self):
+        path = ASSETS / "libmakebelieve.so.0"
+        Library.clear_cache()
+
+        with sotools.profile() as outer:
+            with sotools.profile() as inner:
+                Library.from_path(path)
+                Library.from_path(ASSETS / "libmakebelieve.so.0.0")
+
+        for stats in (outer, inner):
+            self.assertEqual(stats.counters[ELF_PARSED], 1)
+            self.assertEqual(stats.counters[ELF_REUSED], 1)
+            self.assertGreater(stats.counters[ELF_BYTES], 0)
+            self.assertEqual(stats.slowest_parses()[0][0], str(path))
+
+        self.assertIn(ELF_PARSED, inner.report())
+        self.assertIn('parses', inner.as_dict())
@@ -0,0 +1,91 @@
+import shutil
+import unittest
+from sotools.libraryset import Library, LibrarySet
+from sotools.linker import object_flags, resolve
+from sotools.shadowing import inspect, shadowed_libraries
+
+from tests import ASSETS, SearchPathTestCase
+
+
+class ShadowingTest(SearchPathTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1',
+                    self.first / 'libmakebelieve.so.0')
+
+    def test_not_shadowed(self):
+        self.assertIsNone(
+            inspect('libmakebelieve.so.0', rpath=[self.first.as_posix()]))
+
+        # The same file found twice does not shadow itself
+        self.assertIsNone(
+            inspect('libmakebelieve.so.0',
+                    rpath=[self.first.as_posix()],
+                    runpath=[self.first.as_posix()]))
+
+    def test_identical(self):
+        shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1',
+                    self.second / 'libmakebelieve.so.0')
+
+        report = inspect('libmakebelieve.so.0',
+                         rpath=[self.first.as_posix()],
+                         runpath=[self.second.as_posix()])
+
+        self.assertEqual(report.selected.path,
+                         (self.first / 'libmakebelieve.so.0').as_posix())
+        self.assertEqual([candidate.reason for candidate in report.shadowed],
+                         ['RUNPATH'])
+        # Copies: same size, other inodes
+        self.assertEqual(report.selected.fingerprint[0],
+                         report.shadowed[0].fingerprint[0])
+        self.assertNotEqual(report.selected.inode, report.shadowed[0].inode)
+        self.assertFalse(report.divergent)
+        self.assertEqual(report.format()[0], 'libmakebelieve.so.0 (identical)')
+
+    def test_other_architecture(self):
+        data = bytearray((ASSETS / 'libmakebelieve.so.0.0.1').read_bytes())
+        # Rewrite e_machine: EM_AARCH64
+        data[18:20] = (183).to_bytes(2, 'little')
+        (self.second / 'libmakebelieve.so.0').write_bytes(bytes(data))
+
+        native = object_flags(self.first / 'libmakebelieve.so.0')
+        arguments = dict(rpath=[self.first.as_posix()],
+                         runpath=[self.second.as_posix()])
+
+        self.assertIsNotNone(inspect('libmakebelieve.so.0', **arguments))
+        # The dynamic linker skips the other copy: it does not shadow
+        self.assertIsNone(
+            inspect('libmakebelieve.so.0', arch_flags=native, **arguments))
+
+    @unittest.skipIf(not resolve('libm.so.6'), "No library to test with")
+    def test_divergent(self):
+        shutil.copy(resolve('libm.so.6'), self.second / 'libmakebelieve.so.0')
+
+        report = inspect('libmakebelieve.so.0',
+                         rpath=[self.first.as_posix()],
+                         runpath=[self.second.as_posix()],
+                         required=frozenset({'GLIBC_2.2.5'}))
+
+        self.assertTrue(report.divergent)
+        self.assertEqual(report.missing_versions, {'GLIBC_2.2.5'})
+        self.assertTrue(report.format()[-1].startswith('! '))
+
+    def test_shadowed_libraries(self):
+        shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1',
+                    self.second / 'libmakebelieve.so.0')
+
+        requester = Library()
+        requester.soname = 'requester.so'
+        requester.dyn_dependencies = {'libmakebelieve.so.0'}
+        requester.rpath = [self.first.as_posix()]
+        requester.runpath = [self.second.as_posix()]
+
+        libraries = LibrarySet([requester])
+        reports = shadowed_libraries(libraries)
+
+        self.assertEqual([report.soname for report in reports],
+                         ['libmakebelieve.so.0'])
+        self.assertEqual(shadowed_libraries(libraries, divergent_only=True),
+                         [])
@@ -0,0 +1,142 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from multiprocessing import get_context
+from pathlib import Path
+from unittest import mock
+from sotools.dl_cache import (
+    _SHARED_INDEXES,
+    cache_libraries,
+    query_cache,
+    search_cache,
+)
+from sotools.dl_cache.flags import Flags
+from sotools.dl_cache.shared import SharedCacheIndex, shared_memory
+
+HWCAPS_CACHE = f'{Path(__file__).parent}/assets/with_hwcaps.so.cache'
+FLAGS = Flags.FLAG_POWERPC_LIB64 | Flags.FLAG_ELF_LIBC6
+
+
+def _worker_lookup(args):
+    name, soname = args
+    index = SharedCacheIndex.attach(name=name)
+    try:
+        return index.lookup(soname, FLAGS)
+    finally:
+        index.close()
+
+
+class SharedIndexTest(unittest.TestCase):
+
+    def test_lookup_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'index')
+
+            with SharedCacheIndex.publish(HWCAPS_CACHE,
+                                          path=path,
+                                          hwcaps=['power9']) as index:
+                expected = cache_libraries(HWCAPS_CACHE, FLAGS, ['power9'])
+
+                self.assertEqual(len(expected), len(dict(index.items(FLAGS))))
+                for soname, value in expected.items():
+                    self.assertEqual(index.lookup(soname, FLAGS), value)
+
+                self.assertIsNone(index.lookup('notalib.so', FLAGS))
+                self.assertIsNone(
+                    index.lookup('libc.so.6', Flags.FLAG_SPARC_LIB64))
+                self.assertEqual(index.hwcaps, ('power9', ))
+                self.assertEqual(index.cache_file, HWCAPS_CACHE)
+
+                reader = SharedCacheIndex.attach(path=path)
+                self.assertEqual(reader.lookup('libc.so.6', FLAGS),
+                                 expected['libc.so.6'])
+                reader.close()
+
+            self.assertFalse(os.path.exists(path))
+
+    def test_install(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'index')
+            index = SharedCacheIndex.publish(HWCAPS_CACHE,
+                                             path=path,
+                                             hwcaps=[]).install()
+
+            self.assertIs(_SHARED_INDEXES[HWCAPS_CACHE], index)
+            self.assertEqual(search_cache('libc.so.6', HWCAPS_CACHE, FLAGS, []),
+                             '/lib64/libc.so.6')
+            self.assertTrue(cache_libraries(HWCAPS_CACHE, FLAGS, []))
+
+            index.unlink()
+            self.assertNotIn(HWCAPS_CACHE, _SHARED_INDEXES)
+
+    def test_query(self):
+        expected = query_cache('lib', HWCAPS_CACHE, FLAGS, [])
+        self.assertTrue(expected)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'index')
+            with SharedCacheIndex.publish(HWCAPS_CACHE, path=path,
+                                          hwcaps=[]) as index:
+                index.install()
+
+                with mock.patch.object(index, 'items',
+                                       wraps=index.items) as items:
+                    for _ in range(3):
+                        self.assertEqual(
+                            query_cache('lib', HWCAPS_CACHE, FLAGS, []),
+                            expected)
+                    self.assertEqual(
+                        query_cache('libc.*', HWCAPS_CACHE, FLAGS, []),
+                        {'libc.so.6': expected['libc.so.6']})
+
+                # Sorted once for the flags
+                items.assert_called_once_with(FLAGS)
+
+    def test_bad_data(self):
+        with self.assertRaises(Exception):
+            SharedCacheIndex(bytes(128))
+
+    @unittest.skipIf(shared_memory is None, "Shared memory not available")
+    def test_workers(self):
+        with SharedCacheIndex.publish(HWCAPS_CACHE,
+                                      hwcaps=['power9']) as index:
+            sonames = ['libc.so.6', 'libm.so.6', 'notalib.so']
+
+            with get_context('spawn').Pool(2) as pool:
+                results = pool.map(_worker_lookup,
+                                   [(index.name, soname) for soname in sonames])
+
+            self.assertEqual(results,
+                             [index.lookup(soname, FLAGS) for soname in sonames])
+            self.assertEqual(results[0],
+                             '/lib64/glibc-hwcaps/power9/libc-2.28.so')
+
+    @unittest.skipIf(shared_memory is None, "Shared memory not available")
+    def test_attach_publisher_tracker(self):
+        # Readers sharing the tracker of the publisher, in its process or a
+        # forked child, must leave its registration alone
+        script = '\n'.join([
+            'import sys',
+            'from multiprocessing import get_context',
+            'from sotools.dl_cache.shared import SharedCacheIndex',
+            'sys.path.insert(0, sys.argv[2])',
+            'from tests.test_shared_index import _worker_lookup',
+            'index = SharedCacheIndex.publish(sys.argv[1], hwcaps=[])',
+            'SharedCacheIndex.attach(name=index.name).close()',
+            'with get_context("fork").Pool(1) as pool:',
+            '    pool.map(_worker_lookup, [(index.name, "libc.so.6")])',
+            'index.unlink()',
+        ])
+        process = subprocess.run(
+            [sys.executable, '-c', script, HWCAPS_CACHE,
+             str(Path(__file__).parent.parent)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            timeout=60)
+
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertNotIn('KeyError', process.stderr)
+        self.assertNotIn('leaked', process.stderr)
@@ -0,0 +1,126 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from sotools import snapshot, validation
+from sotools.libraryset import Library, LibrarySet
+from sotools.linker import resolve
+
+from tests import ASSETS
+
+
+class SnapshotTest(unittest.TestCase):
+
+    @unittest.skipIf(not resolve('libm.so.6'), "No library to test with")
+    def test_roundtrip(self):
+        libset = LibrarySet.create_from(['libm.so.6'])
+
+        buffer = io.StringIO()
+        snapshot.dump(libset, buffer)
+        buffer.seek(0)
+
+        for validate in (False, True):
+            loaded = snapshot.loads(buffer.getvalue(), validate=validate)
+
+            self.assertSetEqual(loaded.sonames, libset.sonames)
+            self.assertTrue(loaded.complete)
+
+            for library in loaded:
+                original = libset.find(library.soname)
+                self.assertEqual(library, original)
+                self.assertEqual(library.binary_path, original.binary_path)
+                self.assertDictEqual(library.required_versions,
+                                     original.required_versions)
+                self.assertListEqual(library.needed, original.needed)
+                self.assertEqual(library.arch_flags, original.arch_flags)
+
+        self.assertSetEqual(snapshot.load(buffer).sonames, libset.sonames)
+
+    def test_validate(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "libmakebelieve.so.0")
+            shutil.copy(ASSETS / "libmakebelieve.so.0", path)
+
+            library = Library.from_path(path)
+            library.rpath = ["/recorded"]
+            data = snapshot.dumps(LibrarySet([library]))
+
+            loaded, = snapshot.loads(data, validate=True)
+            self.assertListEqual(loaded.rpath, ["/recorded"])
+
+            # A changed file is parsed again
+            os.utime(path, ns=(0, 0))
+            loaded, = snapshot.loads(data, validate=True)
+            self.assertListEqual(loaded.rpath, [])
+
+            # A missing file is left out
+            os.unlink(path)
+            self.assertFalse(snapshot.loads(data, validate=True))
+            self.assertEqual(len(snapshot.loads(data)), 1)
+
+    def test_validate_changed_before_dump(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "libmakebelieve.so.0")
+            shutil.copy(ASSETS / "libmakebelieve.so.0", path)
+
+            library = Library.from_path(path)
+            library.rpath = ["/recorded"]
+
+            # The file changes between its parsing and the dump
+            os.utime(path, ns=(0, 0))
+            data = snapshot.dumps(LibrarySet([library]))
+
+            loaded, = snapshot.loads(data, validate=True)
+            self.assertListEqual(loaded.rpath, [])
+
+            checked = validation.validate(snapshot.loads(data))
+            self.assertListEqual(checked.invalidated, [library.soname])
+
+    def test_validate_registers_copy(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "libmakebelieve.so.0")
+            shutil.copy(ASSETS / "libmakebelieve.so.0", path)
+            data = snapshot.dumps(LibrarySet([Library.from_path(path)]))
+
+            Library.clear_cache()
+            loaded, = snapshot.loads(data, validate=True)
+            loaded.dyn_dependencies.add('libinjected.so')
+            loaded.rpath.append('/injected')
+
+            # The parses reused from the snapshot are not altered
+            library = Library.from_path(path)
+            self.assertNotIn('libinjected.so', library.dyn_dependencies)
+            self.assertListEqual(library.rpath, [])
+
+    def test_bad_snapshot(self):
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.loads("{]")
+
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.loads('{"format": "sotools-snapshot", "version": 0}')
+
+        # Malformed entries
+        valid = json.loads(
+            snapshot.dumps(
+                LibrarySet([Library.from_path(ASSETS / "libmakebelieve.so.0")
+                            ])))
+        for entries in ([[0]], [[5, None, None, [], [], [], [], []]],
+                        [[0, None, None, [-1], [], [], [], []]], [None], 3):
+            document = dict(valid, libraries=entries)
+            with self.assertRaises(snapshot.SnapshotError):
+                snapshot.loads(json.dumps(document))
+
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.loads(json.dumps(dict(valid, strings=None)))
+
+    def test_version_1(self):
+        library = Library.from_path(ASSETS / "libmakebelieve.so.0")
+        document = json.loads(snapshot.dumps(LibrarySet([library])))
+        document['version'] = 1
+        document['libraries'] = [entry[:8] for entry in document['libraries']]
+
+        loaded, = snapshot.loads(json.dumps(document))
+        self.assertEqual(loaded, library)
+        self.assertIsNone(loaded.arch_flags)
@@ -0,0 +1,91 @@
+import struct
+import unittest
+from sotools.elf import ElfFormatError
+from sotools.libraryset import LibrarySet, Library
+from sotools.linker import resolve
+from sotools.symbols import (
+    Scope,
+    SymbolKey,
+    SymbolTable,
+    gnu_hash,
+    sysv_hash,
+)
+
+from tests import ASSETS
+
+
+class SymbolsTest(unittest.TestCase):
+
+    def test_hashes(self):
+        self.assertEqual(gnu_hash(b''), 5381)
+        self.assertEqual(gnu_hash(b'printf'), 0x156b2bb8)
+        self.assertEqual(sysv_hash(b''), 0)
+        self.assertEqual(sysv_hash(b'printf'), 0x077905a6)
+        # Overflows 32 bits before the high nibble is folded back
+        self.assertEqual(sysv_hash(b'\x01\xf0\xf0\xf0\xef\xff\xf0\xf1\xff'),
+                         0xf)
+
+    def test_table(self):
+        table = SymbolTable.load(ASSETS / "libmakebelieve.so.0")
+
+        self.assertTrue(table.defines(SymbolKey(b'symbol')))
+        self.assertFalse(table.defines(SymbolKey(b'symbol2')))
+        self.assertFalse(table.defines(SymbolKey(b'__cxa_finalize')))
+
+        # Weak references only
+        self.assertListEqual(list(table.undefined()), [])
+
+    def test_truncated_table(self):
+        table = SymbolTable.load(ASSETS / "libmakebelieve.so.0")
+        data = bytes(table._data)
+        table.close()
+
+        # The string table ends right after the name, without its NUL
+        end = data.index(b'\0symbol\0', table._strtab) + len(b'\0symbol')
+        table._data = data[:end]
+        self.assertFalse(table.defines(SymbolKey(b'symbol')))
+
+        # The symbol table itself is cut
+        table._data = data[:table._symtab + 1]
+        self.assertFalse(table.defines(SymbolKey(b'symbol')))
+
+    def test_empty_tables(self):
+        table = SymbolTable.load(ASSETS / "libmakebelieve.so.0")
+        table.close()
+
+        # nbuckets, symoffset, bloom_size, bloom_shift
+        for words in ((0, 1, 1, 6), (1, 1, 0, 6)):
+            table._data = struct.pack('<4I', *words) + bytes(64)
+            with self.assertRaises(ElfFormatError):
+                table._load_gnu_hash(0)
+
+        # nbuckets, nchains
+        table._data = struct.pack('<2I', 0, 1) + bytes(64)
+        with self.assertRaises(ElfFormatError):
+            table._load_sysv_hash(0)
+
+    def test_scope(self):
+        path = ASSETS / "libmakebelieve.so.0"
+
+        with Scope.from_paths([path, path]) as scope:
+            self.assertIs(scope.bind('symbol'), scope.tables[0])
+            self.assertIsNone(scope.bind('symbol2'))
+            self.assertDictEqual(scope.unresolved(), {})
+
+    @unittest.skipIf(not resolve('libm.so.6'), "No library to test with")
+    def test_unresolved(self):
+        libm = Library.from_path(resolve('libm.so.6'))
+        unresolved = LibrarySet([libm]).unresolved_symbols()
+
+        self.assertIn('libm.so.6', unresolved)
+
+        libset = LibrarySet([libm]).resolve()
+        self.assertDictEqual(libset.unresolved_symbols(), {})
+
+    @unittest.skipIf(not resolve('libm.so.6'), "No library to test with")
+    def test_load_order(self):
+        libset = LibrarySet.create_from(['libm.so.6'])
+        order = [lib.soname for lib in libset.load_order]
+
+        self.assertEqual(order[0], 'libm.so.6')
+        self.assertSetEqual(set(order), libset.sonames)
@@ -1,10 +1,20 @@
 from pathlib import Path
+import io
+import json
 import unittest
 from shutil import which
-from sotools import is_elf, library_links
-from sotools.ldd import ldd
+from sotools import is_elf, library_links, library_set_links
+from sotools.ldd import (
+    ORDERS,
+    NotELFError,
+    iter_ldd,
+    ldd,
+    ldd_entries,
+    write_entries,
+)
 from sotools.libraryset import LibrarySet, Library
 from sotools.linker import resolve
+from tests import ASSETS
 
 
 class ToolsTest(unittest.TestCase):
@@ -15,6 +25,58 @@ class ToolsTest(unittest.TestCase):
         libraries = ldd(ls_bin)
 
         self.assertIn('libc.so.6', libraries.sonames)
+        self.assertNotIn('ls', libraries.sonames)
+
+    @unittest.skipIf(not which('ls'), "No binary to test with")
+    def test_iter_ldd(self):
+        ls_bin = which('ls')
+        libraries = list(iter_ldd(ls_bin))
+
+        self.assertSetEqual({lib.soname for lib in libraries},
+                            ldd(ls_bin).sonames)
+        self.assertEqual(len(libraries), len(ldd(ls_bin)))
+
+        with self.assertRaises(NotELFError):
+            iter_ldd(ASSETS / "make-believe.c")
+
+    @unittest.skipIf(not which('ls'), "No binary to test with")
+    def test_ldd_entries(self):
+        ls_bin = which('ls')
+        expected = {lib.soname: lib.binary_path for lib in ldd(ls_bin)}
+
+        for order in ORDERS:
+            entries = list(ldd_entries(ls_bin, order))
+            self.assertDictEqual(dict(entries), expected)
+
+        sorted_entries = list(ldd_entries(ls_bin, 'sorted'))
+        self.assertListEqual(sorted_entries, sorted(sorted_entries))
+
+        with self.assertRaises(NotELFError):
+            ldd_entries(ASSETS / "make-believe.c")
+
+        with self.assertRaises(ValueError):
+            ldd_entries(ls_bin, 'random')
+
+    def test_write_entries(self):
+        entries = [('libc.so.6', '/lib/libc.so.6'), ('libdummy.so.1', None)]
+
+        stream = io.StringIO()
+        self.assertEqual(write_entries(entries, stream), 1)
+        self.assertEqual(
+            stream.getvalue(), "\tlibc.so.6 => /lib/libc.so.6\n"
+            "\tlibdummy.so.1 => not found\n")
+
+        stream = io.StringIO()
+        write_entries(entries, stream, 'json')
+        self.assertListEqual(
+            [json.loads(line) for line in stream.getvalue().splitlines()], [
+                dict(soname='libc.so.6', path='/lib/libc.so.6'),
+                dict(soname='libdummy.so.1', path=None),
+            ])
+
+        stream = io.StringIO()
+        write_entries(entries, stream, 'null')
+        self.assertEqual(stream.getvalue(), "/lib/libc.so.6\0")
 
     @unittest.skipIf(not resolve('libm.so.6'), "No library to test with")
     def test_library_links(self):
@@ -32,3 +94,23 @@ class ToolsTest(unittest.TestCase):
         self.assertFalse(is_elf('/proc/meminfo'))
         self.assertFalse(is_elf('/'))
         self.assertTrue(is_elf(resolve('libm.so.6')))
+
+    def test_library_links_assets(self):
+        target = Library.from_path(ASSETS / "libmakebelieve.so.0")
+
+        self.assertSetEqual(library_links(target), {
+            ASSETS / "libmakebelieve.so.0",
+            ASSETS / "libmakebelieve.so.0.0",
+            ASSETS / "libmakebelieve.so.0.0.1",
+        })
+
+    @unittest.skipIf(not resolve('libm.so.6'), "No library to test with")
+    def test_library_set_links(self):
+        libset = LibrarySet.create_from(['libm.so.6'])
+        libset.add(Library.from_path(ASSETS / "libmakebelieve.so.0.0"))
+
+        links = library_set_links(libset)
+
+        self.assertSetEqual(set(links), set(libset))
+        for library, paths in links.items():
+            self.assertSetEqual(paths, library_links(library))
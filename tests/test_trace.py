@@ -0,0 +1,69 @@
+import json
+import unittest
+from io import StringIO
+from sotools.linker import resolve
+from sotools.trace import (
+    TRACER,
+    Found,
+    NotFound,
+    Probe,
+    SearchPath,
+    SearchStart,
+    StreamSink,
+    json_format,
+    libs_format,
+)
+
+from tests import ASSETS
+
+
+class TraceTest(unittest.TestCase):
+
+    def test_disabled(self):
+        self.assertFalse(TRACER.enabled)
+
+        with TRACER.capture() as events:
+            self.assertTrue(TRACER.enabled)
+
+        self.assertFalse(TRACER.enabled)
+        self.assertEqual(events, [])
+
+    def test_resolve_events(self):
+        with TRACER.capture() as events:
+            resolve("libmakebelieve.so.0", rpath=[ASSETS.as_posix()])
+
+        self.assertEqual(events[0], SearchStart("libmakebelieve.so.0"))
+        self.assertEqual(events[1],
+                         SearchPath((ASSETS.as_posix(), ), 'RPATH'))
+        self.assertIn(Probe((ASSETS / "libmakebelieve.so.0").as_posix()),
+                      events)
+        self.assertEqual(
+            events[-1],
+            Found("libmakebelieve.so.0",
+                  (ASSETS / "libmakebelieve.so.0").as_posix()))
+
+    def test_resolve_not_found(self):
+        with TRACER.capture() as events:
+            resolve("libnotalib.so.0")
+
+        self.assertEqual(events[-1], NotFound("libnotalib.so.0"))
+
+    def test_formats(self):
+        event = Probe("/lib/libc.so.6")
+
+        self.assertTrue(
+            libs_format(event, pid=1).endswith("\t  trying file=/lib/libc.so.6"))
+        self.assertEqual(json.loads(json_format(event)), {
+            'event': 'Probe',
+            'path': '/lib/libc.so.6'
+        })
+
+        stream = StringIO()
+        sink = TRACER.add_sink(StreamSink(stream, 'json'))
+        try:
+            resolve("libmakebelieve.so.0", rpath=[ASSETS.as_posix()])
+        finally:
+            TRACER.remove_sink(sink)
+
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(json.loads(lines[0])['event'], 'SearchStart')
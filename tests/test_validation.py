@@ -0,0 +1,119 @@
+import os
+import shutil
+import unittest
+from pathlib import Path
+from sotools.dl_cache.flags import Flags
+from sotools.hwcaps import HWCAPS_DIRECTORY, supported_hwcaps
+from sotools.libraryset import Library, LibrarySet
+from sotools.validation import search_directories, stat_all, validate
+
+from tests import ASSETS, SearchPathTestCase
+
+
+def _touch(path: Path):
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+class ValidationTest(SearchPathTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1',
+                    self.second / 'libmakebelieve.so.0')
+
+        tool = Library()
+        tool.soname = 'tool'
+        tool.dyn_dependencies = {'libmakebelieve.so.0'}
+        tool.rpath = [self.first.as_posix(), self.second.as_posix()]
+        self.libraries = LibrarySet([tool]).resolve()
+
+    def test_unchanged(self):
+        checked = validate(self.libraries, jobs=4)
+
+        self.assertListEqual(checked.invalidated, [])
+        self.assertFalse(checked.delta)
+        self.assertIs(checked.libraries, self.libraries)
+        self.assertIn(self.first.as_posix(), checked.directories)
+
+        checked = validate(self.libraries, checked.directories)
+        self.assertListEqual(checked.invalidated, [])
+
+    def test_changed_file(self):
+        _touch(self.second / 'libmakebelieve.so.0')
+
+        checked = validate(self.libraries)
+        self.assertListEqual(checked.invalidated, ['libmakebelieve.so.0'])
+        self.assertFalse(checked.delta)
+        self.assertSetEqual(checked.libraries.sonames,
+                            self.libraries.sonames)
+
+        self.assertListEqual(validate(checked.libraries).invalidated, [])
+
+    def test_removed_file(self):
+        (self.second / 'libmakebelieve.so.0').unlink()
+
+        # The libraries needed by the removed one only are left out
+        checked = validate(self.libraries)
+        self.assertIn('libmakebelieve.so.0', checked.delta.removed)
+        self.assertSetEqual(checked.libraries.sonames, {'tool'})
+        self.assertSetEqual(checked.libraries.missing_libraries,
+                            {'libmakebelieve.so.0'})
+
+    def test_shadowing_file(self):
+        baseline = validate(self.libraries).directories
+        shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1',
+                    self.first / 'libmakebelieve.so.0')
+
+        # Without a baseline, new files in the search path are not seen
+        self.assertListEqual(validate(self.libraries).invalidated, [])
+
+        # Every soname found after the changed directory is looked up again
+        checked = validate(self.libraries, baseline)
+        self.assertIn('libmakebelieve.so.0', checked.invalidated)
+        self.assertListEqual(
+            [change.new for change in checked.delta.path_changed],
+            [(self.first / 'libmakebelieve.so.0').as_posix()])
+
+    def test_search_directories(self):
+        order = search_directories(self.libraries,
+                                   cache_file='/cache',
+                                   hwcaps=['x86-64-v3'])
+        subdirectory = (self.first / HWCAPS_DIRECTORY / 'x86-64-v3').as_posix()
+
+        self.assertLess(order.index(subdirectory),
+                        order.index(self.first.as_posix()))
+        self.assertLess(order.index(self.second.as_posix()),
+                        order.index('/cache'))
+        self.assertLess(order.index('/cache'), order.index('/usr/lib'))
+
+        # The system directories of the architecture of the set
+        for library in self.libraries:
+            library.arch_flags = Flags.FLAG_X8664_LIB64 | Flags.FLAG_ELF_LIBC6
+        self.assertIn('/usr/lib/x86_64-linux-gnu',
+                      search_directories(self.libraries, hwcaps=[]))
+
+    @unittest.skipIf(not supported_hwcaps(), "No supported glibc-hwcaps")
+    def test_hwcaps_file(self):
+        hwcaps = self.second / HWCAPS_DIRECTORY / supported_hwcaps()[0]
+        hwcaps.mkdir(parents=True)
+        baseline = validate(self.libraries).directories
+
+        # The subdirectory changes, not its parents
+        shutil.copy(ASSETS / 'libmakebelieve.so.0.0.1',
+                    hwcaps / 'libmakebelieve.so.0')
+
+        checked = validate(self.libraries, baseline)
+        self.assertIn('libmakebelieve.so.0', checked.invalidated)
+        self.assertListEqual(
+            [change.new for change in checked.delta.path_changed],
+            [(hwcaps / 'libmakebelieve.so.0').as_posix()])
+
+    def test_stat_all(self):
+        paths = [ASSETS.as_posix(), '/nonexistent', ASSETS.as_posix()]
+
+        stats = stat_all(paths, jobs=None)
+        self.assertListEqual(list(stats), paths[:2])
+        self.assertIsNone(stats['/nonexistent'])
+        self.assertEqual(stats[ASSETS.as_posix()], os.stat(ASSETS))